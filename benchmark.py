@@ -0,0 +1,564 @@
+import contextlib
+import logging
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+import model
+from model.building_blocks import IndexedInventory
+from model.building_blocks import Inventory
+from model.building_blocks import ResourceFactory
+
+
+def time_it(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def benchmark_topology():
+    """Compare the numpy topology generator with the original python loop generator"""
+
+    print("\nTopology generation (seconds)")
+    print("{0:>12} {1:>10} {2:>10} {3:>8}".format("size", "python", "numpy", "speedup"))
+
+    for size in (50, 100, 200, 400):
+        world = model.WorldMap("Benchmark", size, size, seed=1)
+        python_time, result = time_it(world.generate_topology_python)
+        numpy_time, result = time_it(world.generate_topology)
+        print("{0:>12} {1:>10.3f} {2:>10.3f} {3:>7.1f}x".format("{0}x{0}".format(size),
+                                                                python_time,
+                                                                numpy_time,
+                                                                python_time / numpy_time))
+
+    # The python generator is far too slow for big maps so only time the numpy one
+    for size in (1000, 2000):
+        generator = model.TopologyGenerator(size, size, seed=1)
+        numpy_time, result = time_it(generator.generate)
+        print("{0:>12} {1:>10} {2:>10.3f}".format("{0}x{0}".format(size), "-", numpy_time))
+
+
+def benchmark_world_file():
+    """Compare saving and loading worlds as pickles and as memory mapped world files"""
+
+    print("\nWorld save/load (seconds)")
+    print("{0:>12} {1:>12} {2:>12} {3:>12} {4:>12}".format("size", "pickle save", "pickle load", "kmap save",
+                                                          "kmap load"))
+
+    temp_dir = tempfile.mkdtemp()
+
+    for size in (100, 500, 1000, 2000):
+        world = model.WorldMap("Benchmark", size, size, seed=1)
+        world.initialise()
+
+        pickle_file_name = os.path.join(temp_dir, "benchmark.world")
+        world_file_name = os.path.join(temp_dir, "benchmark.kmap")
+
+        def pickle_save():
+            with open(pickle_file_name, "wb") as pickle_file:
+                pickle.dump(world, pickle_file)
+
+        def pickle_load():
+            with open(pickle_file_name, "rb") as pickle_file:
+                return pickle.load(pickle_file)
+
+        pickle_save_time, result = time_it(pickle_save)
+        pickle_load_time, result = time_it(pickle_load)
+        save_time, result = time_it(model.world_file.save_world, world, world_file_name)
+        load_time, result = time_it(model.world_file.load_world, world_file_name)
+
+        print("{0:>12} {1:>12.4f} {2:>12.4f} {3:>12.4f} {4:>12.4f}".format("{0}x{0}".format(size),
+                                                                         pickle_save_time,
+                                                                         pickle_load_time,
+                                                                         save_time,
+                                                                         load_time))
+
+
+def benchmark_snapshot():
+    """Time taking and writing snapshots of games with lots of creations"""
+
+    print("\nGame snapshot (seconds)")
+    print("{0:>12} {1:>10} {2:>10} {3:>10}".format("creations", "take", "write", "restore"))
+
+    temp_dir = tempfile.mkdtemp()
+    file_name = os.path.join(temp_dir, "benchmark" + model.snapshot.FILE_EXTENSION)
+
+    game = model.Game("Benchmark", 1000, 1000)
+    game.initialise()
+
+    for count in (1000, 10000, 100000):
+
+        game.clear_creations()
+        slots = numpy.arange(count)
+        game.put_creations(slots % len(game.creations.templates), slots % 1000, slots // 1000, 0)
+
+        take_time, snapshot = time_it(model.snapshot.take_snapshot, game)
+        write_time, result = time_it(model.snapshot.write_snapshot, snapshot, file_name)
+        restore_time, result = time_it(model.snapshot.restore_snapshot, game, snapshot)
+
+        print("{0:>12} {1:>10.4f} {2:>10.4f} {3:>10.4f}".format(count, take_time, write_time, restore_time))
+
+
+def benchmark_pathfinding():
+    """Count how many paths per second can be found between random points on a 500x500 map"""
+
+    print("\nPathfinding on 500x500 maps")
+
+    world = model.WorldMap("Benchmark", 500, 500, seed=1)
+    world.initialise()
+
+    build_time, pathfinder = time_it(model.PathFinder, world)
+    print("{0:>30} {1:>10.3f}s".format("build costs", build_time))
+
+    random.seed(1)
+    passable = [(x, y) for x in range(0, 500) for y in range(0, 500) if pathfinder.is_passable(x, y)]
+
+    for distance in (10, 50, 200):
+
+        # Pick pairs of passable points about the right distance apart
+        pairs = []
+        while len(pairs) < 50:
+            x, y = random.choice(passable)
+            tx = x + random.randint(-distance, distance)
+            ty = y + random.randint(-distance, distance)
+            if 0 <= tx < 500 and 0 <= ty < 500 and pathfinder.is_passable(tx, ty):
+                pairs.append(((x, y), (tx, ty)))
+
+        def find_paths():
+            return [pathfinder.find_path(x, y, tx, ty) for (x, y), (tx, ty) in pairs]
+
+        search_time, paths = time_it(find_paths)
+        found = len([path for path in paths if path is not None])
+        print("{0:>30} {1:>10.1f} paths/sec ({2} of {3} found)".format(
+            "A* within {0} hexagons".format(distance), len(pairs) / search_time, found, len(pairs)))
+
+    # Lots of journeys to the same place share one flow field
+    target_x, target_y = random.choice(passable)
+    flow_time, flow_field = time_it(pathfinder.get_flow_field, target_x, target_y)
+    print("{0:>30} {1:>10.3f}s".format("build flow field", flow_time))
+
+    starts = random.sample(passable, 1000)
+
+    def follow_paths():
+        return [pathfinder.find_path(x, y, target_x, target_y) for x, y in starts]
+
+    follow_time, paths = time_it(follow_paths)
+    print("{0:>30} {1:>10.1f} paths/sec".format("cached flow field", len(starts) / follow_time))
+
+
+def benchmark_creations():
+    """Compare placing creations as deep copied Creatables with placing them in a CreationStore"""
+
+    print("\nPlacing creations")
+    print("{0:>12} {1:>12} {2:>12} {3:>12} {4:>14} {5:>14}".format("creations", "copy time", "store time",
+                                                                  "bulk time", "copy bytes", "store bytes"))
+
+    creatables = model.building_blocks.CreatableFactoryXML(os.path.join(model.Game.GAME_DATA_DIR, "creatables.xml"))
+    creatables.load()
+    names = creatables.names
+
+    for count in (1000, 10000, 100000):
+
+        def place_copies():
+            creations = {}
+            for i in range(0, count):
+                creations[(i % 1000, i // 1000)] = creatables.get_creatable_copy(names[i % len(names)])
+            return creations
+
+        def place_in_store():
+            store = model.CreationStore(creatables.templates)
+            for i in range(0, count):
+                store.add(i % len(names), i % 1000, i // 1000)
+            return store
+
+        def place_in_store_bulk():
+            store = model.CreationStore(creatables.templates)
+            slots = numpy.arange(count)
+            store.add_many(slots % len(names), slots % 1000, slots // 1000, 0)
+            return store
+
+        tracemalloc.start()
+        copy_time, creations = time_it(place_copies)
+        copy_bytes = tracemalloc.get_traced_memory()[0]
+        del creations
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        store_time, store = time_it(place_in_store)
+        store_bytes = tracemalloc.get_traced_memory()[0]
+        del store
+        tracemalloc.stop()
+
+        bulk_time, store = time_it(place_in_store_bulk)
+
+        print("{0:>12} {1:>12.4f} {2:>12.4f} {3:>12.4f} {4:>14} {5:>14}".format(count, copy_time, store_time,
+                                                                              bulk_time, copy_bytes // count,
+                                                                              store_bytes // count))
+
+
+def benchmark_tick():
+    """Compare ticking creations one at a time with ticking them all in one batch"""
+
+    print("\nGame tick (seconds per tick)")
+    print("{0:>12} {1:>12} {2:>12} {3:>12}".format("creations", "one by one", "batch", "all complete"))
+
+    game = model.Game("Benchmark", 1000, 1000)
+    game.initialise()
+    game.start()
+
+    for count in (1000, 10000, 100000):
+
+        def put_creations():
+            game.clear_creations()
+            slots = numpy.arange(count)
+            game.put_creations(slots % len(game.creations.templates), slots % 1000, slots // 1000, 0)
+
+        def tick_one_by_one():
+            for creation in game.creations.values():
+                creation.tick()
+                if game.inventory.is_creatable(creation):
+                    creation.tick()
+
+        put_creations()
+        one_by_one_time, result = time_it(tick_one_by_one)
+
+        put_creations()
+        batch_time, result = time_it(game.tick)
+
+        # Once everything is complete a tick should cost next to nothing
+        for slot in game.creations.get_live_slots().tolist():
+            game.creations.set_ticks_done(slot, game.creations.ticks_required[game.creations.type_ids[slot]])
+        complete_time, result = time_it(game.tick)
+
+        print("{0:>12} {1:>12.4f} {2:>12.4f} {3:>12.4f}".format(count, one_by_one_time, batch_time, complete_time))
+
+
+def benchmark_production():
+    """Time game ticks with lots of completed buildings producing resources"""
+
+    print("\nProduction (ticks per second)")
+    print("{0:>12} {1:>12} {2:>16}".format("producers", "ticks/sec", "resources/tick"))
+
+    game = model.Game("Benchmark", 1000, 1000)
+    game.initialise()
+    game.start()
+
+    producer_type_ids = [type_id for type_id in range(len(game.creations.templates))
+                         if game.production.is_producer_type(type_id)]
+
+    for count in (1000, 10000, 100000):
+
+        game.clear_creations()
+        slots = numpy.arange(count)
+        type_ids = numpy.array(producer_type_ids)[slots % len(producer_type_ids)]
+        game.put_creations(type_ids, slots % 1000, slots // 1000, game.creations.ticks_required[type_ids],
+                           is_restored=True)
+
+        total_before = sum(game.inventory.resources.values())
+
+        ticks = 100
+        tick_time, result = time_it(lambda: [game.tick() for i in range(ticks)])
+
+        produced = sum(game.inventory.resources.values()) - total_before
+
+        print("{0:>12} {1:>12.1f} {2:>16.1f}".format(count, ticks / tick_time, produced / ticks))
+
+
+def benchmark_inventory():
+    """Compare checking and debiting pre-requisites with the dictionary Inventory and the IndexedInventory"""
+
+    print("\nInventory (seconds for 100,000 checks and debits)")
+    print("{0:>20} {1:>12} {2:>12} {3:>12}".format("inventory", "is_creatable", "are_creatable", "debit"))
+
+    game = model.Game("Benchmark", 100, 100)
+    game.initialise()
+
+    templates = game.creations.templates
+    repeats = 100000 // len(templates)
+
+    for inventory in (Inventory(), IndexedInventory()):
+
+        for resource_name in ResourceFactory.get_resource_types():
+            inventory.add_resource(ResourceFactory.get_resource(resource_name), 10 ** 9)
+
+        def check():
+            for i in range(repeats):
+                for template in templates:
+                    inventory.is_creatable(template)
+
+        def debit():
+            for i in range(repeats):
+                for template in templates:
+                    inventory.assign_resources(template, Inventory.CHANGE_DEBIT)
+
+        def check_all():
+            for i in range(repeats):
+                inventory.are_creatable(templates)
+
+        check_time, result = time_it(check)
+        check_all_time, result = time_it(check_all)
+
+        # The dictionary Inventory prints what each debit uses so send that somewhere else
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            debit_time, result = time_it(debit)
+
+        print("{0:>20} {1:>12.4f} {2:>12.4f} {3:>12.4f}".format(type(inventory).__name__, check_time, check_all_time,
+                                                               debit_time))
+
+
+def benchmark_bulk_build():
+    """Compare adding creations one at a time with adding them as one batch"""
+
+    print("\nBuilding creations (seconds)")
+    print("{0:>12} {1:>12} {2:>12}".format("creations", "one by one", "bulk"))
+
+    game = model.Game("Benchmark", 1000, 1000)
+    game.initialise()
+
+    for count in (1000, 10000):
+
+        positions = [(x, y) for x in range(1000) for y in range(1000)
+                     if game.map.get(x, y) == model.WorldMap.TILE_GRASS][:count]
+        new_creations = [(model.WorldMap.STRUCTURE_SMALL_HOUSE, x, y) for x, y in positions]
+
+        def add_one_by_one():
+            for name, x, y in new_creations:
+                game.add_creation_by_name(name, x, y)
+
+        # Both ways print what they do so send that somewhere else
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            game.clear_creations()
+            one_by_one_time, result = time_it(add_one_by_one)
+
+            game.clear_creations()
+            bulk_time, result = time_it(game.add_creations_bulk, new_creations)
+
+        print("{0:>12} {1:>12.4f} {2:>12.4f}".format(count, one_by_one_time, bulk_time))
+
+
+def benchmark_catalogue():
+    """Compare parsing a big creatables file with loading it from the catalogue cache"""
+
+    print("\nCreatables catalogue (seconds)")
+    print("{0:>12} {1:>12} {2:>12}".format("creatables", "parse", "cache"))
+
+    for count in (100, 1000, 10000):
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            file_name = os.path.join(directory, "creatables.xml")
+            with open(file_name, "w") as xml_file:
+                xml_file.write("<creatables>\n")
+                for i in range(count):
+                    xml_file.write("<creatable><name>Creatable {0}</name><description>Creatable number {0}</description>"
+                                   "<ticks_required>{1}</ticks_required>"
+                                   "<pre_requisites><resource><name>Wood</name><count>4</count></resource>"
+                                   "<resource><name>Nails</name><count>10</count></resource></pre_requisites>"
+                                   "<outputs><resource><name>XP</name><count>2</count></resource></outputs>"
+                                   "</creatable>\n".format(i, i % 20 + 1))
+                xml_file.write("</creatables>\n")
+
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                parse_time, result = time_it(model.CreatableFactoryXML(file_name, use_cache=False).load)
+
+                # The first load writes the cache and the second one reads it
+                model.CreatableFactoryXML(file_name).load()
+                cache_time, result = time_it(model.CreatableFactoryXML(file_name).load)
+
+        print("{0:>12} {1:>12.4f} {2:>12.4f}".format(count, parse_time, cache_time))
+
+
+class BenchmarkSum(model.DerivedStat):
+    """A derived stat that adds up its dependencies and counts how often it is calculated"""
+
+    calculations = 0
+
+    def __init__(self, name: str, dependency_names: list, owner: int = 0):
+        super(BenchmarkSum, self).__init__(name, "BENCHMARK")
+
+        self.owner = owner
+
+        self.dependency_names = dependency_names
+        for dependency_name in dependency_names:
+            self.add_dependency(dependency_name)
+
+    def calculate(self):
+        BenchmarkSum.calculations += 1
+        return sum(self.get_dependency_value(dependency_name) for dependency_name in self.dependency_names)
+
+
+def benchmark_stats():
+    """Compare pushing stat changes to listeners with recalculating dirty stats in dependency order"""
+
+    print("\nStat propagation (seconds for 10 updates)")
+    print("{0:>12} {1:>14} {2:>14} {3:>14} {4:>14}".format("diamonds", "immediate", "calculations",
+                                                          "topological", "calculations"))
+
+    for width in (10, 100, 500):
+
+        results = []
+
+        for propagation in (model.StatEngine.PROPAGATE_IMMEDIATE, model.StatEngine.PROPAGATE_TOPOLOGICAL):
+
+            # One input feeding a layer of width stats that all feed one total stat
+            engine = model.StatEngine("Benchmark", propagation)
+            engine.add_stat(model.CoreStat("Input", "BENCHMARK", 0))
+            for i in range(width):
+                engine.add_stat(BenchmarkSum("Middle {0}".format(i), ["Input"]))
+            engine.add_stat(BenchmarkSum("Total", ["Middle {0}".format(i) for i in range(width)]))
+
+            def update():
+                for i in range(10):
+                    engine.update_stat("Input", i)
+
+            BenchmarkSum.calculations = 0
+            update_time, result = time_it(update)
+            results.extend((update_time, BenchmarkSum.calculations))
+
+        print("{0:>12} {1:>14.4f} {2:>14} {3:>14.4f} {4:>14}".format(width, *results))
+
+    print("\nBatched stat updates (seconds for 10 updates of 7 inputs)")
+    print("{0:>12} {1:>14} {2:>14} {3:>14} {4:>14}".format("width", "one by one", "batch", "recalculations",
+                                                          "saved"))
+
+    for width in (10, 100, 500):
+
+        # Seven inputs that all feed a layer of width stats that all feed one total stat
+        engine = model.StatEngine("Benchmark", model.StatEngine.PROPAGATE_TOPOLOGICAL)
+        input_names = ["Input {0}".format(i) for i in range(7)]
+        for input_name in input_names:
+            engine.add_stat(model.CoreStat(input_name, "BENCHMARK", 0))
+        for i in range(width):
+            engine.add_stat(BenchmarkSum("Middle {0}".format(i), input_names))
+        engine.add_stat(BenchmarkSum("Total", ["Middle {0}".format(i) for i in range(width)]))
+
+        def update_one_by_one():
+            for i in range(10):
+                for input_name in input_names:
+                    engine.update_stat(input_name, i)
+
+        def update_batch():
+            for i in range(10):
+                engine.update_stats({input_name: i for input_name in input_names})
+
+        one_by_one_time, result = time_it(update_one_by_one)
+
+        engine.reset_counters()
+        batch_time, result = time_it(update_batch)
+
+        print("{0:>12} {1:>14.4f} {2:>14.4f} {3:>14} {4:>14}".format(width, one_by_one_time, batch_time,
+                                                                      engine.recalculation_count,
+                                                                      engine.saved_recalculation_count))
+
+    print("\nLean stats (seconds)")
+    print("{0:>12} {1:>14} {2:>14} {3:>14} {4:>14}".format("stats", "add", "lean add", "update",
+                                                          "lean update"))
+
+    for count in (1000, 10000, 100000):
+
+        results = []
+
+        for is_lean in (False, True):
+
+            engine = model.StatEngine("Benchmark", model.StatEngine.PROPAGATE_TOPOLOGICAL, lean=is_lean)
+            engine.add_stat(model.CoreStat("Input", "BENCHMARK", 0))
+            engine.add_stat(BenchmarkSum("Derived", ["Input"]))
+
+            def add():
+                for i in range(count):
+                    engine.add_stat(model.CoreStat("Input {0}".format(i), "BENCHMARK", 0))
+
+            def update():
+                for i in range(count):
+                    engine.update_stat("Input", i)
+
+            add_time, result = time_it(add)
+            update_time, result = time_it(update)
+            results.append((add_time, update_time))
+
+        print("{0:>12} {1:>14.4f} {2:>14.4f} {3:>14.4f} {4:>14.4f}".format(count, results[0][0], results[1][0],
+                                                                          results[0][1], results[1][1]))
+
+    print("\nStat indexes (seconds to load pairs of stats with 100 owners and remove one owner's stats)")
+    print("{0:>12} {1:>14} {2:>14} {3:>14} {4:>14}".format("stats", "immediate", "remove",
+                                                          "topological", "remove"))
+
+    for count in (1000, 10000, 100000):
+
+        results = []
+
+        for propagation in (model.StatEngine.PROPAGATE_IMMEDIATE, model.StatEngine.PROPAGATE_TOPOLOGICAL):
+
+            engine = model.StatEngine("Benchmark", propagation, lean=True)
+
+            stats = []
+            for i in range(count // 2):
+                stats.append(model.CoreStat("Input {0}".format(i), "BENCHMARK", i, owner=i % 100))
+                stats.append(BenchmarkSum("Derived {0}".format(i), ["Input {0}".format(i)], owner=i % 100))
+
+            load_time, result = time_it(engine.load_stats, stats)
+            remove_time, result = time_it(engine.remove_stats_by_owner, 0)
+            results.extend((load_time, remove_time))
+
+        print("{0:>12} {1:>14.4f} {2:>14.4f} {3:>14.4f} {4:>14.4f}".format(count, *results))
+
+    print("\nStat expiry (seconds for 100 ticks with 1000 stats expiring)")
+    print("{0:>12} {1:>14} {2:>14}".format("stats", "tick", "stats left"))
+
+    for count in (1000, 10000, 100000):
+
+        engine = model.StatEngine("Benchmark", model.StatEngine.PROPAGATE_TOPOLOGICAL, lean=True)
+        engine.load_stats([model.CoreStat("Evergreen {0}".format(i), "BENCHMARK", i) for i in range(count)])
+        engine.load_stats([model.CoreStat("Buff {0}".format(i), "BENCHMARK", i, lifetime=i % 100 + 1)
+                           for i in range(1000)])
+
+        def tick():
+            for i in range(100):
+                engine.tick()
+
+        tick_time, result = time_it(tick)
+
+        print("{0:>12} {1:>14.4f} {2:>14}".format(count, tick_time, len(engine.get_stat_names())))
+
+
+BENCHMARKS = {
+    "topology": benchmark_topology,
+    "world_file": benchmark_world_file,
+    "snapshot": benchmark_snapshot,
+    "pathfinding": benchmark_pathfinding,
+    "creations": benchmark_creations,
+    "tick": benchmark_tick,
+    "production": benchmark_production,
+    "inventory": benchmark_inventory,
+    "bulk_build": benchmark_bulk_build,
+    "catalogue": benchmark_catalogue,
+    "stats": benchmark_stats,
+}
+
+
+def main():
+
+    logging.basicConfig(level=logging.WARN)
+
+    names = sys.argv[1:]
+    if len(names) == 0:
+        names = list(BENCHMARKS.keys())
+
+    for name in names:
+        if name not in BENCHMARKS.keys():
+            print("Unknown benchmark {0} - choose from {1}".format(name, list(BENCHMARKS.keys())))
+            continue
+        BENCHMARKS[name]()
+
+    return
+
+
+if __name__ == "__main__":
+    main()
+    exit(0)
@@ -4,10 +4,32 @@
     - CoreStat - a core stat that auto updates listeners when its value changes
     - DerivedStat - a stat derived from other stats
     - StatEngine - the container for all of the stats and manages stat listeners
+
+    A StatEngine can propagate changes in two ways:
+    - PROPAGATE_IMMEDIATE - a stat pushes every change to its listeners straight away
+    - PROPAGATE_TOPOLOGICAL - a change marks the stats that depend on it as dirty and then every dirty derived
+      stat is recalculated exactly once in dependency order
+
+    Changes made inside a StatEngine.batch() are not passed on until the batch ends.
+
+    Stats with a lifetime are scheduled to expire on the engine tick that their lifetime runs out so
+    StatEngine.tick() only looks at the stats that are expiring and not at every stat in the engine.
+
+    A StatEngine indexes its stats by category and owner and by the names of the stats that they depend on
+    so finding the stats of a category or owner, or the stats that depend on a new stat, doesn't look at
+    every stat in the engine.
+
+    Stats are time stamped when they are added to a StatEngine with the engine's clock. In lean mode, which a
+    StatEngine turns on with lean=True, the clock is the engine's count of ticks rather than the wall clock and
+    the engine and its stats only format debug and info messages if the logging level that was set when the
+    engine was made would show them.
+    Lean mode only changes the engine that turns it on and the stats in that engine.
 '''
 
+import contextlib
 import logging
 import datetime
+import time
 
 '''
 The basic details of a stat
@@ -17,6 +39,9 @@ class BaseStat(object):
     EVERGREEN = -1
     DEAD = 0
 
+    __slots__ = ("name", "category", "description", "_value", "_old_value", "owner", "_lifetime",
+                 "create_time", "update_time", "_clock", "_log_debug", "_log_info")
+
     # Initiation of BaseStat, and parameters
     def __init__(self, name: str, category: str, value: float,
                  description : str = "", owner:int = 0, lifetime: int = EVERGREEN):
@@ -27,8 +52,14 @@ class BaseStat(object):
         self._old_value = value
         self.owner = owner
         self._lifetime = lifetime
-        self.create_time = datetime.datetime.now()
-        self.update_time = datetime.datetime.now()
+        # Stats are time stamped by the clock of the StatEngine that they are added to, or else the wall clock,
+        # so making a stat doesn't read a clock
+        self.create_time = self.update_time = None
+        self._clock = datetime.datetime.now
+
+        # Whether to log debug and info messages - always True unless a lean StatEngine has checked the logging level
+        self._log_debug = True
+        self._log_info = True
 
     # convert to string
     def __str__(self):
@@ -48,7 +79,7 @@ class BaseStat(object):
     def value(self, new_value: float):
         self._old_value = self._value
         self._value = (new_value)
-        self.update_time = datetime.datetime.now()
+        self.update_time = self._clock()
 
 
 class CoreStat(BaseStat):
@@ -56,6 +87,8 @@ class CoreStat(BaseStat):
     A core stat is one that is not derived from other stats but other stats can listen to it for updates
     """
 
+    __slots__ = ("_listeners", "_baseStatNames", "_engine")
+
     # Constructor
     def __init__(self, name: str, category: str, value: float,
                  description : str = "", owner=0, lifetime=BaseStat.EVERGREEN):
@@ -69,6 +102,9 @@ class CoreStat(BaseStat):
         # There are no stats that a core stat is dependent on
         self._baseStatNames = None
 
+        # The topological StatEngine that passes on changes to this stat instead of its listeners
+        self._engine = None
+
     # Convert to a string
     def __str__(self):
         text = super(CoreStat, self).__str__()
@@ -96,18 +132,31 @@ class CoreStat(BaseStat):
     # Method called to tell listeners that this stat no longer wants to be listened to
     def remove_all_listeners(self):
         for listener in self._listeners:
-            logging.debug("%s.remove_all_listeners(): Telling %s that %s is not publishing anymore", \
-                          __class__, listener.name, self.name)
+            if self._log_debug is True:
+                logging.debug("%s.remove_all_listeners(): Telling %s that %s is not publishing anymore", \
+                              __class__, listener.name, self.name)
             listener.remove(self)
 
 
     # Change the value of this stat and let all listeners know the new state
     def set_value(self, new_value: float):
+        self._old_value = self._value
         self._value = new_value
+        self.notify_listeners()
 
+    # Change the value of this stat without letting the listeners know e.g. while a StatEngine batch is open
+    def set_value_quietly(self, new_value: float):
+        self._old_value = self._value
+        self._value = new_value
+
+    # Let all listeners know the current state of this stat
+    def notify_listeners(self):
         for listener in self._listeners:
             listener.update(self)
 
+        if self._engine is not None:
+            self._engine._changed(self)
+
     # A property style getter
     @property
     def value(self):
@@ -196,40 +245,60 @@ class DerivedStat(CoreStat):
         # If we got an update because of a change to a specific stat then log this
         if changed_stat is not None:
 
-            logging.debug("%s.update(): %s got an update to %s.", __class__, self.name, changed_stat.name)
+            if self._log_debug is True:
+                logging.debug("%s.update(): %s got an update to %s.", __class__, self.name, changed_stat.name)
 
             # Store the new stat in the local dictionary
             self._baseStats[changed_stat.name] = changed_stat
 
         # Else log a generic update request
         else:
-            logging.debug("%s.update(): %s got a general update request.", __class__, self.name)
+            if self._log_debug is True:
+                logging.debug("%s.update(): %s got a general update request.", __class__, self.name)
 
         # If we have all of the dependent stats in the local dictionary then go ahead and recalculate the value
         # of the derived stat
         if len(self.get_missing_dependencies()) == 0:
+            self.recalculate()
+
+        else:
+            if self._log_info is True:
+                logging.info("%s.update(): Not got all of the dependencies yet for stat %s - missing %s.", \
+                             __class__, self.name, str(self.get_missing_dependencies()))
 
-            try:
+    # Recalculate the value of the stat without checking for missing dependencies
+    def recalculate(self):
 
-                logging.debug("%s.update(): Calculating %s from %s", __class__, self.name, str(self._baseStatNames))
+        try:
 
-                # calculate the new value and call the parent set_value to make sure all derived stats are updated
-                super(DerivedStat,self).set_value(self.calculate())
+            if self._log_debug is True:
+                logging.debug("%s.recalculate(): Calculating %s from %s", __class__, self.name,
+                              str(self._baseStatNames))
 
-                logging.debug("%s.update(): New calculated value=%s", __class__, str(self._value))
+            # calculate the new value and call the parent set_value to make sure all derived stats are updated
+            super(DerivedStat,self).set_value(self.calculate())
 
-            except Exception as err:
+            if self._log_debug is True:
+                logging.debug("%s.recalculate(): New calculated value=%s", __class__, str(self._value))
 
-                logging.warning("%s.update(): Calculating %s exception (%s).", __class__, self.name, str(err))
+        except Exception as err:
 
-        else:
-            logging.info("%s.update(): Not got all of the dependencies yet for stat %s - missing %s.", \
-                         __class__, self.name, str(self.get_missing_dependencies()))
+            logging.warning("%s.recalculate(): Calculating %s exception (%s).", __class__, self.name, str(err))
+
+    # Store a dependency stat without recalculating e.g. when a StatEngine is going to recalculate it later
+    def set_base_stat(self, base_stat):
+        self._baseStats[base_stat.name] = base_stat
+
+    # Forget a dependency stat without recalculating
+    def remove_base_stat(self, base_stat_name: str):
+        if base_stat_name in self._baseStats.keys():
+            del self._baseStats[base_stat_name]
 
     # This method is called when a dependent stat is being destroyed
     def remove(self, removed_stat):
 
-        logging.debug("%s.remove(): Removing %s from %s.", __class__, removed_stat.name, self.name)
+        if self._log_debug is True:
+            logging.debug("%s.remove(): Removing %s from %s.", __class__, removed_stat.name, self.name)
 
         # Remove the stat entry from the local dictionary
         if removed_stat.name in self._baseStats.keys():
@@ -268,8 +337,9 @@ class DerivedStat(CoreStat):
         if dependency_stat_name in self._baseStats.keys():
             stat_value = self._baseStats[dependency_stat_name].value
 
-            logging.debug("%s.get_dependency_value(): Found local value %s=%s.", \
-                          __class__, dependency_stat_name, str(stat_value))
+            if self._log_debug is True:
+                logging.debug("%s.get_dependency_value(): Found local value %s=%s.", \
+                              __class__, dependency_stat_name, str(stat_value))
 
         # We have a non-None value
         if stat_value is not None:
@@ -278,8 +348,9 @@ class DerivedStat(CoreStat):
         elif dependency_stat_name in self._baseStatDefaults:
             stat_value = self._baseStatDefaults[dependency_stat_name]
 
-            logging.debug("%s.get_dependency_value(): Found default value %s=%s.", \
-                          __class__, dependency_stat_name, str(stat_value))
+            if self._log_debug is True:
+                logging.debug("%s.get_dependency_value(): Found default value %s=%s.", \
+                              __class__, dependency_stat_name, str(stat_value))
 
         # Can't find it so see if the requested stat was ever registered as a dependency
         elif dependency_stat_name not in self._baseStatNames:
@@ -302,6 +373,10 @@ class DerivedStat(CoreStat):
     def set_value(self, new_value: float):
         logging.error("%s.set_value(): Can't call set_value on derived stat %s.", __class__, self.name)
 
+    def set_value_quietly(self, new_value: float):
+        logging.error("%s.set_value_quietly(): Can't call set_value_quietly on derived stat %s.", __class__,
+                      self.name)
+
 
 '''
 The main container for stats.
@@ -309,20 +384,191 @@ The main container for stats.
 
 
 class StatEngine:
+
+    # How changes to stats reach the stats that are derived from them
+    PROPAGATE_IMMEDIATE = "immediate"
+    PROPAGATE_TOPOLOGICAL = "topological"
+
     # Initialises to create a name and empty dictionary
-    def __init__(self, name):
+    def __init__(self, name, propagation: str = PROPAGATE_IMMEDIATE, lean: bool = False):
         self.name = name
+        self.propagation = propagation
+
+        # In lean mode the engine's clock is its tick count and the logging level is only checked once
+        self.is_lean = lean
+        if lean is True:
+            self._log_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+            self._log_info = logging.getLogger().isEnabledFor(logging.INFO)
+        else:
+            self._log_debug = True
+            self._log_info = True
 
         # Create an empty dictionary that will store all of the stats
         self._stats = {}
 
+        # Indexes of the stats by category and of stat names by owner...
+        self._by_category = {}
+        self._by_owner = {}
+
+        # ...and the names of the stats that depend on each stat name including stats waiting for it to be added
+        self._dependants = {}
+
+        # The position of each stat in dependency order and the derived stats that have all of their dependencies.
+        # These are kept up to date as stats are added and removed and only rebuilt if the order has to change.
+        self._order = None
+        self._calculable = None
+        self._first_order = 0
+        self._last_order = 0
+
+        # The names of the stats that need recalculating
+        self._dirty = set()
+
+        # The engine's tick count, the tick that each stat with a lifetime expires on
+        # and the names of the stats that expire on each tick
+        self.tick_count = 0
+        self._expiry_ticks = {}
+        self._expiries = {}
+
+        # How many batches are open, the stats changed in them that have not told their listeners yet
+        # and the stats changed in them with their values from before the batch
+        self._batch_depth = 0
+        self._deferred = {}
+        self._old_values = {}
+
+        # How many stats each stat name reaches when it changes, cached with the dependency order,
+        # and how many listener updates a change to each stat name pushes out in immediate engines
+        self._affected_counts = {}
+        self._push_counts = {}
+
+        self.reset_counters()
+
+    # Return the current time of the engine's clock - the tick count in lean mode or else the wall clock
+    def now(self):
+        if self.is_lean is True:
+            return self.tick_count
+
+        return datetime.datetime.now()
+
+    # Counters of the work done passing on changes
+    def reset_counters(self):
+        self.propagation_count = 0
+        self.recalculation_count = 0
+        self.saved_recalculation_count = 0
+        self.propagation_time = 0.0
+
+    @property
+    def is_batching(self):
+        return self._batch_depth > 0
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Change stats without passing the changes on until the batch ends. Topological engines then recalculate
+        each affected stat once and immediate engines tell each changed stat's listeners once.
+        If the batch fails with an exception then the changed stats get their old values back and nothing
+        is passed on. Stats added or removed in the batch stay added or removed.
+        """
+
+        self._batch_depth += 1
+        is_failed = False
+        try:
+            yield self
+        except BaseException:
+            is_failed = True
+            raise
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                if is_failed is True:
+                    self.rollback()
+                else:
+                    self.commit()
+
+    # Put back the old values of the stats changed in a batch without passing the changes on
+    def rollback(self):
+
+        old_values = self._old_values
+        self._old_values = {}
+        self._deferred = {}
+
+        for stat, old_value in old_values.values():
+            stat.set_value_quietly(old_value)
+
+        # In immediate engines stats changed directly in the batch may have pushed values that were only
+        # changed quietly so the listeners of the restored stats update from the old values
+        if self.is_topological is False:
+            for stat, old_value in old_values.values():
+                stat.notify_listeners()
+
+        # Topological engines never recalculated the stats that depend on the changed stats but stats added
+        # in the batch still need calculating
+        self.propagate()
+
+    # Pass on all of the changes made in a batch
+    def commit(self):
+
+        self._old_values = {}
+        deferred = self._deferred
+        self._deferred = {}
+
+        if len(deferred) > 0:
+            start_time = time.perf_counter()
+
+            for stat in deferred.values():
+                stat.notify_listeners()
+
+            # Take off the updates that the batch did do from the ones that it saved
+            push_count = sum(self._get_push_count(stat) for stat in deferred.values())
+            self.propagation_count += 1
+            self.recalculation_count += push_count
+            self.saved_recalculation_count -= push_count
+            self.propagation_time += time.perf_counter() - start_time
+
+        # Take off the recalculations that the batch did do from the ones that it saved
+        recalculation_count = self.recalculation_count
+        self.propagate()
+        if self.is_topological is True:
+            self.saved_recalculation_count -= self.recalculation_count - recalculation_count
+
+    # Update several named stats in the container together from a dictionary of stat name to new value
+    def update_stats(self, new_values: dict):
+        with self.batch():
+            for stat_name, new_value in new_values.items():
+                self.update_stat(stat_name, new_value)
+
+    @property
+    def is_topological(self):
+        return self.propagation == StatEngine.PROPAGATE_TOPOLOGICAL
+
     # Add a new stat to the container and sync up all listeners
     def add_stat(self, new_stat):
 
-        logging.debug("%s.add_stat(): Adding new stat %s.", __class__, new_stat.name)
+        if self._log_debug is True:
+            logging.debug("%s.add_stat(): Adding new stat %s.", __class__, new_stat.name)
+
+        self._check_cycle(new_stat)
+
+        # Take any stat that is being replaced out of the indexes
+        old_stat = self._stats.get(new_stat.name)
+        if old_stat is not None:
+            self._remove_from_indexes(old_stat)
+            self._deferred.pop(old_stat.name, None)
 
         # Adds a new stat to the dictionary using the stat name as the key
         self._stats[new_stat.name] = new_stat
+        self._add_to_indexes(new_stat)
+
+        # The new stat uses the engine's clock and logging level
+        new_stat._clock = self.now
+        new_stat._log_debug = self._log_debug
+        new_stat._log_info = self._log_info
+        if new_stat.create_time is None:
+            new_stat.create_time = new_stat.update_time = self.now()
+        self._push_counts.clear()
+
+        if self.is_topological is True:
+            self._add_stat_topological(new_stat, old_stat)
+            return
 
         # If there are some dependencies for the new stat....
         if new_stat._baseStatNames is not None:
@@ -331,7 +577,8 @@ class StatEngine:
             # and register the new stat as a listener on each
             for base_stat_name in new_stat._baseStatNames:
 
-                logging.debug("%s.add_stat(): Adding listener %s to %s.", __class__, new_stat.name, base_stat_name)
+                if self._log_debug is True:
+                    logging.debug("%s.add_stat(): Adding listener %s to %s.", __class__, new_stat.name, base_stat_name)
 
                 base_stat = self.get_stat(base_stat_name)
 
@@ -341,13 +588,332 @@ class StatEngine:
                     logging.warning("%s.add_stat(): Couldn't find dependency %s for stat %s.", \
                                     __class__, base_stat_name, new_stat.name)
 
-        # Look through all stats in the container and see if any are dependent on the new stat
-        # If they are then add the existing stat as a listener to the new stat
-        for stat in self._stats.values():
-            if stat._baseStatNames is not None and new_stat.name in stat._baseStatNames:
-                logging.debug("%s.add_stat(): Adding listener %s to %s.", __class__, stat.name, new_stat.name)
+        # Look up the stats in the container that are dependent on the new stat
+        # and add each of them as a listener to the new stat
+        for stat_name in self._dependants.get(new_stat.name, ()):
+            stat = self._stats.get(stat_name)
+            if stat is not None:
+                if self._log_debug is True:
+                    logging.debug("%s.add_stat(): Adding listener %s to %s.", __class__, stat.name, new_stat.name)
                 new_stat.add_listener(stat)
 
+    def _add_to_indexes(self, stat):
+
+        self._by_category.setdefault(stat.category, {})[stat.name] = stat
+        self._by_owner.setdefault(stat.owner, set()).add(stat.name)
+
+        if stat._baseStatNames is not None:
+            for base_stat_name in stat._baseStatNames:
+                self._dependants.setdefault(base_stat_name, set()).add(stat.name)
+
+        # A stat with a lifetime dies on the tick that takes its lifetime to zero or on the next tick if it is
+        # already dead
+        if stat._lifetime != BaseStat.EVERGREEN and stat._lifetime >= 0:
+            expiry_tick = self.tick_count + max(stat._lifetime, 1)
+            self._expiry_ticks[stat.name] = expiry_tick
+            self._expiries.setdefault(expiry_tick, set()).add(stat.name)
+
+    def _remove_from_indexes(self, stat):
+
+        stats = self._by_category.get(stat.category)
+        if stats is not None:
+            stats.pop(stat.name, None)
+            if len(stats) == 0:
+                del self._by_category[stat.category]
+
+        stat_names = self._by_owner.get(stat.owner)
+        if stat_names is not None:
+            stat_names.discard(stat.name)
+            if len(stat_names) == 0:
+                del self._by_owner[stat.owner]
+
+        expiry_tick = self._expiry_ticks.pop(stat.name, None)
+        if expiry_tick is not None:
+            stat_names = self._expiries.get(expiry_tick)
+            if stat_names is not None:
+                stat_names.discard(stat.name)
+                if len(stat_names) == 0:
+                    del self._expiries[expiry_tick]
+
+        self._forget_dependencies(stat)
+
+    # Raise an exception if adding a stat would make a stat depend on itself
+    def _check_cycle(self, new_stat):
+
+        if new_stat._baseStatNames is None:
+            return
+
+        # Follow the dependencies of the new stat through the stats in the container looking for the new stat
+        stat_names = list(new_stat._baseStatNames)
+        checked_names = set()
+
+        while len(stat_names) > 0:
+            stat_name = stat_names.pop()
+
+            if stat_name == new_stat.name:
+                logging.error("%s._check_cycle(): Stat %s depends on itself.", __class__, new_stat.name)
+                raise Exception("Adding stat {0} would make a dependency cycle.".format(new_stat.name))
+
+            if stat_name in checked_names:
+                continue
+            checked_names.add(stat_name)
+
+            stat = self._stats.get(stat_name)
+            if stat is not None and stat._baseStatNames is not None:
+                stat_names.extend(stat._baseStatNames)
+
+    # Add a stat that will be recalculated in dependency order rather than by listening to its dependencies
+    def _add_stat_topological(self, new_stat, old_stat=None):
+
+        # Core stats tell the engine when they are changed directly e.g. stat.value = x
+        if old_stat is not None:
+            old_stat._engine = None
+        if new_stat._baseStatNames is None:
+            new_stat._engine = self
+
+        # Give the new stat the stats that it depends on that are already here...
+        has_base_stats = False
+        if new_stat._baseStatNames is not None:
+            for base_stat_name in new_stat._baseStatNames:
+                base_stat = self._stats.get(base_stat_name)
+                if base_stat is not None:
+                    new_stat.set_base_stat(base_stat)
+                    has_base_stats = True
+                else:
+                    logging.warning("%s.add_stat(): Couldn't find dependency %s for stat %s.", \
+                                    __class__, base_stat_name, new_stat.name)
+
+            self._dirty.add(new_stat.name)
+
+        # ...and give the new stat to any stats that have been waiting for it
+        waiting_names = [stat_name for stat_name in self._dependants.get(new_stat.name, ())
+                         if stat_name in self._stats]
+        for stat_name in waiting_names:
+            self._stats[stat_name].set_base_stat(new_stat)
+            self._dirty.add(stat_name)
+
+        if self._order is not None:
+
+            # A stat that nothing here depends on can go last and one that depends on nothing here can go first.
+            # Otherwise the order has to be worked out again.
+            if old_stat is not None or (has_base_stats is True and len(waiting_names) > 0):
+                self._order = None
+            else:
+                if len(waiting_names) == 0:
+                    self._order[new_stat.name] = self._last_order
+                    self._last_order += 1
+                else:
+                    self._first_order -= 1
+                    self._order[new_stat.name] = self._first_order
+
+                self._update_calculable(new_stat.name)
+                for stat_name in waiting_names:
+                    self._update_calculable(stat_name)
+
+                self._affected_counts.clear()
+
+        self.propagate()
+
+    # Record whether a derived stat has all of its dependencies
+    def _update_calculable(self, stat_name: str):
+
+        stat = self._stats[stat_name]
+        if stat._baseStatNames is not None and len(stat.get_missing_dependencies()) == 0:
+            self._calculable.add(stat_name)
+        else:
+            self._calculable.discard(stat_name)
+
+    def _forget_dependencies(self, stat):
+
+        if stat._baseStatNames is None:
+            return
+
+        for base_stat_name in stat._baseStatNames:
+            dependant_names = self._dependants.get(base_stat_name)
+            if dependant_names is not None:
+                dependant_names.discard(stat.name)
+                if len(dependant_names) == 0:
+                    del self._dependants[base_stat_name]
+
+    # Remove a stat from the container telling the stats that depend on it that it has gone
+    def _remove_stat(self, stat_name: str):
+
+        stat = self._stats.pop(stat_name)
+        self._remove_from_indexes(stat)
+        self._push_counts.clear()
+        self._deferred.pop(stat_name, None)
+
+        if self.is_topological is False:
+            stat.remove_all_listeners()
+            return
+
+        self._dirty.discard(stat_name)
+        stat._engine = None
+
+        dependant_names = [dependant_name for dependant_name in self._dependants.get(stat_name, ())
+                           if dependant_name in self._stats]
+        for dependant_name in dependant_names:
+            self._stats[dependant_name].remove_base_stat(stat_name)
+            self._dirty.add(dependant_name)
+
+        # Taking a stat out of the dependency order leaves the rest of it in order
+        if self._order is not None:
+            del self._order[stat_name]
+            self._calculable.discard(stat_name)
+            for dependant_name in dependant_names:
+                self._update_calculable(dependant_name)
+            self._affected_counts.clear()
+
+    # Mark the stats that depend on a changed stat as needing recalculating
+    def mark_dirty(self, stat_name: str):
+        self._dirty.update(self._dependants.get(stat_name, ()))
+
+    # Pass on a change to a stat unless a batch is open
+    def _changed(self, stat):
+
+        # Keep the value that the stat had before the batch in case the batch fails
+        if self.is_batching is True and stat.name not in self._old_values:
+            self._old_values[stat.name] = (stat, stat._old_value)
+
+        if self.is_topological is True:
+            self.mark_dirty(stat.name)
+
+            if self.is_batching is True:
+                # Count the recalculations that passing this change on straight away would have done
+                self.saved_recalculation_count += self._get_affected_count(stat.name)
+            else:
+                self.propagate()
+
+        elif self.is_batching is True:
+            self._deferred[stat.name] = stat
+
+            # Count the updates that telling the listeners straight away would have done
+            self.saved_recalculation_count += self._get_push_count(stat)
+
+        else:
+            self.propagation_count += 1
+            self.recalculation_count += self._get_push_count(stat)
+
+    # Get how many listener updates a change to a stat pushes out through all of the stats that listen to it
+    def _get_push_count(self, stat):
+
+        push_counts = self._push_counts
+
+        # Work out the counts of the listeners before the counts of the stats that they listen to
+        stats = [stat]
+        while len(stats) > 0:
+            stat_to_count = stats[-1]
+            if stat_to_count.name in push_counts.keys():
+                stats.pop()
+                continue
+
+            uncounted = [listener for listener in stat_to_count._listeners if listener.name not in push_counts]
+            if len(uncounted) > 0:
+                stats.extend(uncounted)
+                continue
+
+            stats.pop()
+            push_counts[stat_to_count.name] = sum(1 + push_counts[listener.name]
+                                                  for listener in stat_to_count._listeners)
+
+        return push_counts[stat.name]
+
+    # Set the value of a stat, holding back telling its listeners if a batch is open
+    def _set_stat_value(self, stat, new_value: float):
+
+        # Derived stats can only change when the stats that they depend on change
+        if stat._baseStatNames is not None:
+            logging.error("%s._set_stat_value(): Can't set the value of derived stat %s.", __class__, stat.name)
+            return
+
+        if self.is_batching is True and self.is_topological is False:
+            stat.set_value_quietly(new_value)
+        else:
+            stat.set_value(new_value)
+
+        # Core stats in topological engines have already told the engine
+        if stat._engine is not self:
+            self._changed(stat)
+
+    # Find all of the stats that are reached by changes to some stats
+    def _get_affected_names(self, stat_names):
+
+        if self._order is None:
+            self._build_order()
+
+        stat_names = list(stat_names)
+        affected_names = set()
+        while len(stat_names) > 0:
+            stat_name = stat_names.pop()
+            if stat_name in affected_names or stat_name not in self._order:
+                continue
+            affected_names.add(stat_name)
+            stat_names.extend(self._dependants.get(stat_name, ()))
+
+        return affected_names
+
+    def _get_affected_count(self, stat_name: str):
+
+        if self._order is None:
+            self._build_order()
+
+        count = self._affected_counts.get(stat_name)
+        if count is None:
+            count = len(self._get_affected_names(self._dependants.get(stat_name, ())))
+            self._affected_counts[stat_name] = count
+
+        return count
+
+    # Work out the dependency order of the stats and which derived stats have all of their dependencies
+    def _build_order(self):
+
+        dependency_counts = {stat_name: 0 for stat_name in self._stats.keys()}
+        for base_stat_name, dependant_names in self._dependants.items():
+            if base_stat_name in self._stats:
+                for dependant_name in dependant_names:
+                    dependency_counts[dependant_name] += 1
+
+        # Take stats in order once all of the stats that they depend on have been taken
+        ready = [stat_name for stat_name, count in dependency_counts.items() if count == 0]
+        self._order = {}
+        while len(ready) > 0:
+            stat_name = ready.pop()
+            self._order[stat_name] = len(self._order)
+            for dependant_name in self._dependants.get(stat_name, ()):
+                if dependant_name in dependency_counts:
+                    dependency_counts[dependant_name] -= 1
+                    if dependency_counts[dependant_name] == 0:
+                        ready.append(dependant_name)
+
+        self._calculable = {stat_name for stat_name, stat in self._stats.items()
+                            if stat._baseStatNames is not None and len(stat.get_missing_dependencies()) == 0}
+        self._affected_counts = {}
+        self._first_order = 0
+        self._last_order = len(self._order)
+
+    # Recalculate every dirty stat and every stat that depends on one exactly once in dependency order
+    def propagate(self):
+
+        if len(self._dirty) == 0 or self.is_batching is True:
+            return
+
+        start_time = time.perf_counter()
+
+        # Find all of the stats that the changes reach
+        affected_names = self._get_affected_names(self._dirty)
+        self._dirty = set()
+
+        for stat_name in sorted(affected_names, key=self._order.__getitem__):
+            stat = self._stats[stat_name]
+            if stat_name in self._calculable:
+                stat.recalculate()
+            elif stat._baseStatNames is not None:
+                stat.update()
+
+        self.propagation_count += 1
+        self.recalculation_count += len(affected_names)
+        self.propagation_time += time.perf_counter() - start_time
+
     # Load in stats from a provided list
     # Default is to overwrite what is there already with option to increment
     def load_stats(self, stat_list : list, overwrite : bool = True):
@@ -355,18 +921,21 @@ class StatEngine:
         if stat_list is None:
             return
 
-        for stat in stat_list:
-            # If we are overwriting or the stat does not exist then add the stat
-            if overwrite is True or self.get_stat(stat.name) is None:
-                self.add_stat(stat)
-            # Else increment the existing stat
-            else:
-                self.increment_stat(stat.name, stat.value)
+        # Pass on all of the changes in one go at the end
+        with self.batch():
+            for stat in stat_list:
+                # If we are overwriting or the stat does not exist then add the stat
+                if overwrite is True or self.get_stat(stat.name) is None:
+                    self.add_stat(stat)
+                # Else increment the existing stat
+                else:
+                    self.increment_stat(stat.name, stat.value)
 
     # Get a named stat from the container
     def get_stat(self, stat_name: str):
         if stat_name not in self._stats.keys():
-            logging.info("%s.get_stat(): Couldn't find stat %s in the container.", __class__, stat_name)
+            if self._log_info is True:
+                logging.info("%s.get_stat(): Couldn't find stat %s in the container.", __class__, stat_name)
             return None
         else:
             return self._stats[stat_name]
@@ -376,7 +945,8 @@ class StatEngine:
         # Look to see if the specified stat exists in the local dictionary and update if it is found
         if (stat_name in self._stats.keys()):
             stat = self._stats[stat_name]
-            stat.set_value(new_value)
+            self._set_stat_value(stat, new_value)
+
         # else log an error
         else:
             logging.warning("%s.update_stat(): Couldn't find stat %s in the container", __class__, stat_name)
@@ -386,28 +956,22 @@ class StatEngine:
         # Look to see if the specified stat exists in the local dictionary and increment if it is found
         if (stat_name in self._stats.keys()):
             stat = self._stats[stat_name]
-            stat.increment_value(increment)
+            self._set_stat_value(stat, stat.value + increment)
+
         # else log an error
         else:
             logging.warning("%s.increment_stat(): Couldn't find stat %s in the container", __class__, stat_name)
 
     # Get all of the stats for a specified category
     def get_stats_by_category(self, category_name: str):
-        stats = set()
-        for stat in self._stats.values():
-            if stat.category == category_name:
-                stats.add(stat)
-        return stats
+        return set(self._by_category.get(category_name, {}).values())
 
     def get_all_stats(self):
         return list(self._stats.values())
 
     # Get a list of all of the stat categories currently in the container
     def get_category_names(self):
-        categories = set()
-        for stat in self._stats.values():
-            categories.add(stat.category)
-        return categories
+        return set(self._by_category.keys())
 
     # Get a list of all of the stat names currently in the container
     def get_stat_names(self):
@@ -415,52 +979,74 @@ class StatEngine:
 
     # Create a new dictionary
     def remove_all(self):
+        for stat in self._stats.values():
+            stat._engine = None
+
         self._stats = {}
+        self._push_counts = {}
+        self._by_category = {}
+        self._by_owner = {}
+        self._dependants = {}
+        self._order = None
+        self._calculable = None
+        self._affected_counts = {}
+        self._first_order = 0
+        self._last_order = 0
+        self._dirty = set()
+        self._deferred = {}
+        self._old_values = {}
+        self._expiry_ticks = {}
+        self._expiries = {}
 
     # Remove all stats that are owned by a specified owner
     def remove_stats_by_owner(self, owner: int):
 
-        logging.debug("%s.remove_stats_by_owner(): Going to remove stats owned by %s.", __class__, str(owner))
+        if self._log_debug is True:
+            logging.debug("%s.remove_stats_by_owner(): Going to remove stats owned by %s.", __class__, str(owner))
 
-        stat_names_to_delete = set()
-        for stat in self._stats.values():
-            if stat.owner == owner:
-                stat_names_to_delete.add(stat.name)
+        stat_names_to_delete = set(self._by_owner.get(owner, ()))
 
-        logging.debug("%s.remove_stats_by_owner(): About to remove %s.", __class__, str(stat_names_to_delete))
+        if self._log_debug is True:
+            logging.debug("%s.remove_stats_by_owner(): About to remove %s.", __class__, str(stat_names_to_delete))
 
         for stat_name in stat_names_to_delete:
-            stat = self._stats[stat_name]
-            stat.remove_all_listeners()
-            del self._stats[stat_name]
+            self._remove_stat(stat_name)
+
+        self.propagate()
+
+    # Get how many more ticks a stat in the container has to live
+    def get_life_left(self, stat_name: str):
+
+        expiry_tick = self._expiry_ticks.get(stat_name)
+        if expiry_tick is None:
+            return BaseStat.EVERGREEN
+
+        return expiry_tick - self.tick_count
 
     #
-    # Do a tick on all stats in the container and remove any dead ones
+    # Do a tick on the container and remove any stats whose lifetime has run out
     #
     def tick(self):
 
-        logging.debug("%s.tick(): Doing a tick on all stats in %s.", __class__, self.name)
-
-        # Set to collect the names of dead stats
-        dead_stat_names = set()
-
-        # Loop through all stats doing a tick and recording dead ones
-        for stat in self._stats.values():
+        if self._log_debug is True:
+            logging.debug("%s.tick(): Doing a tick on all stats in %s.", __class__, self.name)
 
-            life_left = stat.tick
+        self.tick_count += 1
 
-            # If a stat is dead then remove it
-            if life_left == BaseStat.DEAD:
-                dead_stat_names.add(stat.name)
+        # Only the stats that are scheduled to expire this tick need looking at
+        dead_stat_names = self._expiries.pop(self.tick_count, set())
+        for stat_name in dead_stat_names:
+            self._stats[stat_name]._lifetime = BaseStat.DEAD
 
         if len(dead_stat_names) > 0:
-            logging.debug("%s.tick(): Removing dead stats %s", __class__, str(dead_stat_names))
+            if self._log_debug is True:
+                logging.debug("%s.tick(): Removing dead stats %s", __class__, str(dead_stat_names))
 
         # Go through the collection of dead stats and remove them from the container
         for stat_name in dead_stat_names:
-            stat = self._stats[stat_name]
-            stat.remove_all_listeners()
-            del self._stats[stat.name]
+            self._remove_stat(stat_name)
+
+        self.propagate()
 
     #
     # Print out the contents of the container
@@ -1,6 +1,14 @@
 from .model import Objects
 from .model import Game
 from .model import Event
+from .building_blocks import CreatableFactoryXML
 from .building_blocks import HexagonMaths
+from .building_blocks import HexagonNeighbours
+from .building_blocks import ResourceFactory
 from .building_blocks import WorldMap
+from .chunked_map import ChunkedWorldMap
+from .creation_store import CreationStore
+from .pathfinding import PathFinder
+from .production import ProductionEngine
+from .topology import TopologyGenerator
 from .game_stats import *
\ No newline at end of file
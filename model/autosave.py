@@ -0,0 +1,337 @@
+'''
+    This module contains background autosaving for a Game.
+
+    An autosave is a world file, a snapshot and a journal. Every JOURNAL_TICKS ticks the changes made since
+    the last checkpoint - altitudes, creations added and deleted, the progress of creations under construction,
+    inventory changes, the tick count and the input stats - are appended to the journal as a line of JSON.
+    Every COMPACT_TICKS ticks, or when the world map is replaced, the journal is compacted: a full snapshot is
+    written and the journal is replaced with an empty one.
+
+    Each compaction gives the snapshot and the new journal the same journal id, which is the first line of the
+    journal. If the game stops after a snapshot is written but before the journal is replaced then the journal's
+    id doesn't match the snapshot and its entries, which are already in the snapshot, are not replayed.
+
+    Changes are collected on the main thread, which is cheap, and all of the file writing is done by a
+    background thread so the game loop never waits for the disk. The background thread only ever sees copies
+    of the game's data. An autosave is recovered by loading the world file and the snapshot and then replaying
+    the journal.
+
+    A ChunkedWorldMap is autosaved as a chunks file instead of a world file. The map is generated again from the
+    seed, size and chunk settings in the chunks file and then the chunks that had been changed are put back.
+'''
+
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+
+import numpy
+
+from .building_blocks import ResourceFactory
+from .chunked_map import CHUNKS_FILE_EXTENSION
+from .chunked_map import ChunkedWorldMap
+from .chunked_map import load_chunks
+from .chunked_map import write_chunks
+from .game_stats import KingdomStats
+from .snapshot import FILE_EXTENSION as SNAPSHOT_FILE_EXTENSION
+from .snapshot import read_snapshot
+from .snapshot import restore_snapshot
+from .snapshot import take_snapshot
+from .snapshot import write_snapshot
+from .world_file import FILE_EXTENSION as WORLD_FILE_EXTENSION
+from .world_file import load_world
+from .world_file import take_world_data
+from .world_file import write_world
+
+JOURNAL_FILE_EXTENSION = ".journal"
+
+CREATION_ADDED = "+"
+CREATION_DELETED = "-"
+
+
+class AutoSaver:
+    """
+    Autosave a game to files that start with file_base_name.
+    Call tick() every game tick and stop() when the game ends to write the last changes.
+    """
+
+    JOURNAL_TICKS = 5
+    COMPACT_TICKS = 60
+
+    def __init__(self, game, file_base_name: str):
+
+        self.game = game
+        self.world_file_name = file_base_name + WORLD_FILE_EXTENSION
+        self.chunks_file_name = file_base_name + CHUNKS_FILE_EXTENSION
+        self.snapshot_file_name = file_base_name + SNAPSHOT_FILE_EXTENSION
+        self.journal_file_name = file_base_name + JOURNAL_FILE_EXTENSION
+
+        # Changes since the last checkpoint and the positions of the creations that were under construction
+        self._creation_changes = []
+        self._inventory_counts = {}
+        self._progress_positions = set()
+
+        # The map that was last written to the world file and the tick of the last compaction
+        self._world = None
+        self._world_version = None
+        self._is_world_changed = False
+        self._compact_tick = 0
+
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run,
+                                        name="autosave {0}".format(game.name),
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def pending_jobs(self):
+        return self._jobs.qsize()
+
+    def creation_added(self, x: int, y: int, creation):
+        self._creation_changes.append((CREATION_ADDED, x, y, creation.name, creation.ticks_done))
+
+    def creation_deleted(self, x: int, y: int):
+        self._creation_changes.append((CREATION_DELETED, x, y))
+
+    def tick(self):
+
+        map = self.game.map
+
+        if map is not self._world or map.topology_version != self._world_version:
+            self.checkpoint(compact=True)
+        elif self.game.tick_count - self._compact_tick >= AutoSaver.COMPACT_TICKS:
+            self.checkpoint(compact=True)
+        elif self.game.tick_count % AutoSaver.JOURNAL_TICKS == 0:
+            self.checkpoint()
+
+    def checkpoint(self, compact: bool = False):
+        """Queue the changes since the last checkpoint to be journaled or a full snapshot to be written"""
+
+        map = self.game.map
+
+        # Start recording altitude changes on a new map
+        if map is not self._world or map.topology_version != self._world_version:
+            self._world = map
+            self._world_version = map.topology_version
+            self._is_world_changed = True
+            map.altitude_changes = {}
+            compact = True
+
+        altitude_changes = map.altitude_changes
+        map.altitude_changes = {}
+
+        if len(altitude_changes) > 0:
+            self._is_world_changed = True
+
+        inventory_changes = self._get_inventory_changes()
+        progress = self._get_progress()
+
+        if compact is True:
+
+            world_data = None
+            chunk_data = None
+
+            # Chunked maps only save what is needed to generate them again and the chunks that have changed
+            if self._is_world_changed is True:
+                if isinstance(map, ChunkedWorldMap) is True:
+                    chunk_data = map.take_chunk_data()
+                else:
+                    world_data = take_world_data(map, copy_arrays=True)
+                self._is_world_changed = False
+
+            self._creation_changes = []
+            self._compact_tick = self.game.tick_count
+            self._jobs.put((self._compact, (world_data, chunk_data, take_snapshot(self.game))))
+
+        else:
+            changes = {
+                "tick_count": self.game.tick_count,
+                "stats": {stat_name: self.game.stats.get_stat(stat_name).value for stat_name in KingdomStats.INPUTS},
+                "inventory": inventory_changes,
+                "creations": self._creation_changes,
+                "progress": progress,
+                "altitudes": [(x, y, float(altitude)) for (x, y), altitude in altitude_changes.items()]
+            }
+
+            self._creation_changes = []
+            self._jobs.put((self._append, (json.dumps(changes),)))
+
+    # Get the change in the count of each resource since the last checkpoint
+    def _get_inventory_changes(self):
+
+        counts = {resource.name: item_count for resource, item_count in self.game.inventory.resources.items()}
+
+        changes = {}
+        for resource_name, item_count in counts.items():
+            change = item_count - self._inventory_counts.get(resource_name, 0)
+            if change != 0:
+                changes[resource_name] = change
+
+        for resource_name, item_count in self._inventory_counts.items():
+            if resource_name not in counts and item_count != 0:
+                changes[resource_name] = -item_count
+
+        self._inventory_counts = counts
+
+        return changes
+
+    # Get (x, y, ticks done) for the creations that are under construction and for the creations that were under
+    # construction at the last checkpoint or have been added since and are still there
+    def _get_progress(self):
+
+        creations = self.game.creations
+        slots = numpy.flatnonzero(creations.scheduled[:creations.size])
+        positions = set(zip(creations.xs[slots].tolist(), creations.ys[slots].tolist()))
+
+        old_positions = self._progress_positions | {(change[1], change[2]) for change in self._creation_changes
+                                                    if change[0] == CREATION_ADDED}
+        finished_slots = [creations.get_slot(x, y) for x, y in old_positions - positions]
+        slots = numpy.concatenate((slots, [slot for slot in finished_slots if slot is not None])).astype(numpy.int64)
+
+        self._progress_positions = positions
+
+        return list(zip(creations.xs[slots].tolist(), creations.ys[slots].tolist(),
+                        creations.get_ticks_done(slots).tolist()))
+
+    def stop(self):
+        """Journal the last changes and wait for the background thread to write everything"""
+
+        if self._world is not None:
+            self.checkpoint()
+
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self):
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+
+            function, args = job
+            try:
+                function(*args)
+            except Exception as err:
+                logging.warning("%s._run(): Autosave of %s failed: %s", __class__, self.game.name, str(err))
+
+    def _append(self, line: str):
+
+        with open(self.journal_file_name, "a") as journal_file:
+            journal_file.write(line + "\n")
+
+    def _compact(self, world_data, chunk_data, snapshot: dict):
+
+        # Write the map and then remove the file of any other kind of map so recover() finds this one
+        if world_data is not None:
+            write_world(world_data, self.world_file_name)
+            if os.path.exists(self.chunks_file_name) is True:
+                os.remove(self.chunks_file_name)
+
+        elif chunk_data is not None:
+            write_chunks(chunk_data, self.chunks_file_name)
+            if os.path.exists(self.world_file_name) is True:
+                os.remove(self.world_file_name)
+
+        journal_id = uuid.uuid4().hex
+        snapshot["journal_id"] = numpy.array(journal_id)
+        write_snapshot(snapshot, self.snapshot_file_name)
+
+        # Everything in the journal is now in the snapshot so swap in a new journal for the snapshot
+        temp_file_name = self.journal_file_name + ".tmp"
+        with open(temp_file_name, "w") as journal_file:
+            journal_file.write(json.dumps({"journal_id": journal_id}) + "\n")
+        os.replace(temp_file_name, self.journal_file_name)
+
+        logging.info("%s._compact(): Compacted autosave of %s at tick %i", __class__, self.game.name,
+                     int(snapshot["tick_count"]))
+
+
+def recover(game, file_base_name: str):
+    """Restore a game from an autosave by loading the world file and the snapshot and replaying the journal"""
+
+    # Read the snapshot first so that the game is left as it was if it can't be read
+    snapshot = read_snapshot(file_base_name + SNAPSHOT_FILE_EXTENSION)
+
+    # If the game stopped before the file of the last kind of map was removed then the newest file is the map
+    map_file_names = [file_name for file_name in (file_base_name + WORLD_FILE_EXTENSION,
+                                                  file_base_name + CHUNKS_FILE_EXTENSION)
+                      if os.path.exists(file_name) is True]
+
+    if len(map_file_names) > 0:
+        map_file_name = max(map_file_names, key=os.path.getmtime)
+        if map_file_name.endswith(CHUNKS_FILE_EXTENSION) is True:
+            game.map = load_chunks(map_file_name)
+        else:
+            game.map = load_world(map_file_name)
+
+    restore_snapshot(game, snapshot)
+
+    journal_file_name = file_base_name + JOURNAL_FILE_EXTENSION
+    if os.path.exists(journal_file_name) is False:
+        return
+
+    # Snapshots from before journal ids were added go with any journal
+    journal_id = str(snapshot["journal_id"]) if "journal_id" in snapshot.keys() else None
+
+    with open(journal_file_name) as journal_file:
+        for line_number, line in enumerate(journal_file):
+            try:
+                changes = json.loads(line)
+            except ValueError:
+                # The last line will be incomplete if the game stopped while it was being written
+                logging.warning("recover(): Ignoring incomplete journal entry in %s", journal_file_name)
+                break
+
+            # A journal that wasn't started for this snapshot is from before the snapshot was written
+            if "journal_id" in changes.keys():
+                if journal_id is not None and changes["journal_id"] != journal_id:
+                    logging.warning("recover(): Ignoring journal %s that is already in the snapshot",
+                                    journal_file_name)
+                    break
+                continue
+            elif line_number == 0 and journal_id is not None:
+                logging.warning("recover(): Ignoring journal %s that is already in the snapshot", journal_file_name)
+                break
+
+            replay(game, changes)
+
+
+def replay(game, changes: dict):
+    """Apply one journal entry to a game"""
+
+    for x, y, altitude in changes["altitudes"]:
+        game.map.set_altitude(altitude, x, y)
+
+    for change in changes["creations"]:
+        if change[0] == CREATION_ADDED:
+            action, x, y, creation_name, ticks_done = change
+            game.put_creation(game.creatables.get_creatable(creation_name), x, y, ticks_done, is_restored=True)
+        else:
+            action, x, y = change
+            game.remove_creation(x, y)
+
+    # Journals from before progress was journaled don't have any
+    for x, y, ticks_done in changes.get("progress", ()):
+        slot = game.creations.get_slot(x, y)
+        if slot is None:
+            continue
+
+        was_scheduled = bool(game.creations.scheduled[slot])
+        game.creations.set_ticks_done(slot, ticks_done)
+
+        # Creations that were finished since the last entry start producing
+        if was_scheduled is True and bool(game.creations.scheduled[slot]) is False:
+            game.production.add_producers([slot], changes["tick_count"])
+
+    for resource_name, item_count in changes["inventory"].items():
+        resource = ResourceFactory.get_resource(resource_name)
+        if resource is None:
+            logging.warning("replay(): Resource %s is not recognised.", resource_name)
+            continue
+        game.inventory.add_resource(resource, item_count)
+
+    game.tick_count = changes["tick_count"]
+    game.stats.update_stats(changes["stats"])
@@ -1,7 +1,10 @@
+import collections
 import copy
-import csv
 import logging
+import math
 import random
+import threading
+import weakref
 from xml.dom.minidom import *
 from .utils import EventQueue
 from .utils import Event
@@ -9,7 +12,11 @@ from operator import itemgetter
 
 import numpy
 
+from .catalogue import load_catalogue
+from .catalogue import parse_creatables
+from .catalogue import parse_resources
 from .utils import is_numeric
+from .topology import TopologyGenerator
 
 
 class Resource:
@@ -28,13 +35,29 @@ class Resource:
 
 class Creatable():
 
-    def __init__(self, name: str, description: str, ticks_required: int = 10):
+    # What happens to an output when a creatable is complete
+    OUTPUT_INVENTORY = "inventory"
+    OUTPUT_REPLACE = "replace"
+
+    # Goes up whenever the pre-requisites of any creatable change so that compiled requirements can be checked
+    requirements_version = 0
+
+    def __init__(self, name: str, description: str, ticks_required: int = 10, production_ticks: int = None):
         self.name = name
         self.description = description
         self.pre_requisites = {}
         self.ticks_done = 0
         self.ticks_required = ticks_required
         self.output = {}
+        self.output_actions = {}
+
+        # How often a completed creatable produces its inventory outputs again or None for only once
+        self.production_ticks = production_ticks
+
+        # The pre-requisites compiled into a vector of counts by resource id by get_requirements()
+        # and into the ids and counts of just the resources that are needed by get_requirement_items()
+        self._requirements = None
+        self._requirement_items = None
 
     def __str__(self):
 
@@ -73,13 +96,64 @@ class Creatable():
             self.pre_requisites[new_resource_name] = 0
 
         self.pre_requisites[new_resource_name] += item_count
+        self._requirements = None
+        self._requirement_items = None
+        Creatable.requirements_version += 1
+
+    def get_requirements(self):
+        """
+        Return an array of the count of each resource needed indexed by ResourceFactory id
+        or None if any of the pre-requisites are not recognised
+        """
+
+        # Compile again if more resources have been loaded since the last time
+        if self._requirements is None or len(self._requirements[1]) != len(ResourceFactory.resource_list):
+
+            requirements = numpy.zeros(len(ResourceFactory.resource_list), dtype=numpy.int64)
+            is_recognised = True
+
+            for name, count in self.pre_requisites.items():
+                resource_id = ResourceFactory.get_resource_id(name)
+                if resource_id is None:
+                    is_recognised = False
+                else:
+                    requirements[resource_id] += count
+
+            self._requirements = (is_recognised, requirements)
+
+        if self._requirements[0] is False:
+            return None
+
+        return self._requirements[1]
+
+    def get_requirement_items(self):
+        """
+        Return a tuple of the ids of the resources needed and a tuple of how many of each are needed
+        or None if any of the pre-requisites are not recognised
+        """
 
-    def add_output(self, new_resource_name: str, item_count: int = 1):
+        # Resource ids never change so these only need compiling again when the pre-requisites change
+        if self._requirement_items is None:
+
+            item_counts = {}
+            for name, count in self.pre_requisites.items():
+                resource_id = ResourceFactory.get_resource_id(name)
+                if resource_id is None:
+                    return None
+                item_counts[resource_id] = item_counts.get(resource_id, 0) + count
+
+            item_counts = {resource_id: count for resource_id, count in item_counts.items() if count != 0}
+            self._requirement_items = (tuple(item_counts.keys()), tuple(item_counts.values()))
+
+        return self._requirement_items
+
+    def add_output(self, new_resource_name: str, item_count: int = 1, action: str = OUTPUT_INVENTORY):
 
         if new_resource_name not in self.output.keys():
             self.output[new_resource_name] = 0
 
         self.output[new_resource_name] += item_count
+        self.output_actions[new_resource_name] = action
 
     def tick(self):
         if self.is_complete is False:
@@ -130,6 +204,16 @@ class Inventory():
                 self.add_resource(pre_req, count * change)
                 print("Using {0} x {1} to create {2}".format(count,pre_req,new_creatable.name))
 
+    # Apply a ledger of changes to the count of each resource name in one go
+    def apply_changes(self, changes: dict):
+
+        for resource_name, item_count in changes.items():
+            resource = ResourceFactory.get_resource(resource_name)
+            if resource is None:
+                logging.warning("%s.apply_changes(): Resource %s is not recognised.", __class__, resource_name)
+                continue
+            self.add_resource(resource, item_count)
+
     # Have we got the required resources to creat a specified creatable?
     def is_creatable(self, new_creatable: Creatable):
 
@@ -148,6 +232,10 @@ class Inventory():
 
         return is_creatable
 
+    def are_creatable(self, creatables: list):
+        """Return an array of booleans saying which of a list of creatables can be created"""
+        return numpy.array([self.is_creatable(creatable) for creatable in creatables], dtype=bool)
+
     def print(self):
         if len(self.resources.keys()) > 0:
             _str = "Inventory ({0} resource types)".format(self.resource_type_count)
@@ -159,12 +247,196 @@ class Inventory():
         print(_str)
 
 
+class IndexedInventory(Inventory):
+    """
+    An Inventory that keeps the count of each resource in an array indexed by the resource's ResourceFactory id.
+    Checking whether a creatable can be created and debiting its pre-requisites only look at the counts of the
+    resource ids in the creatable's compiled requirement items rather than looking up each resource by name, and
+    are_creatable() checks a list of creatables with one matrix compare.
+    """
+
+    MAX_CACHED_MATRICES = 16
+
+    def __init__(self):
+
+        # The count of each resource and whether the inventory has ever held it
+        self.counts = numpy.zeros(len(ResourceFactory.resource_list), dtype=numpy.int64)
+        self.held = numpy.zeros(len(ResourceFactory.resource_list), dtype=bool)
+
+        # A view of the counts that reads and writes single counts as Python ints without making numpy scalars
+        self._count_view = memoryview(self.counts)
+
+        # Requirement matrices for the lists of creatables passed to are_creatable()
+        self._matrices = {}
+
+        # The dictionary of resource to count built by the resources property until the counts change
+        self._resources = None
+
+    # A dictionary of resource to count for the resources that the inventory has held.
+    # This is built once and then shared until the counts change so don't change it.
+    @property
+    def resources(self):
+        if self._resources is None:
+            self._resources = {ResourceFactory.resource_list[resource_id]: count
+                               for resource_id, count in zip(numpy.flatnonzero(self.held).tolist(),
+                                                             self.counts[self.held].tolist())}
+        return self._resources
+
+    @property
+    def resource_type_count(self):
+        return int(self.held.sum())
+
+    # Make room for resources that have been added to the ResourceFactory since the arrays were made
+    def _grow(self):
+
+        size = len(ResourceFactory.resource_list)
+        if size > len(self.counts):
+            self.counts = numpy.concatenate((self.counts, numpy.zeros(size - len(self.counts), dtype=numpy.int64)))
+            self._count_view = memoryview(self.counts)
+            self.held = numpy.concatenate((self.held, numpy.zeros(size - len(self.held), dtype=bool)))
+
+    def get_count(self, resource_name: str):
+
+        resource_id = ResourceFactory.get_resource_id(resource_name)
+        if resource_id is None or resource_id >= len(self.counts):
+            return 0
+
+        return int(self.counts[resource_id])
+
+    def add_resource(self, new_resource: Resource, item_count: int = 1):
+
+        resource_id = ResourceFactory.get_resource_id(new_resource.name)
+        if resource_id is None:
+            resource_id = ResourceFactory.add_resource_type(new_resource)
+
+        self._grow()
+        self.held[resource_id] = True
+        self.counts[resource_id] += item_count
+        self._resources = None
+
+    def assign_resources(self, new_creatable: Creatable, change: int = Inventory.CHANGE_NO_CHANGE):
+
+        items = new_creatable.get_requirement_items()
+
+        if change == Inventory.CHANGE_DEBIT and self.is_creatable(new_creatable) is False:
+            logging.debug("%s.assign_resources(): Not enough resources to create %s.", __class__, new_creatable.name)
+            EventQueue.add_event(Event(Inventory.FAIL,
+                                       "Insufficient resources in inventory to create {0}!".format(new_creatable.name),
+                                       Inventory.FAIL))
+        elif items is None:
+            logging.warning("%s.assign_resources(): Pre-requisites of %s are not recognised.", __class__,
+                            new_creatable.name)
+        else:
+            # Only change the counts of the resources that are needed
+            resource_ids, item_counts = items
+            self._resources = None
+            if change == Inventory.CHANGE_DEBIT:
+                counts = self._count_view
+                for resource_id, item_count in zip(resource_ids, item_counts):
+                    counts[resource_id] -= item_count
+            elif change != Inventory.CHANGE_NO_CHANGE:
+                self._grow()
+                for resource_id, item_count in zip(resource_ids, item_counts):
+                    self.held[resource_id] = True
+                    self.counts[resource_id] += item_count * change
+
+            logging.debug("%s.assign_resources(): Using %s to create %s.", __class__, new_creatable.pre_requisites,
+                          new_creatable.name)
+
+    def has_resources(self, requirements):
+        """Have we got at least the count of each resource in an array of counts by resource id?"""
+
+        self._grow()
+
+        return bool((self.counts >= requirements).all())
+
+    def use_resources(self, requirements, change: int = Inventory.CHANGE_DEBIT):
+        """Debit or credit an array of counts by resource id without any checks"""
+
+        self._grow()
+        self._resources = None
+
+        # Debits have already been checked so only credits can add new resources
+        if change == Inventory.CHANGE_DEBIT:
+            numpy.subtract(self.counts, requirements, out=self.counts)
+        elif change != Inventory.CHANGE_NO_CHANGE:
+            self.held[requirements > 0] = True
+            self.counts += requirements * change
+
+    def apply_changes(self, changes: dict):
+
+        if len(changes) == 0:
+            return
+
+        resource_ids = []
+        counts = []
+        for resource_name, item_count in changes.items():
+            resource_id = ResourceFactory.get_resource_id(resource_name)
+            if resource_id is None:
+                logging.warning("%s.apply_changes(): Resource %s is not recognised.", __class__, resource_name)
+                continue
+            resource_ids.append(resource_id)
+            counts.append(item_count)
+
+        self._grow()
+        self.held[resource_ids] = True
+        self.counts[resource_ids] += numpy.array(counts, dtype=numpy.int64)
+        self._resources = None
+
+    def is_creatable(self, new_creatable: Creatable):
+
+        items = new_creatable.get_requirement_items()
+        if items is None:
+            return False
+
+        # Only compare the counts of the resources that are needed
+        counts = self._count_view
+        resource_count = len(counts)
+        resource_ids, item_counts = items
+        for resource_id, item_count in zip(resource_ids, item_counts):
+            if resource_id >= resource_count or counts[resource_id] < item_count:
+                return False
+
+        return True
+
+    def are_creatable(self, creatables: list):
+        """Return an array of booleans saying which of a list of creatables can be created"""
+
+        self._grow()
+
+        key = tuple(creatables)
+        compiled = self._matrices.get(key)
+
+        # Stack the requirements of the creatables into a matrix the first time we see the list
+        if compiled is None or compiled[0] != Creatable.requirements_version or compiled[1] != len(self.counts):
+
+            requirements = [creatable.get_requirements() for creatable in creatables]
+            is_recognised = numpy.array([requirement is not None for requirement in requirements], dtype=bool)
+            matrix = numpy.stack([requirement if requirement is not None else numpy.zeros_like(self.counts)
+                                  for requirement in requirements]) if len(requirements) > 0 \
+                else numpy.zeros((0, len(self.counts)), dtype=numpy.int64)
+
+            compiled = (Creatable.requirements_version, len(self.counts), is_recognised, matrix)
+            if len(self._matrices) >= IndexedInventory.MAX_CACHED_MATRICES:
+                self._matrices.clear()
+            self._matrices[key] = compiled
+
+        version, resource_count, is_recognised, matrix = compiled
+
+        return (self.counts >= matrix).all(axis=1) & is_recognised
+
+
 class ResourceFactory:
     resources = {}
 
-    def __init__(self, file_name: str):
+    # Dense ids for the resource names in the order that they were first loaded and the resources by id
+    resource_ids = {}
+    resource_list = []
+
+    def __init__(self, file_name: str, use_cache: bool = True):
 
         self.file_name = file_name
+        self.use_cache = use_cache
 
     @staticmethod
     def get_resource(name: str):
@@ -185,38 +457,43 @@ class ResourceFactory:
         return resource
 
     @staticmethod
-    def get_resource_types():
+    def get_resource_id(name: str):
+        return ResourceFactory.resource_ids.get(name)
 
-        return list(ResourceFactory.resources.keys())
+    @staticmethod
+    def add_resource_type(new_resource: Resource):
+        """Add a resource giving it the next id if its name is new and return its id"""
 
-    def load(self):
+        ResourceFactory.resources[new_resource.name] = new_resource
 
-        print("\nLoading resources...")
+        resource_id = ResourceFactory.resource_ids.get(new_resource.name)
+        if resource_id is None:
+            resource_id = len(ResourceFactory.resource_list)
+            ResourceFactory.resource_ids[new_resource.name] = resource_id
+            ResourceFactory.resource_list.append(new_resource)
+        else:
+            ResourceFactory.resource_list[resource_id] = new_resource
 
-        # Attempt to open the file
-        with open(self.file_name, 'r') as object_file:
+        return resource_id
 
-            # Load all rows in as a dictionary
-            reader = csv.DictReader(object_file)
+    @staticmethod
+    def get_resource_types():
 
-            # For each row in the file....
-            for row in reader:
-                name = row.get("Name")
-                description = row.get("Description")
-                category = row.get("Category")
-                graphic = row.get("Graphic")
-                if graphic == "":
-                    graphic = None
+        return list(ResourceFactory.resources.keys())
 
-                new_resource = Resource(name, description, category, graphic)
-                ResourceFactory.resources[new_resource.name] = new_resource
+    def load(self):
 
-                print(str(new_resource))
+        print("\nLoading resources...")
+
+        # Get the rows of the file from the catalogue cache if it is up to date
+        for name, description, category, graphic in load_catalogue(self.file_name, parse_resources, self.use_cache):
+            if graphic == "":
+                graphic = None
 
-            # Close the file
-            object_file.close()
+            new_resource = Resource(name, description, category, graphic)
+            ResourceFactory.add_resource_type(new_resource)
 
-        print("\n{0} resources loaded.".format(len(self.resources.keys())))
+        print("{0} resources loaded.".format(len(self.resources.keys())))
 
 
 class CreatableFactoryXML(object):
@@ -224,9 +501,10 @@ class CreatableFactoryXML(object):
     Load some creatables from an XML file and store them in a dictionary
     '''
 
-    def __init__(self, file_name: str):
+    def __init__(self, file_name: str, use_cache: bool = True):
 
         self.file_name = file_name
+        self.use_cache = use_cache
         self._dom = None
         self._creatables = {}
 
@@ -238,72 +516,41 @@ class CreatableFactoryXML(object):
     def names(self):
         return list(self._creatables.keys())
 
-    # Load in the quest contained in the quest file
-    def load(self):
-
-        self._dom = parse(self.file_name)
+    # The shared creatables that placed creations are made from
+    @property
+    def templates(self):
+        return list(self._creatables.values())
 
-        assert self._dom.documentElement.tagName == "creatables"
+    # Load in the creatables contained in the creatables file
+    def load(self):
 
         logging.info("%s.load(): Loading in %s", __class__, self.file_name)
 
-        # Get a list of all quests
-        creatables = self._dom.getElementsByTagName("creatable")
-
-        # for each quest...
-        for creatable in creatables:
-
-            # Get the main tags that describe the quest
-            name = self.xml_get_node_text(creatable, "name")
-            desc = self.xml_get_node_text(creatable, "description")
-            ticks_required = self.xml_get_node_value(creatable, "ticks_required")
-
-            # ...and create a basic creatable object
-            new_creatable = Creatable(name=name, description=desc, ticks_required=ticks_required)
-
-            logging.info("%s.load(): Loading Creatable '%s'...", __class__, new_creatable.name)
-
-            # Next get a list of all of the pre-requisites
-            pre_requisites = creatable.getElementsByTagName("pre_requisites")[0]
-            resources = pre_requisites.getElementsByTagName("resource")
-
-            # For each pre-requisite resource...
-            for resource in resources:
-                # Get the basic details of the resource
-                name = self.xml_get_node_text(resource, "name")
-                count = self.xml_get_node_value(resource, "count")
-
-                new_creatable.add_pre_requisite(name, count)
-
-                logging.info("{0}.load(): adding pre-req {1} ({2})".format(__class__, name, count))
-
-            # Next get a list of all of the outputs
-            pre_requisites = creatable.getElementsByTagName("outputs")[0]
-            resources = pre_requisites.getElementsByTagName("resource")
-
-            # For each output resource...
-            for resource in resources:
-
-                # Get the basic details of the resource
-                name = self.xml_get_node_text(resource, "name")
-                count = self.xml_get_node_value(resource, "count")
-                action = self.xml_get_node_text(resource, "action")
-                if action is not None:
-                    action = "replace"
-                else:
-                    action = "inventory"
+        # Get the creatables in the file from the catalogue cache if it is up to date
+        records = load_catalogue(self.file_name, parse_creatables, self.use_cache)
 
-                new_creatable.add_output(name, count)
+        for name, description, ticks_required, production_ticks, pre_requisites, outputs in records:
 
-                logging.info("{0}.load(): adding output {1} ({2})".format(__class__, name, count))
+            # Create a basic creatable object...
+            new_creatable = Creatable(name=name,
+                                      description=description,
+                                      ticks_required=ticks_required,
+                                      production_ticks=production_ticks)
 
-            logging.info("{0}.load(): Creatable '{1}' loaded".format(__class__, new_creatable.name))
-            print(str(new_creatable))
+            # ...and fill in its pre-requisites and outputs which the parser has already added up by resource
+            new_creatable.pre_requisites = dict(pre_requisites)
+            new_creatable.output = {resource_name: count for resource_name, count, action in outputs}
+            new_creatable.output_actions = {resource_name: action if action == Creatable.OUTPUT_REPLACE
+                                            else Creatable.OUTPUT_INVENTORY
+                                            for resource_name, count, action in outputs}
 
             # Add the new creatable to the dictionary
             self._creatables[new_creatable.name] = new_creatable
 
-        self._dom.unlink()
+        Creatable.requirements_version += 1
+
+        logging.info("%s.load(): Loaded %i creatables", __class__, len(self._creatables))
+        print("{0} creatables loaded.".format(len(self._creatables)))
 
     # From a specified node get the data value
     def xml_get_node_text(self, node, tag_name: str):
@@ -337,6 +584,77 @@ class CreatableFactoryXML(object):
         return copy.deepcopy(self._creatables[name])
 
 
+class AltitudeStatistics:
+    """
+    Cached statistics for a map of altitudes.
+    The mean and variance are updated incrementally when a single altitude changes and the min and max are only
+    recalculated from the altitudes if the old extreme value was changed.
+    """
+
+    def __init__(self, altitudes):
+
+        self._altitudes = altitudes
+        self.count = altitudes.size
+        self.mean = float(altitudes.mean())
+        self._m2 = float(altitudes.var()) * self.count
+        self._min = float(altitudes.min())
+        self._max = float(altitudes.max())
+
+    # Create the statistics from already known values without reading the altitudes
+    @classmethod
+    def from_values(cls, altitudes, mean: float, variance: float, min: float, max: float):
+
+        stats = cls.__new__(cls)
+        stats._altitudes = altitudes
+        stats.count = altitudes.size
+        stats.mean = mean
+        stats._m2 = variance * stats.count
+        stats._min = min
+        stats._max = max
+
+        return stats
+
+    @property
+    def variance(self):
+        return max(0.0, self._m2 / self.count)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def min(self):
+        if self._min is None:
+            self._min = float(self._altitudes.min())
+        return self._min
+
+    @property
+    def max(self):
+        if self._max is None:
+            self._max = float(self._altitudes.max())
+        return self._max
+
+    # Update the statistics for a single altitude changing from old_value to new_value
+    def update(self, old_value: float, new_value: float):
+
+        delta = new_value - old_value
+        new_mean = self.mean + delta / self.count
+        self._m2 += delta * ((new_value - new_mean) + (old_value - self.mean))
+        self.mean = new_mean
+
+        if self._max is not None:
+            if new_value >= self._max:
+                self._max = new_value
+            elif old_value >= self._max:
+                self._max = None
+
+        if self._min is not None:
+            if new_value <= self._min:
+                self._min = new_value
+            elif old_value <= self._min:
+                self._min = None
+
+
 class WorldMap:
 
     # Topo generation controls
@@ -369,6 +687,14 @@ class WorldMap:
 
     WATER = (TILE_SEA, TILE_DEEP_SEA, TILE_SHALLOWS, TILE_FROZEN_WATER, TILE_ABYSS, TILE_WHIRLPOOL)
 
+    # Tile maps are stored as arrays of small integer codes which are indexes into this table of tile names
+    TILES = (TILE_BORDER, TILE_GRASS, TILE_SEA, TILE_DEEP_SEA, TILE_ABYSS, TILE_WHIRLPOOL, TILE_SHALLOWS,
+             TILE_FROZEN_WATER, TILE_SNOW, TILE_ICE, TILE_EARTH, TILE_SAND, TILE_SWAMP, TILE_ROCK, TILE_LAVA,
+             TILE_FOREST, TILE_SCRUB)
+    TILE_CODES = {tile: code for code, tile in enumerate(TILES)}
+    TILE_NAMES = numpy.array(TILES, dtype=object)
+    TILE_CODE_TYPE = numpy.uint8
+
     # Map of altitude to tile zone
 
     THEME_DEFAULT = "Default"
@@ -481,26 +807,82 @@ class WorldMap:
     FOOD_STRAWBERRIES = "Strawberries"
     FOOD_CARROTS = "Carrots"
 
-    def __init__(self, name: str, width: int = 50, height: int = 50):
+    # How many built theme tile maps to keep before the least recently used one is thrown away
+    MAX_CACHED_THEMES = 3
+
+    def __init__(self, name: str, width: int = 50, height: int = 50, seed: int = None):
         self.name = name
         self._width = width
         self._height = height
+        self.seed = seed
         self.map = []
-        self.maps_by_theme = {}
-        self.topo_model_pass2 = []
+        self.maps_by_theme = collections.OrderedDict()
+        self.topo_model_pass2 = numpy.zeros((0, 0))
+        self._altitude_stats = None
+        self._zone_stats = None
+        self._topology_version = 0
+        self._themes_lock = threading.Lock()
+        self._pending_themes = {}
         self.summit = (None,None)
         self.abyss = (None, None)
 
+        # Altitudes changed by set_altitude() are recorded here by (x,y) when it is not None
+        self.altitude_changes = None
+
+        # Objects e.g. PathFinders whose invalidate_at(x,y) is called when an altitude changes
+        self._change_listeners = weakref.WeakSet()
+
+    # Don't try and pickle the lock or any background theme threads
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        del state["_themes_lock"]
+        del state["_pending_themes"]
+        del state["_change_listeners"]
+
+        return state
+
+    # Convert the tile maps of worlds pickled before tile maps were stored as tile code arrays
+    def __setstate__(self, state):
+
+        # Defaults for attributes added since the world was saved
+        self.seed = None
+        self.summit = (None, None)
+        self.abyss = (None, None)
+        self._topology_version = 0
+        self.altitude_changes = None
+
+        self.__dict__.update(state)
+
+        self._altitude_stats = None
+        self._zone_stats = None
+        self._themes_lock = threading.Lock()
+        self._pending_themes = {}
+        self._change_listeners = weakref.WeakSet()
+        self.topo_model_pass2 = numpy.asarray(self.topo_model_pass2, dtype=float)
+        self.maps_by_theme = collections.OrderedDict(self.maps_by_theme)
+
+        if self.summit == (None, None):
+            self.find_landmarks()
+
+        for theme, map in self.maps_by_theme.items():
+            if isinstance(map, numpy.ndarray) is False:
+                codes = [[WorldMap.TILE_CODES[tile] for tile in column] for column in map]
+                self.maps_by_theme[theme] = numpy.array(codes, dtype=WorldMap.TILE_CODE_TYPE)
+
     def initialise(self):
 
-        # Generate a random topology model for the map
+        # Generate a random topology model for the map and find its highest and lowest points
         self.generate_topology()
+        self.find_landmarks()
 
         # Pass 1: Set tile contents based on height range
         print("Pass 1: Setting tile based on altitude...")
 
-        for theme in WorldMap.topo_zone_themes.keys():
-            self.altitude_to_tile(theme)
+        # Only the default theme is needed straight away, the other themes are built when they are first used
+        self.altitude_to_tile(WorldMap.THEME_DEFAULT)
+
+        self.raise_summit()
 
         print("Altitude Data: mean:{0:.3f} stdev:{1:.3f} min:{2:.3f} max:{3:.3f}".format(self.altitude_mean,
                                                           self.altitude_std,
@@ -523,105 +905,208 @@ class WorldMap:
             theme = WorldMap.THEME_DEFAULT
             print("theme {0} not recognised so using default".format(theme))
 
-        # Clear the map squares
-        map = [[WorldMap.TILE_EARTH for y in range(0, self._height)] for x in range(0, self._width)]
+        print(theme, str(WorldMap.get_topo_zones(theme)))
+
+        map, tile_counts = self.classify_altitudes(theme)
+
+        print("Theme {0}:Tiles assigned (count={1}: {2})".format(theme, sum(tile_counts.values()),tile_counts))
+        print("Highest point at {0}.".format(self.summit))
+        print("Lowest point at {0}.".format(self.abyss))
+
+        # Store the tile map in the map to theme cache
+        self._cache_theme_map(theme, map, self._topology_version)
+
+        return tile_counts
+
+    def classify_altitudes(self, theme : str = THEME_DEFAULT, altitudes=None, zone_stats : tuple = None,
+                           landmarks : tuple = None):
+        """
+        Return a map of tile codes for the specified theme and a count of each tile used.
+        This doesn't change the map or print anything so a background thread can call it with the altitudes,
+        zone statistics and landmarks that the game thread had when the theme was asked for.
+        """
+
+        if altitudes is None:
+            altitudes = self.topo_model_pass2
+
+        if zone_stats is None:
+            zone_stats = self.zone_stats
+
+        # Get the topo zones associated with the specified theme sorted by lowest zone first
+        topo_zone = WorldMap.get_topo_zones(theme)
+
+        a_mean, a_std = zone_stats
+        map = WorldMap.altitudes_to_tile_codes(altitudes, topo_zone, a_mean, a_std)
+
+        self.add_landmark_tiles(map, landmarks=landmarks)
+
+        # Count how many tiles of each type were assigned
+        counts = numpy.bincount(map.ravel(), minlength=len(WorldMap.TILES))
+        tile_counts = {WorldMap.TILES[code]: int(count) for code, count in enumerate(counts) if count > 0}
+
+        return map, tile_counts
+
+    # Store the location of the highest and lowest points
+    def find_landmarks(self):
+
+        altitudes = self.topo_model_pass2
+
+        x, y = numpy.unravel_index(numpy.argmax(altitudes), altitudes.shape)
+        self.summit = (int(x), int(y))
+        x, y = numpy.unravel_index(numpy.argmin(altitudes), altitudes.shape)
+        self.abyss = (int(x), int(y))
+
+    # Get a list of (tile, stdevs from the mean) for the specified theme sorted by lowest zone first
+    @staticmethod
+    def get_topo_zones(theme : str = THEME_DEFAULT):
 
-        # Get the topo zones associated with the specified theme and create a list sorted by lowest zone first
         topo_zone = []
         for key, value in WorldMap.topo_zone_themes[theme].items():
             topo_zone.append((key,value))
         topo_zone.sort(key=itemgetter(1))
 
-        print(theme, str(topo_zone))
+        return topo_zone
 
-        # Initialise a dictionary to keep track of how many tiles for each zone be assign
-        tile_counts = {}
-        tiles = list(WorldMap.topo_zone_themes[theme].keys())
-        tiles += [WorldMap.TILE_BORDER, WorldMap.TILE_ABYSS]
+    @staticmethod
+    def altitudes_to_tile_codes(altitudes, topo_zone : list, a_mean : float, a_std : float):
+        """Place every altitude in the first topo zone whose threshold is above it and return the tile codes"""
 
-        for tile in tiles:
-            tile_counts[tile] = 0
+        # Turn the zones into altitude thresholds
+        thresholds = numpy.array([a_mean + (a_std * altitude) for tile, altitude in topo_zone])
+        zone_codes = numpy.array([WorldMap.TILE_CODES[tile] for tile, altitude in topo_zone],
+                                 dtype=WorldMap.TILE_CODE_TYPE)
 
-        # Get the mean and stdev of the all altitudes
-        a_mean = self.altitude_mean
-        a_std = self.altitude_std
-        a_max = self.altitude_max
-        a_min = self.altitude_min
+        # Points above all of the thresholds go in the highest zone
+        zones = numpy.digitize(altitudes, thresholds)
+        numpy.minimum(zones, len(topo_zone) - 1, out=zones)
 
-        # loop through all points on the map
-        for y in range(0, self.height):
-            for x in range(0, self._width):
+        return zone_codes[zones]
 
-                # Get the altitude at the selected point on the map
-                a = self.get_altitude(x, y)
+    def add_landmark_tiles(self, map, x0 : int = 0, y0 : int = 0, landmarks : tuple = None):
+        """
+        Add the border, summit and abyss tiles to a map of tile codes whose top left is at (x0,y0)
+        using the map's summit and abyss unless landmarks of (summit, abyss) are given
+        """
 
-                # If this is the highest point store the location of the summit
-                if a >= a_max:
-                    self.summit = (x,y)
-                elif a <= a_min:
-                    self.abyss = (x,y)
+        if landmarks is None:
+            landmarks = (self.summit, self.abyss)
 
-                # If this is the edge of the map set to a border
-                if x == 0 or x == (self.width - 1) or y == 0 or y == (self.height - 1):
-                    tile = WorldMap.TILE_BORDER
+        summit, abyss = landmarks
 
+        width, height = map.shape
 
-                # Else use topo zones to place a point in a zone based on its altitude
-                else:
-                    for tile, altitude in topo_zone:
-                        # If the altitude is less than the zone then use the zone and break.
-                        if a < (a_mean + (a_std * altitude)):
-                            break
+        # The edges of the map are a border
+        border = WorldMap.TILE_CODES[WorldMap.TILE_BORDER]
+        if x0 == 0:
+            map[0, :] = border
+        if x0 + width == self._width:
+            map[-1, :] = border
+        if y0 == 0:
+            map[:, 0] = border
+        if y0 + height == self._height:
+            map[:, -1] = border
 
-                map[x][y] = tile
+        # Make the summit a lava tile surrounded by snow and the deepest tile a whirlpool surrounded by abyss
+        landmarks = ((summit, WorldMap.TILE_LAVA, WorldMap.TILE_SNOW),
+                     (abyss, WorldMap.TILE_WHIRLPOOL, WorldMap.TILE_ABYSS))
 
-                tile_counts[tile] += 1
+        for (x, y), tile, surrounding_tile in landmarks:
 
+            if x is None:
+                continue
 
-        # Make the summit a lava tile
-        x,y = self.summit
-        map[x][y] = WorldMap.TILE_LAVA
+            for ax, ay in HexagonMaths.adjacent(x, y):
+                if 0 <= ax - x0 < width and 0 <= ay - y0 < height:
+                    map[ax - x0, ay - y0] = WorldMap.TILE_CODES[surrounding_tile]
 
-        # Raise the summit by a %
-        a = self.get_altitude(x, y)
-        a *= 1.05
-        self.set_altitude(a, x, y)
+            if 0 <= x - x0 < width and 0 <= y - y0 < height:
+                map[x - x0, y - y0] = WorldMap.TILE_CODES[tile]
 
-        # Summit surrounded by Snow
-        adjacent = HexagonMaths.adjacent(x,y)
-        for x,y in adjacent:
-            if self.is_valid_xy(x,y):
+    # Get the tile map for a theme building it if it is not in the cache
+    def get_theme_map(self, theme : str = THEME_DEFAULT):
 
-                # Raise the altitude  by a %
-                a = self.get_altitude(x, y)
-                a *= 1.03
-                self.set_altitude(a, x, y)
+        if theme not in WorldMap.topo_zone_themes.keys():
+            theme = WorldMap.THEME_DEFAULT
 
-                # Make the tile snow
-                tile = WorldMap.TILE_SNOW
-                map[x][y] = tile
-                tile_counts[tile] += 1
+        with self._themes_lock:
+            map = self.maps_by_theme.get(theme)
+            if map is not None:
+                self.maps_by_theme.move_to_end(theme)
+                return map
+            pending = self._pending_themes.get(theme)
+
+        # If the theme is already being built in the background then wait for it...
+        if pending is not None:
+            pending.join()
+            with self._themes_lock:
+                map = self.maps_by_theme.get(theme)
+
+        # ...else build it now
+        if map is None:
+            self.altitude_to_tile(theme)
+            with self._themes_lock:
+                map = self.maps_by_theme[theme]
 
-        # Make the deepest tile an abyss
-        x,y = self.abyss
-        map[x][y] = WorldMap.TILE_WHIRLPOOL
+        return map
 
-        # Deepest tile surrounded by abyss
-        adjacent = HexagonMaths.adjacent(x,y)
-        for x,y in adjacent:
-            if self.is_valid_xy(x,y):
-                tile = WorldMap.TILE_ABYSS
-                map[x][y] = tile
-                tile_counts[tile] += 1
+    # Start building the tile map for a theme in the background so that it is ready when it is needed
+    def prefetch_theme(self, theme : str):
 
-        # Store the tile map in the map to theme dictionary
-        self.maps_by_theme[theme] = map
+        if theme not in WorldMap.topo_zone_themes.keys():
+            return
 
-        print("Theme {0}:Tiles assigned (count={1}: {2})".format(theme, sum(tile_counts.values()),tile_counts))
-        print("Highest point at {0}.".format(self.summit))
-        print("Lowest point at {0}.".format(self.abyss))
+        with self._themes_lock:
+            if theme in self.maps_by_theme.keys() or theme in self._pending_themes.keys():
+                return
+
+            # Everything that the theme is built from is taken now on the game thread
+            thread = threading.Thread(target=self._build_theme_map,
+                                      args=(theme, self._topology_version, self.topo_model_pass2,
+                                            self.zone_stats, (self.summit, self.abyss)),
+                                      daemon=True)
+            self._pending_themes[theme] = thread
+
+        thread.start()
+
+    def _build_theme_map(self, theme : str, version : int, altitudes, zone_stats : tuple, landmarks : tuple):
+
+        try:
+            map, tile_counts = self.classify_altitudes(theme, altitudes, zone_stats, landmarks)
+            self._cache_theme_map(theme, map, version)
+        finally:
+            with self._themes_lock:
+                del self._pending_themes[theme]
+
+    # Add a tile map to the theme cache unless the topology has changed since it was built
+    def _cache_theme_map(self, theme : str, map, version : int):
+
+        with self._themes_lock:
+            if version != self._topology_version:
+                return
+
+            self.maps_by_theme[theme] = map
+            self.maps_by_theme.move_to_end(theme)
+
+            # Tile maps memory mapped from a world file are paged in from disk so only built maps are counted
+            built_themes = [name for name, map in self.maps_by_theme.items()
+                            if isinstance(map, numpy.memmap) is False]
+            while len(built_themes) > WorldMap.MAX_CACHED_THEMES:
+                del self.maps_by_theme[built_themes.pop(0)]
+
+    def raise_summit(self):
+        """Raise the summit and the tiles around it by a %"""
+
+        x, y = self.summit
+
+        a = self.get_altitude(x, y)
+        a *= 1.05
+        self.set_altitude(a, x, y)
 
-        return
+        for x, y in HexagonMaths.adjacent(x, y):
+            if self.is_valid_xy(x, y):
+                a = self.get_altitude(x, y)
+                a *= 1.03
+                self.set_altitude(a, x, y)
 
     def set_sea_level(self):
 
@@ -638,6 +1123,21 @@ class WorldMap:
                 #     self.set_altitude(0, x, y)
 
     def generate_topology(self):
+        """Build a random map of altitudes using the numpy topology generator"""
+
+        print("Generating {0}x{1} topology (seed={2})...".format(self._width, self._height, self.seed))
+
+        generator = TopologyGenerator(self._width, self._height,
+                                      seed=self.seed,
+                                      min_altitude=WorldMap.MIN_ALTITUDE,
+                                      max_altitude=WorldMap.MAX_ALTITUDE,
+                                      max_slope=WorldMap.MAX_SLOPE,
+                                      max_slope_delta=WorldMap.MAX_SLOPE_DELTA,
+                                      min_altitude_clip_factor=WorldMap.MIN_ALTITUDE_CLIP_FACTOR)
+
+        self.set_topology(generator.generate())
+
+    def generate_topology_python(self):
         """Build a random map of altitudes using a multi-pass algorithm"""
 
         # Clear the topo model
@@ -716,7 +1216,7 @@ class WorldMap:
         threshold = avg + (std * WorldMap.MIN_ALTITUDE_CLIP_FACTOR)
         print("Pass 3: applying altitude floor of {0:.3}...".format(threshold))
         a[a != 0] -= threshold
-        self.topo_model_pass2 = a.tolist()
+        self.set_topology(a)
 
 
     @property
@@ -745,19 +1245,32 @@ class WorldMap:
         if self.is_valid_xy(x, y) is False:
             raise Exception("Trying to get tile at ({0},{1}) which is outside of the world!".format(x, y))
 
-        if theme not in WorldMap.topo_zone_themes.keys():
-            theme = WorldMap.THEME_DEFAULT
+        map = self.get_theme_map(theme)
 
-        map = self.maps_by_theme[theme]
+        return WorldMap.TILES[map[x, y]]
 
-        return map[x][y]
+    # Get the tile codes for a rectangle of the map e.g. a viewport
+    # Use WorldMap.TILE_NAMES[codes] to convert the codes to tile names
+    def get_tile_codes(self, x: int, y: int, width: int, height: int, theme: str = THEME_DEFAULT):
 
-    def get_range(self, x: int, y: int, width: int, height: int):
+        map = self.get_theme_map(theme)
+
+        # Clip the requested rectangle to the area of the map
+        x0 = max(0, x)
+        y0 = max(0, y)
+        x1 = min(self._width, x + width)
+        y1 = min(self._height, y + height)
+
+        return map[x0:x1, y0:y1]
 
-        a = numpy.array(self.topo_model_pass2, order="F")
-        b = a[x:x + width, y:y + height]
+    # Get the altitudes for a rectangle of the map clipped to the area of the map
+    def get_altitudes(self, x: int, y: int, width: int, height: int):
 
-        return b.tolist()
+        return self.topo_model_pass2[max(0, x):max(0, x + width), max(0, y):max(0, y + height)]
+
+    def get_range(self, x: int, y: int, width: int, height: int):
+
+        return self.get_altitudes(x, y, width, height).tolist()
 
     # Set a map square at the specified co-ordinates with the specified object
     def set(self, x: int, y: int, c):
@@ -771,29 +1284,83 @@ class WorldMap:
     def get_altitude(self, x: int, y: int):
         if self.is_valid_xy(x, y) is False:
             raise Exception("Trying to get altitude at ({0},{1}) which is outside of the world!".format(x, y))
-        return self.topo_model_pass2[x][y]
+        return self.topo_model_pass2[x, y]
 
     # Set the altitude at the specified co-ordinates
     def set_altitude(self, new_altitude: float, x: int, y: int):
         if self.is_valid_xy(x, y) is False:
             raise Exception("Trying to set altitude at ({0},{1}) which is outside of the world!".format(x, y))
-        self.topo_model_pass2[x][y] = new_altitude
+
+        # Keep the cached altitude statistics up to date
+        if self._altitude_stats is not None:
+            self._altitude_stats.update(float(self.topo_model_pass2[x, y]), new_altitude)
+
+        self.topo_model_pass2[x, y] = new_altitude
+
+        if self.altitude_changes is not None:
+            self.altitude_changes[(x, y)] = new_altitude
+
+        self.notify_change_listeners(x, y)
+
+    # Register an object whose invalidate_at(x,y) is called when the hexagon at (x,y) changes.
+    # Listeners are only weakly referenced so they don't need removing.
+    def add_change_listener(self, listener):
+        self._change_listeners.add(listener)
+
+    def notify_change_listeners(self, x: int, y: int):
+        for listener in list(self._change_listeners):
+            listener.invalidate_at(x, y)
+
+    # Replace the whole altitude model and throw away the cached statistics and tile maps
+    def set_topology(self, altitudes):
+        with self._themes_lock:
+            self.topo_model_pass2 = numpy.asarray(altitudes, dtype=float)
+            self._altitude_stats = None
+            self._zone_stats = None
+            self._topology_version += 1
+            self.maps_by_theme.clear()
+
+    # The shared table of hexagon neighbours for the size of this map
+    @property
+    def neighbours(self):
+        return HexagonNeighbours.for_map(self.width, self.height)
+
+    # A number that changes every time the whole altitude model is replaced
+    @property
+    def topology_version(self):
+        return self._topology_version
+
+    # Get the altitude statistics which are calculated once per topology
+    @property
+    def altitude_stats(self):
+        if self._altitude_stats is None:
+            self._altitude_stats = AltitudeStatistics(self.topo_model_pass2)
+        return self._altitude_stats
+
+    # Get the (mean, stdev) used to place altitudes in topo zones.
+    # These are pinned when they are first used so that every theme uses the same thresholds as the
+    # default theme, even after altitudes are changed e.g. by raise_summit()
+    @property
+    def zone_stats(self):
+        if self._zone_stats is None:
+            self._zone_stats = (self.altitude_mean, self.altitude_std)
+        return self._zone_stats
 
     @property
     def altitude_min(self):
-        return numpy.min(self.topo_model_pass2)
+        return self.altitude_stats.min
 
     @property
     def altitude_max(self):
-        return numpy.max(self.topo_model_pass2)
+        return self.altitude_stats.max
 
     @property
     def altitude_mean(self):
-        return numpy.mean(self.topo_model_pass2)
+        return self.altitude_stats.mean
 
     @property
     def altitude_std(self):
-        return numpy.std(self.topo_model_pass2)
+        return self.altitude_stats.std
 
     # Add objects to random tiles
     def add_objects(self, object_type, count: int = 20):
@@ -837,33 +1404,59 @@ class HexagonMaths:
         SOUTH_WEST:(-1,1)
     }
 
+    # The directions in clockwise order starting from north
+    DIRECTIONS = (NORTH, NORTH_EAST, SOUTH_EAST, SOUTH, SOUTH_WEST, NORTH_WEST)
+
+    # dx,dy vectors to hexagon vector names dictionaries
+    XY_TO_HEX_EVEN = {vector: direction for direction, vector in HEX_TO_XY_EVEN.items()}
+    XY_TO_HEX_ODD = {vector: direction for direction, vector in HEX_TO_XY_ODD.items()}
+
+    # The dx and dy of each direction in DIRECTIONS order indexed by [x % 2][direction]
+    DX = numpy.array([[HEX_TO_XY_EVEN[NORTH][0], HEX_TO_XY_EVEN[NORTH_EAST][0], HEX_TO_XY_EVEN[SOUTH_EAST][0],
+                       HEX_TO_XY_EVEN[SOUTH][0], HEX_TO_XY_EVEN[SOUTH_WEST][0], HEX_TO_XY_EVEN[NORTH_WEST][0]],
+                      [HEX_TO_XY_ODD[NORTH][0], HEX_TO_XY_ODD[NORTH_EAST][0], HEX_TO_XY_ODD[SOUTH_EAST][0],
+                       HEX_TO_XY_ODD[SOUTH][0], HEX_TO_XY_ODD[SOUTH_WEST][0], HEX_TO_XY_ODD[NORTH_WEST][0]]])
+    DY = numpy.array([[HEX_TO_XY_EVEN[NORTH][1], HEX_TO_XY_EVEN[NORTH_EAST][1], HEX_TO_XY_EVEN[SOUTH_EAST][1],
+                       HEX_TO_XY_EVEN[SOUTH][1], HEX_TO_XY_EVEN[SOUTH_WEST][1], HEX_TO_XY_EVEN[NORTH_WEST][1]],
+                      [HEX_TO_XY_ODD[NORTH][1], HEX_TO_XY_ODD[NORTH_EAST][1], HEX_TO_XY_ODD[SOUTH_EAST][1],
+                       HEX_TO_XY_ODD[SOUTH][1], HEX_TO_XY_ODD[SOUTH_WEST][1], HEX_TO_XY_ODD[NORTH_WEST][1]]])
+
     @staticmethod
     def adjacent(x : int, y : int):
         """ Return list of tiles adjacent to the specified tile"""
-        adjacent_tiles = []
 
         if x % 2 == 0:
             vectors = HexagonMaths.HEX_TO_XY_EVEN.values()
         else:
             vectors = HexagonMaths.HEX_TO_XY_ODD.values()
 
-        for dx,dy in vectors:
-            adjacent_tiles.append(((x+dx), (y+dy)))
+        return [((x + dx), (y + dy)) for dx, dy in vectors]
+
+    @staticmethod
+    def adjacent_arrays(xs, ys):
+        """ Return (n,6) arrays of the x and y of the tiles adjacent to each of n tiles in DIRECTIONS order"""
+
+        xs = numpy.asarray(xs)
+        ys = numpy.asarray(ys)
+        parity = xs % 2
 
-        return adjacent_tiles
+        return xs[:, None] + HexagonMaths.DX[parity], ys[:, None] + HexagonMaths.DY[parity]
 
     @staticmethod
     def is_adjacent(ax : int, ay : int, bx : int, by:int):
         " Is a specified position (ax,ay) adjacent to (bx,by)?"
 
-        return (bx,by) in HexagonMaths.adjacent(ax, ay)
+        if ax % 2 == 0:
+            return (bx - ax, by - ay) in HexagonMaths.XY_TO_HEX_EVEN
+        else:
+            return (bx - ax, by - ay) in HexagonMaths.XY_TO_HEX_ODD
 
     @staticmethod
     def move_hex(origin_x : int, origin_y : int, direction : str):
         """ Return a target (x,y) position based on a origin and Hexagaon direction vector """
 
-        if direction not in HexagonMaths.HEX_TO_XY.keys():
-            raise Exception("{0}.move(): {0} is not a valid direction!".format(direction))
+        if direction not in HexagonMaths.HEX_TO_XY_EVEN.keys():
+            raise Exception("move_hex(): {0} is not a valid direction!".format(direction))
 
         if origin_x % 2 == 0:
             vectors = HexagonMaths.HEX_TO_XY_EVEN
@@ -878,26 +1471,208 @@ class HexagonMaths:
     def get_direction(origin_x : int, origin_y, target_x : int, target_y):
         """ Return the hexagon vector name from an origin to a target"""
 
+        if origin_x % 2 == 0:
+            vectors = HexagonMaths.XY_TO_HEX_EVEN
+        else:
+            vectors = HexagonMaths.XY_TO_HEX_ODD
+
+        # Look up the xy vector to get to the target from the origin
+        direction = vectors.get((target_x - origin_x, target_y - origin_y))
+
         # If the origin and the target are not adjacent then raise an exception
-        if HexagonMaths.is_adjacent(origin_x, origin_y, target_x, target_y) is False:
+        if direction is None:
             raise Exception("Origin and target are not adjacent!")
 
-        if origin_x % 2 == 0:
-            vectors = HexagonMaths.HEX_TO_XY_EVEN
-        else:
-            vectors = HexagonMaths.HEX_TO_XY_ODD
+        return direction
+
+    # Cube coordinates (q,r,s) where q + r + s = 0 make distances and areas simple to work out.
+    # The map is laid out with odd columns pushed down half a hexagon so q is x and r is y adjusted for the
+    # column offset. All of the cube methods work with arrays of co-ordinates as well as single ones.
 
-        # Calculate the xy vector to get to the target from the origin
-        dx = target_x - origin_x
-        dy = target_y - origin_y
+    # The (dq,dr) cube vectors in the order that the sides of a ring are walked
+    CUBE_VECTORS = numpy.array([(1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1)])
+
+    @staticmethod
+    def to_cube(x, y):
+        """ Return the cube co-ordinates (q,r,s) of an (x,y) position"""
 
-        # If the xy vector in the Hex to xy dictionary...
-        if (dx,dy) in vectors.values():
+        q = x
+        r = y - (x - (x & 1)) // 2
 
-            # Find the xy vector in the look-up dictionary and return the Hex vector name
-            pos = list(vectors.values()).index((dx, dy))
-            return list(vectors.keys())[pos]
+        return q, r, -q - r
+
+    @staticmethod
+    def from_cube(q, r):
+        """ Return the (x,y) position of the cube co-ordinates (q,r)"""
+
+        return q, r + (q - (q & 1)) // 2
+
+    @staticmethod
+    def distance(ax, ay, bx, by):
+        """ Return the number of hexagon steps between (ax,ay) and (bx,by)"""
+
+        aq, ar, a_s = HexagonMaths.to_cube(ax, ay)
+        bq, br, b_s = HexagonMaths.to_cube(bx, by)
+
+        return numpy.maximum(numpy.maximum(abs(aq - bq), abs(ar - br)), abs(a_s - b_s))
+
+    @staticmethod
+    def ring(x : int, y : int, radius : int, width : int = None, height : int = None):
+        """
+        Return arrays of the x and y of the hexagons that are exactly radius steps from (x,y).
+        If a map width and height are specified then only the hexagons on the map are returned.
+        """
+
+        q, r, s = HexagonMaths.to_cube(x, y)
+
+        if radius == 0:
+            qs = numpy.array([q])
+            rs = numpy.array([r])
 
-        # Else we couldn't find a bame for this vector
         else:
-            return "???"
+            # Each side of the ring starts at a corner and walks radius steps along a cube vector
+            vectors = HexagonMaths.CUBE_VECTORS
+            corners = numpy.cumsum(numpy.vstack((vectors[4:5], vectors[:5])), axis=0) * radius
+            steps = numpy.arange(radius)
+
+            qs = (q + corners[:, 0, None] + vectors[:, 0, None] * steps).ravel()
+            rs = (r + corners[:, 1, None] + vectors[:, 1, None] * steps).ravel()
+
+        return HexagonMaths._clip(*HexagonMaths.from_cube(qs, rs), width, height)
+
+    @staticmethod
+    def in_range(x : int, y : int, radius : int, width : int = None, height : int = None):
+        """
+        Return arrays of the x and y of the hexagons that are radius steps or less from (x,y).
+        If a map width and height are specified then only the hexagons on the map are returned.
+        """
+
+        q, r, s = HexagonMaths.to_cube(x, y)
+
+        dq, dr = numpy.mgrid[-radius:radius + 1, -radius:radius + 1]
+        is_in_range = abs(dq + dr) <= radius
+
+        return HexagonMaths._clip(*HexagonMaths.from_cube(q + dq[is_in_range], r + dr[is_in_range]), width, height)
+
+    @staticmethod
+    def _clip(xs, ys, width : int = None, height : int = None):
+
+        if width is not None and height is not None:
+            on_map = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            xs = xs[on_map]
+            ys = ys[on_map]
+
+        return xs, ys
+
+
+class HexagonNeighbours:
+    """
+    A precomputed table of the six neighbours of every hexagon on a width x height map.
+
+    Hexagons are referred to by their flat index x * height + y, which is their position in a flattened
+    (width, height) array such as WorldMap.topo_model_pass2. neighbours[i, d] is the flat index of the neighbour
+    of hexagon i in direction HexagonMaths.DIRECTIONS[d] or NO_NEIGHBOUR if that neighbour is off the map, and
+    mask[i, d] is True if the neighbour is on the map. Tables use 30 bytes per hexagon - 6 int32 neighbour
+    indexes and 6 bool mask entries.
+    """
+
+    NO_NEIGHBOUR = -1
+
+    # How many tables to keep for different map sizes
+    MAX_CACHED_TABLES = 4
+
+    _tables = collections.OrderedDict()
+    _tables_lock = threading.Lock()
+
+    def __init__(self, width: int, height: int):
+
+        self.width = width
+        self.height = height
+
+        xs, ys = numpy.divmod(numpy.arange(width * height, dtype=numpy.int64), height)
+        neighbour_xs, neighbour_ys = HexagonMaths.adjacent_arrays(xs, ys)
+
+        self.mask = (neighbour_xs >= 0) & (neighbour_xs < width) & (neighbour_ys >= 0) & (neighbour_ys < height)
+        self.neighbours = numpy.where(self.mask,
+                                      neighbour_xs * height + neighbour_ys,
+                                      HexagonNeighbours.NO_NEIGHBOUR).astype(numpy.int32)
+
+    # Get the shared table for a map size building it if needed
+    @staticmethod
+    def for_map(width: int, height: int):
+
+        with HexagonNeighbours._tables_lock:
+            table = HexagonNeighbours._tables.get((width, height))
+            if table is None:
+                table = HexagonNeighbours(width, height)
+                HexagonNeighbours._tables[(width, height)] = table
+                while len(HexagonNeighbours._tables) > HexagonNeighbours.MAX_CACHED_TABLES:
+                    HexagonNeighbours._tables.popitem(last=False)
+            else:
+                HexagonNeighbours._tables.move_to_end((width, height))
+
+        return table
+
+    @property
+    def size(self):
+        return self.width * self.height
+
+    def index(self, x, y):
+        """ Return the flat index of (x,y) - x and y can be arrays"""
+        return x * self.height + y
+
+    def xy(self, index):
+        """ Return the (x,y) of a flat index - index can be an array"""
+        return divmod(index, self.height)
+
+    def get_neighbours(self, x: int, y: int):
+        """ Return an array of the flat indexes of the neighbours of (x,y) that are on the map"""
+
+        index = x * self.height + y
+        return self.neighbours[index][self.mask[index]]
+
+    def get_neighbours_batch(self, indexes):
+        """ Return the (n,6) neighbours and mask of an array of n flat indexes"""
+
+        indexes = numpy.asarray(indexes)
+        return self.neighbours[indexes], self.mask[indexes]
+
+    def get_neighbours_xy_batch(self, xs, ys):
+        """ Return (n,6) arrays of the neighbour x, neighbour y and mask of arrays of n x and y"""
+
+        neighbours, mask = self.get_neighbours_batch(self.index(numpy.asarray(xs), numpy.asarray(ys)))
+        neighbour_xs, neighbour_ys = numpy.divmod(neighbours, self.height)
+        neighbour_xs[~mask] = HexagonNeighbours.NO_NEIGHBOUR
+        neighbour_ys[~mask] = HexagonNeighbours.NO_NEIGHBOUR
+
+        return neighbour_xs, neighbour_ys, mask
+
+    def is_adjacent(self, a: int, b: int):
+        """ Are the hexagons with flat indexes a and b adjacent?"""
+        return b >= 0 and bool((self.neighbours[a] == b).any())
+
+    def is_adjacent_batch(self, a, b):
+        """ Return a boolean array of whether each pair of flat indexes in arrays a and b are adjacent"""
+
+        b = numpy.asarray(b)
+        return ((self.neighbours[numpy.asarray(a)] == b[:, None]) & (b[:, None] >= 0)).any(axis=1)
+
+    def get_direction(self, a: int, b: int):
+        """ Return the hexagon vector name from flat index a to flat index b or None if they are not adjacent"""
+
+        directions = numpy.flatnonzero(self.neighbours[a] == b)
+        if b < 0 or len(directions) == 0:
+            return None
+
+        return HexagonMaths.DIRECTIONS[directions[0]]
+
+    def gather(self, values, fill=0):
+        """
+        Return an (n,6) array of the values of the neighbours of every hexagon from a (width, height) array of
+        values with fill in place of neighbours that are off the map
+        """
+
+        gathered = numpy.ravel(values)[self.neighbours]
+        gathered[~self.mask] = fill
+
+        return gathered
@@ -0,0 +1,148 @@
+'''
+    This module contains the compiled cache of the game's catalogue files.
+
+    Catalogue files - creatables.xml and resources.csv - are parsed into plain tuples of records which are written
+    to a marshal cache file next to the source file. Later loads read the records straight from the cache, which
+    takes a few milliseconds however many records there are, as long as the cache matches the source file.
+
+    A cache matches its source file if the source file has the same modification time and size as when the cache
+    was written or, failing that, the same SHA-1 hash e.g. after a fresh checkout touches every file.
+'''
+
+import csv
+import hashlib
+import logging
+import marshal
+import os
+import xml.etree.ElementTree
+
+from .utils import is_numeric
+
+VERSION = 1
+FILE_EXTENSION = ".cache"
+
+
+def load_catalogue(file_name: str, parser, use_cache: bool = True):
+    """
+    Return the records from a catalogue file, using its cache file if it matches the catalogue file and
+    calling parser(file_name) to parse the file and writing a new cache file if it doesn't
+    """
+
+    cache_file_name = file_name + FILE_EXTENSION
+    stat = os.stat(file_name)
+
+    if use_cache is True:
+        records = read_cache(file_name, cache_file_name, stat)
+        if records is not None:
+            logging.info("load_catalogue(): Loaded %i records from %s", len(records), cache_file_name)
+            return records
+
+    records = parser(file_name)
+
+    if use_cache is True:
+        write_cache(cache_file_name, stat, get_file_hash(file_name), records)
+
+    return records
+
+
+def get_file_hash(file_name: str):
+
+    with open(file_name, "rb") as source_file:
+        return hashlib.sha1(source_file.read()).digest()
+
+
+def read_cache(file_name: str, cache_file_name: str, stat):
+    """Return the records in a cache file or None if there isn't a cache file that matches the source file"""
+
+    try:
+        # Reading the whole file and then unmarshalling it is much faster than unmarshalling from the file
+        with open(cache_file_name, "rb") as cache_file:
+            version, mtime, size, file_hash, records = marshal.loads(cache_file.read())
+    except (OSError, EOFError, ValueError, TypeError) as err:
+        if os.path.exists(cache_file_name) is True:
+            logging.warning("read_cache(): Ignoring unreadable cache %s: %s", cache_file_name, str(err))
+        return None
+
+    if version != VERSION:
+        return None
+
+    # Only hash the source file if it looks like it has changed
+    if mtime != stat.st_mtime_ns or size != stat.st_size:
+        if file_hash != get_file_hash(file_name):
+            return None
+
+        # The file hasn't really changed so save hashing it next time
+        write_cache(cache_file_name, stat, file_hash, records)
+
+    return records
+
+
+def write_cache(cache_file_name: str, stat, file_hash: bytes, records: tuple):
+
+    temp_file_name = cache_file_name + ".tmp"
+
+    # Write a new file and swap it in so that a half written cache is never read
+    try:
+        with open(temp_file_name, "wb") as cache_file:
+            marshal.dump((VERSION, stat.st_mtime_ns, stat.st_size, file_hash, records), cache_file)
+        os.replace(temp_file_name, cache_file_name)
+    except OSError as err:
+        logging.warning("write_cache(): Unable to write cache %s: %s", cache_file_name, str(err))
+
+
+def parse_creatables(file_name: str):
+    """
+    Parse a creatables XML file into a tuple of records of
+    (name, description, ticks required, production ticks, pre-requisites, outputs)
+    where pre-requisites are (resource name, count) and outputs are (resource name, count, action)
+    with the counts of any resource that is listed more than once added together
+    """
+
+    records = []
+
+    def get_text(element, tag_name: str):
+        child = element.find(tag_name)
+        return child.text if child is not None else None
+
+    def get_value(element, tag_name: str):
+        return is_numeric(get_text(element, tag_name))
+
+    def get_resources(element, path: str):
+        resources = {}
+        for resource in element.iterfind(path):
+            name = get_text(resource, "name")
+            count, action = resources.get(name, (0, None))
+            resources[name] = (count + get_value(resource, "count"), get_text(resource, "action"))
+        return resources
+
+    # Stream through the file and throw each creatable away once it has been read
+    for event, element in xml.etree.ElementTree.iterparse(file_name, events=("end",)):
+
+        if element.tag != "creatable":
+            continue
+
+        pre_requisites = tuple((name, count)
+                               for name, (count, action) in get_resources(element, "pre_requisites/resource").items())
+
+        outputs = tuple((name, count, action)
+                        for name, (count, action) in get_resources(element, "outputs/resource").items())
+
+        records.append((get_text(element, "name"),
+                        get_text(element, "description"),
+                        get_value(element, "ticks_required"),
+                        get_value(element, "production_ticks"),
+                        pre_requisites,
+                        outputs))
+
+        element.clear()
+
+    return tuple(records)
+
+
+def parse_resources(file_name: str):
+    """Parse a resources CSV file into a tuple of records of (name, description, category, graphic)"""
+
+    with open(file_name, 'r') as object_file:
+        reader = csv.DictReader(object_file)
+        return tuple((row.get("Name"), row.get("Description"), row.get("Category"), row.get("Graphic"))
+                     for row in reader)
@@ -0,0 +1,409 @@
+'''
+    This module contains a WorldMap for worlds that are too big to hold in memory:
+    - MapChunk - a fixed size square of altitudes and theme tile maps
+    - ChunkedWorldMap - a WorldMap that generates chunks on demand, keeps them in an LRU cache and
+      spills evicted chunks to disk
+
+    A chunked map is saved as a chunks file which has the seed, size and chunk settings that the map is generated
+    from and the altitudes of the chunks that have been changed since they were generated.
+'''
+
+import collections
+import json
+import logging
+import os
+import shutil
+import tempfile
+import weakref
+import zipfile
+
+import numpy
+
+from .building_blocks import AltitudeStatistics
+from .building_blocks import WorldMap
+from .topology import NoiseTopologyGenerator
+from .world_file import WorldFileError
+
+CHUNKS_FILE_EXTENSION = ".kchunks"
+
+CHUNK_KEY_PREFIX = "chunk_"
+
+
+class MapChunk:
+
+    def __init__(self, altitudes):
+        self.altitudes = altitudes
+        self.maps_by_theme = {}
+        self.is_dirty = False
+
+
+class ChunkedWorldMap(WorldMap):
+    """
+    A WorldMap that is split into square chunks of CHUNK_SIZE x CHUNK_SIZE hexagons.
+
+    Chunk altitudes are built when they are first used with seamless noise so any chunk can be generated on
+    its own. The altitude statistics used to place tiles in topo zones are estimated from a sample of chunks
+    so that every chunk uses the same thresholds. Chunks are kept in an LRU cache of MAX_CACHED_CHUNKS and
+    when a changed chunk is evicted it is written to a spill directory so that the changes are not lost.
+    Unchanged chunks are just thrown away and generated again when they are next used.
+    """
+
+    CHUNK_SIZE = 64
+    MAX_CACHED_CHUNKS = 256
+
+    # How many chunks across and down the map to sample when estimating the altitude statistics
+    SAMPLE_CHUNKS = 3
+
+    def __init__(self, name: str, width: int = 50, height: int = 50, seed: int = None, spill_dir: str = None):
+
+        super(ChunkedWorldMap, self).__init__(name, width, height, seed)
+
+        # We never hold the whole altitude model in memory
+        self.topo_model_pass2 = None
+
+        self._generator = None
+        self._altitude_offset = 0.0
+        self._chunks = collections.OrderedDict()
+        self._spilled_chunks = set()
+
+        if spill_dir is None:
+            spill_dir = tempfile.mkdtemp(prefix="kingdom_chunks_")
+            self._cleanup = weakref.finalize(self, shutil.rmtree, spill_dir, True)
+
+        self._spill_dir = spill_dir
+
+    def __getstate__(self):
+        raise Exception("Chunked world map {0} can't be pickled!".format(self.name))
+
+    def initialise(self):
+
+        self._generator = NoiseTopologyGenerator(seed=self.seed,
+                                                 min_altitude=WorldMap.MIN_ALTITUDE,
+                                                 max_altitude=WorldMap.MAX_ALTITUDE)
+
+        print("Generating {0}x{1} chunked topology (seed={2})...".format(self._width, self._height,
+                                                                         self._generator.seed))
+
+        # Throw away any chunks from the last topology
+        self._chunks.clear()
+        for x, y in self._spilled_chunks:
+            os.remove(self._chunk_file_name(x, y))
+        self._spilled_chunks.clear()
+        self._topology_version += 1
+
+        self.sample_altitudes()
+
+        print("Altitude Data: mean:{0:.3f} stdev:{1:.3f} min:{2:.3f} max:{3:.3f}".format(self.altitude_mean,
+                                                                                          self.altitude_std,
+                                                                                          self.altitude_min,
+                                                                                          self.altitude_max))
+
+        self.raise_summit()
+
+    def sample_altitudes(self):
+        """Estimate the altitude statistics, summit and abyss from chunks spread across the map"""
+
+        chunks_across = (self._width + ChunkedWorldMap.CHUNK_SIZE - 1) // ChunkedWorldMap.CHUNK_SIZE
+        chunks_down = (self._height + ChunkedWorldMap.CHUNK_SIZE - 1) // ChunkedWorldMap.CHUNK_SIZE
+
+        sample_across = numpy.linspace(0, chunks_across - 1, ChunkedWorldMap.SAMPLE_CHUNKS).astype(int).tolist()
+        sample_down = numpy.linspace(0, chunks_down - 1, ChunkedWorldMap.SAMPLE_CHUNKS).astype(int).tolist()
+
+        samples = []
+        for cx in sorted(set(sample_across)):
+            for cy in sorted(set(sample_down)):
+                x, y, width, height = self._chunk_rect(cx, cy)
+                samples.append((x, y, self._generator.generate(x, y, width, height)))
+
+        sample = numpy.concatenate([altitudes.ravel() for x, y, altitudes in samples])
+
+        # Shift altitudes to create a floor in the topology at level 0
+        self._altitude_offset = sample.mean() + (sample.std() * WorldMap.MIN_ALTITUDE_CLIP_FACTOR)
+        self._altitude_stats = AltitudeStatistics(sample - self._altitude_offset)
+        self._zone_stats = None
+
+        # The summit and the abyss are the highest and lowest points that were sampled
+        highest = max(samples, key=lambda sample: sample[2].max())
+        lowest = min(samples, key=lambda sample: sample[2].min())
+
+        x, y, altitudes = highest
+        dx, dy = numpy.unravel_index(numpy.argmax(altitudes), altitudes.shape)
+        self.summit = (x + int(dx), y + int(dy))
+
+        x, y, altitudes = lowest
+        dx, dy = numpy.unravel_index(numpy.argmin(altitudes), altitudes.shape)
+        self.abyss = (x + int(dx), y + int(dy))
+
+    @property
+    def altitude_stats(self):
+        return self._altitude_stats
+
+    @property
+    def chunk_count(self):
+        return len(self._chunks)
+
+    def get_chunk(self, cx: int, cy: int):
+        """Get a chunk from the cache, loading it from the spill directory or generating it if needed"""
+
+        chunk = self._chunks.get((cx, cy))
+        if chunk is not None:
+            self._chunks.move_to_end((cx, cy))
+            return chunk
+
+        if (cx, cy) in self._spilled_chunks:
+            chunk = self._load_chunk(cx, cy)
+        else:
+            x, y, width, height = self._chunk_rect(cx, cy)
+            chunk = MapChunk(self._generator.generate(x, y, width, height) - self._altitude_offset)
+
+        self._cache_chunk(cx, cy, chunk)
+
+        return chunk
+
+    def _cache_chunk(self, cx: int, cy: int, chunk: MapChunk):
+
+        self._chunks[(cx, cy)] = chunk
+        self._chunks.move_to_end((cx, cy))
+
+        while len(self._chunks) > ChunkedWorldMap.MAX_CACHED_CHUNKS:
+            (old_cx, old_cy), old_chunk = self._chunks.popitem(last=False)
+            self._spill_chunk(old_cx, old_cy, old_chunk)
+
+    def restore_chunk(self, cx: int, cy: int, altitudes):
+        """Replace the altitudes of a chunk with saved altitudes e.g. from a chunks file"""
+
+        x, y, width, height = self._chunk_rect(cx, cy)
+        if width <= 0 or height <= 0 or altitudes.shape != (width, height):
+            raise WorldFileError("Chunk ({0},{1}) with shape {2} doesn't fit chunked world map {3}!".format(
+                cx, cy, altitudes.shape, self.name))
+
+        chunk = MapChunk(numpy.array(altitudes, dtype=float))
+        chunk.is_dirty = True
+        self._cache_chunk(cx, cy, chunk)
+
+    def take_chunk_data(self):
+        """
+        Return a dictionary of the seed, size and chunk settings that the map is generated from and copies of the
+        altitudes of the chunks that have been changed, both the cached ones and the ones spilled to disk
+        """
+
+        if self._generator is None:
+            raise Exception("Chunked world map {0} has not been generated yet!".format(self.name))
+
+        header = {
+            "name": self.name,
+            "width": self.width,
+            "height": self.height,
+            "seed": self._generator.seed,
+            "chunk_size": ChunkedWorldMap.CHUNK_SIZE,
+            "sample_chunks": ChunkedWorldMap.SAMPLE_CHUNKS
+        }
+
+        chunks = {}
+        for (cx, cy), chunk in self._chunks.items():
+            if chunk.is_dirty is True or (cx, cy) in self._spilled_chunks:
+                chunks[(cx, cy)] = numpy.array(chunk.altitudes)
+
+        for cx, cy in self._spilled_chunks:
+            if (cx, cy) not in chunks:
+                with numpy.load(self._chunk_file_name(cx, cy)) as arrays:
+                    chunks[(cx, cy)] = arrays["altitudes"]
+
+        return {"header": header, "chunks": chunks}
+
+    def _chunk_rect(self, cx: int, cy: int):
+        x = cx * ChunkedWorldMap.CHUNK_SIZE
+        y = cy * ChunkedWorldMap.CHUNK_SIZE
+        width = min(ChunkedWorldMap.CHUNK_SIZE, self._width - x)
+        height = min(ChunkedWorldMap.CHUNK_SIZE, self._height - y)
+        return x, y, width, height
+
+    def _chunk_file_name(self, cx: int, cy: int):
+        return os.path.join(self._spill_dir, "chunk_{0}_{1}.npz".format(cx, cy))
+
+    def _spill_chunk(self, cx: int, cy: int, chunk: MapChunk):
+
+        # An unchanged chunk is either already on disk or can be generated again from the seed
+        if chunk.is_dirty is False:
+            return
+
+        logging.debug("%s._spill_chunk(): Spilling chunk (%i,%i) to disk", __class__, cx, cy)
+
+        arrays = {"altitudes": chunk.altitudes}
+        for theme, map in chunk.maps_by_theme.items():
+            arrays["theme_" + theme] = map
+
+        with open(self._chunk_file_name(cx, cy), "wb") as chunk_file:
+            numpy.savez(chunk_file, **arrays)
+
+        self._spilled_chunks.add((cx, cy))
+
+    def _load_chunk(self, cx: int, cy: int):
+
+        with numpy.load(self._chunk_file_name(cx, cy)) as arrays:
+            chunk = MapChunk(arrays["altitudes"])
+            for key in arrays.files:
+                if key.startswith("theme_"):
+                    chunk.maps_by_theme[key[len("theme_"):]] = arrays[key]
+
+        return chunk
+
+    # Get the tile map of a chunk for a theme classifying the chunk's altitudes if needed
+    def _get_chunk_tiles(self, cx: int, cy: int, theme: str):
+
+        if theme not in WorldMap.topo_zone_themes.keys():
+            theme = WorldMap.THEME_DEFAULT
+
+        chunk = self.get_chunk(cx, cy)
+
+        map = chunk.maps_by_theme.get(theme)
+        if map is None:
+            a_mean, a_std = self.zone_stats
+            map = WorldMap.altitudes_to_tile_codes(chunk.altitudes,
+                                                   WorldMap.get_topo_zones(theme),
+                                                   a_mean,
+                                                   a_std)
+            x, y, width, height = self._chunk_rect(cx, cy)
+            self.add_landmark_tiles(map, x, y)
+            chunk.maps_by_theme[theme] = map
+
+        return map
+
+    # Build an array for a rectangle of the map from the arrays of the chunks that it overlaps
+    def _get_region(self, x: int, y: int, width: int, height: int, get_chunk_array, dtype):
+
+        x0 = max(0, x)
+        y0 = max(0, y)
+        x1 = min(self._width, x + width)
+        y1 = min(self._height, y + height)
+
+        region = numpy.empty((max(0, x1 - x0), max(0, y1 - y0)), dtype=dtype)
+
+        size = ChunkedWorldMap.CHUNK_SIZE
+
+        for cx in range(x0 // size, (x1 - 1) // size + 1):
+            for cy in range(y0 // size, (y1 - 1) // size + 1):
+                chunk_array = get_chunk_array(cx, cy)
+
+                # The part of the chunk that overlaps the region
+                ax0 = max(x0, cx * size)
+                ay0 = max(y0, cy * size)
+                ax1 = min(x1, (cx + 1) * size)
+                ay1 = min(y1, (cy + 1) * size)
+
+                region[ax0 - x0:ax1 - x0, ay0 - y0:ay1 - y0] = \
+                    chunk_array[ax0 - cx * size:ax1 - cx * size, ay0 - cy * size:ay1 - cy * size]
+
+        return region
+
+    def get(self, x: int, y: int, theme: str = WorldMap.THEME_DEFAULT):
+
+        if self.is_valid_xy(x, y) is False:
+            raise Exception("Trying to get tile at ({0},{1}) which is outside of the world!".format(x, y))
+
+        size = ChunkedWorldMap.CHUNK_SIZE
+        map = self._get_chunk_tiles(x // size, y // size, theme)
+
+        return WorldMap.TILES[map[x % size, y % size]]
+
+    def get_tile_codes(self, x: int, y: int, width: int, height: int, theme: str = WorldMap.THEME_DEFAULT):
+
+        return self._get_region(x, y, width, height,
+                                lambda cx, cy: self._get_chunk_tiles(cx, cy, theme),
+                                WorldMap.TILE_CODE_TYPE)
+
+    def get_theme_map(self, theme: str = WorldMap.THEME_DEFAULT):
+        raise Exception("Chunked world map {0} does not have whole theme maps - use get_tile_codes()".format(
+            self.name))
+
+    # Themes are classified a chunk at a time when they are used so there is nothing to build in the background
+    def prefetch_theme(self, theme: str):
+        pass
+
+    def get_altitudes(self, x: int, y: int, width: int, height: int):
+
+        return self._get_region(x, y, width, height,
+                                lambda cx, cy: self.get_chunk(cx, cy).altitudes,
+                                float)
+
+    def get_altitude(self, x: int, y: int):
+
+        if self.is_valid_xy(x, y) is False:
+            raise Exception("Trying to get altitude at ({0},{1}) which is outside of the world!".format(x, y))
+
+        size = ChunkedWorldMap.CHUNK_SIZE
+
+        return self.get_chunk(x // size, y // size).altitudes[x % size, y % size]
+
+    # Set the altitude at the specified co-ordinates.
+    # The altitude statistics are an estimate from a sample so they are not updated.
+    def set_altitude(self, new_altitude: float, x: int, y: int):
+
+        if self.is_valid_xy(x, y) is False:
+            raise Exception("Trying to set altitude at ({0},{1}) which is outside of the world!".format(x, y))
+
+        size = ChunkedWorldMap.CHUNK_SIZE
+
+        chunk = self.get_chunk(x // size, y // size)
+        chunk.altitudes[x % size, y % size] = new_altitude
+        chunk.is_dirty = True
+
+        if self.altitude_changes is not None:
+            self.altitude_changes[(x, y)] = new_altitude
+
+        self.notify_change_listeners(x, y)
+
+    def set_topology(self, altitudes):
+        raise Exception("Chunked world map {0} generates its own topology!".format(self.name))
+
+
+def write_chunks(chunk_data: dict, file_name: str):
+    """Write the header and changed chunks from ChunkedWorldMap.take_chunk_data() to a chunks file"""
+
+    arrays = {"header": numpy.array(json.dumps(chunk_data["header"]))}
+    for (cx, cy), altitudes in chunk_data["chunks"].items():
+        arrays["{0}{1}_{2}".format(CHUNK_KEY_PREFIX, cx, cy)] = altitudes
+
+    # Write to a temporary file and then swap it in so a failed save doesn't lose the last one
+    temp_file_name = file_name + ".tmp"
+
+    with open(temp_file_name, "wb") as chunks_file:
+        numpy.savez(chunks_file, **arrays)
+
+    os.replace(temp_file_name, file_name)
+
+    logging.info("write_chunks(): Saved %s to %s", chunk_data["header"]["name"], file_name)
+
+
+def load_chunks(file_name: str, spill_dir: str = None):
+    """Generate a ChunkedWorldMap again from a chunks file and put back the chunks that had been changed"""
+
+    try:
+        with numpy.load(file_name, allow_pickle=False) as arrays:
+            header = json.loads(str(arrays["header"]))
+            chunks = {key: arrays[key] for key in arrays.files if key.startswith(CHUNK_KEY_PREFIX)}
+
+        # The altitudes of the chunks depend on the chunk settings as well as the seed
+        if header["chunk_size"] != ChunkedWorldMap.CHUNK_SIZE or \
+                header["sample_chunks"] != ChunkedWorldMap.SAMPLE_CHUNKS:
+            raise WorldFileError("{0} was saved with different chunk settings!".format(file_name))
+
+        world = ChunkedWorldMap(header["name"], header["width"], header["height"], header["seed"], spill_dir)
+
+    except WorldFileError:
+        raise
+    except (KeyError, TypeError, ValueError, zipfile.BadZipFile) as err:
+        raise WorldFileError("{0} is not a chunks file: {1}".format(file_name, str(err))) from err
+
+    world.initialise()
+
+    for key, altitudes in chunks.items():
+        try:
+            cx, cy = (int(part) for part in key[len(CHUNK_KEY_PREFIX):].split("_"))
+        except ValueError as err:
+            raise WorldFileError("{0} has a damaged chunk {1}!".format(file_name, key)) from err
+        world.restore_chunk(cx, cy, altitudes)
+
+    logging.info("load_chunks(): Loaded %s from %s", world.name, file_name)
+
+    return world
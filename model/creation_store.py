@@ -0,0 +1,352 @@
+'''
+    This module contains a compact store for the creations that have been placed in a world:
+    - CreationStore - shared Creatable templates plus parallel arrays of type id, x, y and progress
+    - Creation - a light weight view of one creation in a store that looks like a Creatable
+'''
+
+import collections.abc
+import heapq
+
+import numpy
+
+
+class Creation:
+    """
+    A view of the creation in one slot of a CreationStore.
+    The details that are the same for every creation of a type come from the shared Creatable template.
+    """
+
+    __slots__ = ("_store", "_slot")
+
+    def __init__(self, store, slot: int):
+        self._store = store
+        self._slot = slot
+
+    def __str__(self):
+        return "{0} ({1}) {2}% complete".format(self.name, self.description, self.percent_complete)
+
+    @property
+    def template(self):
+        return self._store.templates[self._store.type_ids[self._slot]]
+
+    @property
+    def name(self):
+        return self.template.name
+
+    @property
+    def description(self):
+        return self.template.description
+
+    @property
+    def ticks_required(self):
+        return self.template.ticks_required
+
+    @property
+    def pre_requisites(self):
+        return self.template.pre_requisites
+
+    @property
+    def output(self):
+        return self.template.output
+
+    def get_requirements(self):
+        return self.template.get_requirements()
+
+    def get_requirement_items(self):
+        return self.template.get_requirement_items()
+
+    @property
+    def position(self):
+        return int(self._store.xs[self._slot]), int(self._store.ys[self._slot])
+
+    @property
+    def ticks_done(self):
+        return self._store.get_ticks_done(self._slot)
+
+    @ticks_done.setter
+    def ticks_done(self, ticks_done: int):
+        self._store.set_ticks_done(self._slot, ticks_done)
+
+    @property
+    def is_complete(self):
+        return self.ticks_done >= self.ticks_required
+
+    @property
+    def percent_complete(self):
+        if self.ticks_required == 0:
+            return 0
+
+        return int(min(100, self.ticks_done * 100 / self.ticks_required))
+
+    def tick(self):
+        if self.is_complete is False:
+            self.ticks_done += 1
+            if self.is_complete is True:
+                self.do_complete()
+
+    def do_complete(self):
+        self.template.do_complete()
+
+
+class CreationStore(collections.abc.Mapping):
+    """
+    Store creations as parallel arrays indexed by slot rather than as a Creatable object each.
+
+    Each creation takes 20 bytes of array space plus its entry in the position look up. The arrays grow by
+    doubling and the slots of removed creations are reused. The store is a read only mapping of (x,y) to
+    Creation views so it can be used like the dictionary of creations that it replaces.
+
+    Progress is scheduled rather than counted creation by creation. Every type has a clock of the ticks that
+    creations of that type have been given and each creation stores the offset from its type's clock to its
+    ticks done. Creations that are not complete are scheduled on a heap per type by the clock time that they
+    complete, so a tick only advances the type clocks and pops the creations that have just completed.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, templates: list = ()):
+
+        # The shared Creatable templates that are never changed, their type ids and ticks required by type id
+        self.templates = []
+        self._type_ids_by_name = {}
+        self.ticks_required = numpy.zeros(0, dtype=numpy.int64)
+
+        # The progress clock of each type and a heap of (completion time, slot) for each type
+        self.type_clocks = numpy.zeros(0, dtype=numpy.int64)
+        self._schedules = []
+
+        for template in templates:
+            self.add_template(template)
+
+        self.type_ids = numpy.zeros(CreationStore.INITIAL_CAPACITY, dtype=numpy.uint16)
+        self.xs = numpy.zeros(CreationStore.INITIAL_CAPACITY, dtype=numpy.int32)
+        self.ys = numpy.zeros(CreationStore.INITIAL_CAPACITY, dtype=numpy.int32)
+        self.ticks_offsets = numpy.zeros(CreationStore.INITIAL_CAPACITY, dtype=numpy.int64)
+        self.alive = numpy.zeros(CreationStore.INITIAL_CAPACITY, dtype=bool)
+        self.scheduled = numpy.zeros(CreationStore.INITIAL_CAPACITY, dtype=bool)
+
+        # Slots are used up to size and free slots below size are reused first
+        self.size = 0
+        self._free_slots = []
+        self._slots = {}
+
+    def __getitem__(self, position):
+        return Creation(self, self._slots[position])
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, position):
+        return position in self._slots
+
+    @property
+    def type_names(self):
+        return [template.name for template in self.templates]
+
+    @property
+    def capacity(self):
+        return len(self.alive)
+
+    @property
+    def scheduled_count(self):
+        """How many creations are not complete"""
+        return int(self.scheduled[:self.size].sum())
+
+    def add_template(self, template):
+        """Add a shared Creatable template and return its type id"""
+
+        type_id = self._type_ids_by_name.get(template.name)
+        if type_id is None:
+            type_id = len(self.templates)
+            self.templates.append(template)
+            self._type_ids_by_name[template.name] = type_id
+            self.ticks_required = numpy.append(self.ticks_required, template.ticks_required or 0)
+            self.type_clocks = numpy.append(self.type_clocks, 0)
+            self._schedules.append([])
+
+        return type_id
+
+    def get_type_id(self, type_name: str):
+        return self._type_ids_by_name[type_name]
+
+    def get_slot(self, x: int, y: int):
+        """Return the slot of the creation at (x,y) or None"""
+        return self._slots.get((x, y))
+
+    def get_creation(self, slot: int):
+        return Creation(self, slot)
+
+    def get_live_slots(self):
+        """Return an array of the slots that hold creations"""
+        return numpy.flatnonzero(self.alive[:self.size])
+
+    def get_ticks_done(self, slots):
+        """Return the ticks done by the creations in a slot or an array of slots"""
+
+        type_ids = self.type_ids[slots]
+        ticks_done = numpy.minimum(self.ticks_offsets[slots] + self.type_clocks[type_ids],
+                                   self.ticks_required[type_ids])
+
+        if numpy.ndim(ticks_done) == 0:
+            return int(ticks_done)
+
+        return ticks_done.astype(numpy.int32)
+
+    def set_ticks_done(self, slot: int, ticks_done: int):
+        """Set the ticks done by the creation in a slot and schedule it if it is not complete"""
+
+        type_id = int(self.type_ids[slot])
+        self.ticks_offsets[slot] = ticks_done - self.type_clocks[type_id]
+        self._schedule(slot, type_id)
+
+    def _schedule(self, slot: int, type_id: int):
+
+        completion_time = int(self.ticks_required[type_id] - self.ticks_offsets[slot])
+
+        if completion_time > self.type_clocks[type_id]:
+            self.scheduled[slot] = True
+            heapq.heappush(self._schedules[type_id], (completion_time, slot))
+        else:
+            self.scheduled[slot] = False
+
+    def _grow(self, capacity: int):
+
+        new_capacity = self.capacity
+        while new_capacity < capacity:
+            new_capacity *= 2
+
+        if new_capacity == self.capacity:
+            return
+
+        for name in ("type_ids", "xs", "ys", "ticks_offsets", "alive", "scheduled"):
+            old_array = getattr(self, name)
+            new_array = numpy.zeros(new_capacity, dtype=old_array.dtype)
+            new_array[:len(old_array)] = old_array
+            setattr(self, name, new_array)
+
+    def add(self, type_id: int, x: int, y: int, ticks_done: int = 0):
+        """Add a creation at (x,y) replacing any creation that is already there and return its slot"""
+
+        self.remove(x, y)
+
+        if len(self._free_slots) > 0:
+            slot = self._free_slots.pop()
+        else:
+            slot = self.size
+            self._grow(slot + 1)
+            self.size += 1
+
+        self.type_ids[slot] = type_id
+        self.xs[slot] = x
+        self.ys[slot] = y
+        self.alive[slot] = True
+        self._slots[(x, y)] = slot
+
+        self.set_ticks_done(slot, ticks_done)
+
+        return slot
+
+    def add_many(self, type_ids, xs, ys, ticks_done):
+        """Add arrays of creations at positions that are all different and return an array of their slots"""
+
+        xs = numpy.asarray(xs)
+        ys = numpy.asarray(ys)
+        positions = list(zip(xs.tolist(), ys.tolist()))
+
+        for x, y in positions:
+            self.remove(x, y)
+
+        # Fill the free slots first and then append the rest
+        count = len(positions)
+        reused = min(count, len(self._free_slots))
+        slots = numpy.empty(count, dtype=numpy.int64)
+        slots[:reused] = self._free_slots[len(self._free_slots) - reused:]
+        del self._free_slots[len(self._free_slots) - reused:]
+        slots[reused:] = numpy.arange(self.size, self.size + count - reused)
+
+        self._grow(self.size + count - reused)
+        self.size += count - reused
+
+        self.type_ids[slots] = type_ids
+        self.xs[slots] = xs
+        self.ys[slots] = ys
+        self.alive[slots] = True
+        self._slots.update(zip(positions, slots.tolist()))
+
+        # Only the creations that are not complete need scheduling
+        type_ids = self.type_ids[slots]
+        self.ticks_offsets[slots] = ticks_done - self.type_clocks[type_ids]
+        completion_times = self.ticks_required[type_ids] - self.ticks_offsets[slots]
+        is_in_progress = completion_times > self.type_clocks[type_ids]
+        self.scheduled[slots] = is_in_progress
+
+        for type_id, completion_time, slot in zip(type_ids[is_in_progress].tolist(),
+                                                  completion_times[is_in_progress].tolist(),
+                                                  slots[is_in_progress].tolist()):
+            self._schedules[type_id].append((completion_time, slot))
+
+        for schedule in self._schedules:
+            heapq.heapify(schedule)
+
+        return slots
+
+    def remove(self, x: int, y: int):
+        """Remove the creation at (x,y) and return its slot or None if there wasn't one"""
+
+        slot = self._slots.pop((x, y), None)
+        if slot is not None:
+            self.alive[slot] = False
+            self.scheduled[slot] = False
+            self._free_slots.append(slot)
+
+        return slot
+
+    def clear(self):
+        self.alive[:] = False
+        self.scheduled[:] = False
+        self.size = 0
+        self._free_slots = []
+        self._slots = {}
+
+        for schedule in self._schedules:
+            schedule.clear()
+
+    def get_active_type_ids(self):
+        """Return a list of the type ids that have creations that are not complete"""
+        return [type_id for type_id, schedule in enumerate(self._schedules) if len(schedule) > 0]
+
+    def tick(self, is_type_creatable=None):
+        """
+        Advance every creation that is not complete by a tick and return an array of the slots of the creations
+        that have just completed. Creations of types that is_type_creatable, an array of booleans by type id,
+        says can be created from current resources get an extra tick.
+        """
+
+        ticks = numpy.ones(len(self.templates), dtype=numpy.int64)
+        if is_type_creatable is not None:
+            ticks += numpy.asarray(is_type_creatable, dtype=numpy.int64)
+
+        self.type_clocks += ticks
+
+        completed = []
+
+        for type_id in self.get_active_type_ids():
+            schedule = self._schedules[type_id]
+            clock = self.type_clocks[type_id]
+
+            while len(schedule) > 0 and schedule[0][0] <= clock:
+                completion_time, slot = heapq.heappop(schedule)
+
+                # Skip entries for creations that have been removed or rescheduled since
+                if bool(self.scheduled[slot]) is False or \
+                        completion_time != self.ticks_required[type_id] - self.ticks_offsets[slot] or \
+                        self.type_ids[slot] != type_id:
+                    continue
+
+                self.scheduled[slot] = False
+                completed.append(slot)
+
+        return numpy.array(completed, dtype=numpy.int64)
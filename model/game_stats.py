@@ -104,7 +104,7 @@ class KingdomStats(StatEngine):
     EVENTS = (YearChanged.NAME, SeasonChanged.NAME)
 
     def __init__(self):
-        super(KingdomStats, self).__init__("Kingdom")
+        super(KingdomStats, self).__init__("Kingdom", propagation=StatEngine.PROPAGATE_TOPOLOGICAL, lean=True)
 
     def initialise(self):
         # Add the core input stats
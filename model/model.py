@@ -1,13 +1,33 @@
 import logging
 import os
 import random
-import pickle
 
+import numpy
+
+from .autosave import AutoSaver
+from .autosave import recover
 from .building_blocks import Creatable
 from .building_blocks import CreatableFactoryXML
+from .building_blocks import IndexedInventory
 from .building_blocks import Inventory
 from .building_blocks import ResourceFactory
 from .building_blocks import WorldMap
+from .chunked_map import ChunkedWorldMap
+from .creation_store import CreationStore
+from .pathfinding import PathFinder
+from .production import ProductionEngine
+from .spatial_index import SpatialIndex
+from .world_file import FILE_EXTENSION as WORLD_FILE_EXTENSION
+from .world_file import WorldFileError
+from .world_file import convert_world_pickle
+from .world_file import load_world
+from .world_file import save_world
+from .snapshot import FILE_EXTENSION as SNAPSHOT_FILE_EXTENSION
+from .snapshot import SnapshotError
+from .snapshot import read_snapshot
+from .snapshot import restore_snapshot
+from .snapshot import take_snapshot
+from .snapshot import write_snapshot
 from .utils import Event
 from .utils import EventQueue
 from .StatEngine import *
@@ -42,6 +62,7 @@ class Game:
     EVENT_QUIT = "Quit"
 
     EVENT_ACTION_FAIL = "Action failed"
+    EVENT_CREATIONS_ADDED = "Creations added"
     EVENT_SOMETHING_HAPPENED = "Something Happened"
     EVENT_LOAD = "Game Loaded"
     EVENT_SAVED = "Game Saved"
@@ -52,9 +73,27 @@ class Game:
     MAX_STATUS_MESSAGES = 5
     STATUS_MESSAGE_LIFETIME = 16
 
-    def __init__(self, name: str):
+    # How many ticks before the season changes to start building the next season's tile map
+    THEME_PREFETCH_TICKS = 3
+
+    # Default map size and the size above which maps are split into chunks that are generated on demand
+    MAP_WIDTH = 100
+    MAP_HEIGHT = 100
+    CHUNKED_MAP_AREA = 1000 * 1000
+
+    # Only the middle of very big maps gets populated with initial creations
+    MAX_INITIAL_CREATIONS_SIZE = 1000
+
+    # Tiles that creations can't be built on
+    UNBUILDABLE_TILES = (WorldMap.TILE_SHALLOWS, WorldMap.TILE_SEA, WorldMap.TILE_DEEP_SEA, WorldMap.TILE_BORDER)
+
+    AUTOSAVE_SUFFIX = ".autosave"
+
+    def __init__(self, name: str, map_width: int = MAP_WIDTH, map_height: int = MAP_HEIGHT):
 
         self.name = name
+        self.map_width = map_width
+        self.map_height = map_height
         self._state = Game.STATE_LOADED
         self.tick_count = 0
 
@@ -63,8 +102,23 @@ class Game:
         self.resources = None
         self.creatables = None
         self.creations = None
+        self.creation_index = SpatialIndex()
+        self.production = None
         self.map = None
 
+        # The slots of new creations that were already complete when they were put in the world.
+        # They complete on the next tick so that their outputs are credited and their replacements happen.
+        self._completed_on_placement = set()
+
+        # Build the next season's tile map in the background before the season changes?
+        self.prefetch_themes = True
+
+        # Autosave in the background while the game is being played?
+        self.autosave_enabled = True
+        self.autosave = None
+
+        self._pathfinder = None
+
         EventQueue.add_event(Event("{0} model created!".format(self.name)))
 
     @property
@@ -103,29 +157,45 @@ class Game:
 
         self.stats.initialise()
 
-        self.inventory = Inventory()
+        self.inventory = IndexedInventory()
         self.resources = ResourceFactory(os.path.join(Game.GAME_DATA_DIR, "resources.csv"))
         self.resources.load()
 
         self.creatables = CreatableFactoryXML(os.path.join(Game.GAME_DATA_DIR, "creatables.xml"))
         self.creatables.load()
 
-        self.map = WorldMap("Kingdom 2", 100, 100)
+        self.creations = CreationStore(self.creatables.templates)
+        self.production = ProductionEngine(self.creations)
+
+        if self.map_width * self.map_height > Game.CHUNKED_MAP_AREA:
+            self.map = ChunkedWorldMap("Kingdom 2", self.map_width, self.map_height)
+        else:
+            self.map = WorldMap("Kingdom 2", self.map_width, self.map_height)
         self.map.initialise()
 
+        if self.prefetch_themes is True:
+            self.map.prefetch_theme(self.current_season_name)
+
         resource_types = ResourceFactory.get_resource_types()
 
         for type in resource_types:
             new_resource = ResourceFactory.get_resource(type)
             self.inventory.add_resource(new_resource, random.randint(100020, 1000160))
 
-        self.creations = {}
+        self.clear_creations()
         self.add_initial_creations()
 
     def start(self):
 
         self.state = Game.STATE_PLAYING
 
+        if self.autosave_enabled is True and self.autosave is None:
+            self.autosave = AutoSaver(self, self.autosave_file_base_name)
+
+    @property
+    def autosave_file_base_name(self):
+        return os.path.join(Game.SAVE_GAME_DIR, self.name + Game.AUTOSAVE_SUFFIX)
+
     def add_initial_creations(self):
 
 
@@ -143,19 +213,33 @@ class Game:
             WorldMap.TILE_BORDER: WorldMap.TILE_BORDER
         }
 
-        for y in range(0, self.map.height):
-            for x in range(0, self.map.width):
-                tile = self.map.get(x, y)
-                if tile == WorldMap.TILE_BORDER:
-                    pass
-                    #self.add_creation_by_name(tile, x, y, change=Inventory.CHANGE_NO_CHANGE)
-                elif tile in tile_to_creation.keys() and random.randint(0, 10) > 9:
-                    tiles = tile_to_creation[tile]
-                    if isinstance(tiles, tuple) is True:
-                        new_creation = random.choice(tiles)
-                    else:
-                        new_creation = tiles
-                    self.add_creation_by_name(new_creation, x, y, change=Inventory.CHANGE_NO_CHANGE)
+        # Get the tile codes for the whole map (or the middle of a very big map) in one go
+        width = min(self.map.width, Game.MAX_INITIAL_CREATIONS_SIZE)
+        height = min(self.map.height, Game.MAX_INITIAL_CREATIONS_SIZE)
+        x0 = (self.map.width - width) // 2
+        y0 = (self.map.height - height) // 2
+        codes = self.map.get_tile_codes(x0, y0, width, height)
+
+        new_creations = []
+
+        for tile, tiles in tile_to_creation.items():
+
+            if tile == WorldMap.TILE_BORDER:
+                continue
+                #self.add_creation_by_name(tile, x, y, change=Inventory.CHANGE_NO_CHANGE)
+
+            # Find all of the tiles of this type and randomly pick about 1 in 11 of them
+            candidates = numpy.argwhere(codes == WorldMap.TILE_CODES[tile])
+            chosen = candidates[numpy.random.randint(0, 11, len(candidates)) > 9]
+
+            for x, y in (chosen + (x0, y0)).tolist():
+                if isinstance(tiles, tuple) is True:
+                    new_creation = random.choice(tiles)
+                else:
+                    new_creation = tiles
+                new_creations.append((new_creation, x, y))
+
+        self.add_creations_bulk(new_creations, change=Inventory.CHANGE_NO_CHANGE)
 
     # Add a new creation to the world
     def add_creation(self, new_creation: Creatable, x: int = 0, y: int = 0, change: int = Inventory.CHANGE_DEBIT):
@@ -164,10 +248,7 @@ class Game:
 
         # Check if a creation can be built on the current tile...
         tile = self.map.get(x, y)
-        if self.map.get(x, y) in (WorldMap.TILE_SHALLOWS,
-                                  WorldMap.TILE_SEA,
-                                  WorldMap.TILE_DEEP_SEA,
-                                  WorldMap.TILE_BORDER):
+        if tile in Game.UNBUILDABLE_TILES:
 
             EventQueue.add_event(Event(Game.EVENT_ACTION_FAIL,
                                        "Can't build creations on {0}!".format(tile),
@@ -190,30 +271,243 @@ class Game:
         else:
             # If it can then assign the required resources and add the creation to the world
             self.inventory.assign_resources(new_creation, change=change)
-            self.creations[(x, y)] = new_creation
+            self.put_creation(new_creation, x, y)
             print("Added creation {0} at ({1},{2})".format(new_creation.name, x, y))
             success = True
 
+            if self.autosave is not None:
+                self.autosave.creation_added(x, y, new_creation)
+
         return success
 
+    def add_creations_bulk(self, new_creations: list, change: int = Inventory.CHANGE_DEBIT):
+        """
+        Add a list of (creatable name, x, y) to the world in one go and return how many were added.
+
+        The whole batch is checked against the tile codes and the existing creations in one pass and anything
+        that can't be built is skipped. The resources for everything else are added up and debited in one go -
+        if there aren't enough for all of them then none of them are added. One event summarises what happened.
+        """
+
+        if len(new_creations) == 0:
+            return 0
+
+        names, xs, ys = zip(*new_creations)
+        xs = numpy.array(xs, dtype=numpy.int64)
+        ys = numpy.array(ys, dtype=numpy.int64)
+
+        # Look up each creatable once and give it a type id in the creation store
+        type_ids_by_name = {}
+        for name in set(names):
+            try:
+                type_ids_by_name[name] = self.creations.add_template(self.creatables.get_creatable(name))
+            except KeyError:
+                type_ids_by_name[name] = -1
+        type_ids = numpy.array([type_ids_by_name[name] for name in names], dtype=numpy.int64)
+
+        is_on_map = (xs >= 0) & (xs < self.map.width) & (ys >= 0) & (ys < self.map.height)
+        is_valid = (type_ids >= 0) & is_on_map
+        unknown_count = int((type_ids < 0).sum())
+        off_map_count = int((~is_on_map & (type_ids >= 0)).sum())
+
+        # Check the tiles in the rectangle around the batch...
+        is_buildable = numpy.zeros(len(xs), dtype=bool)
+        if is_valid.any():
+            x0, y0 = int(xs[is_valid].min()), int(ys[is_valid].min())
+            x1, y1 = int(xs[is_valid].max()), int(ys[is_valid].max())
+            codes = self.map.get_tile_codes(x0, y0, x1 - x0 + 1, y1 - y0 + 1)
+            unbuildable_codes = [WorldMap.TILE_CODES[tile] for tile in Game.UNBUILDABLE_TILES]
+            is_buildable[is_valid] = ~numpy.isin(codes[xs[is_valid] - x0, ys[is_valid] - y0], unbuildable_codes)
+        unbuildable_count = int((is_valid & ~is_buildable).sum())
+        is_valid &= is_buildable
+
+        # ...and that nothing is there already or earlier in the batch
+        positions = set()
+        occupied_count = 0
+        for i, position in enumerate(zip(xs.tolist(), ys.tolist())):
+            if bool(is_valid[i]) is False:
+                continue
+            if position in self.creations or position in positions:
+                is_valid[i] = False
+                occupied_count += 1
+            else:
+                positions.add(position)
+
+        type_ids = type_ids[is_valid]
+        xs = xs[is_valid]
+        ys = ys[is_valid]
+
+        # Add up the resources for the whole batch and debit them all or nothing
+        is_affordable = True
+        if change != Inventory.CHANGE_NO_CHANGE and len(type_ids) > 0:
+            type_counts = numpy.bincount(type_ids)
+            requirements = [(self.creations.templates[type_id].get_requirements(), int(type_counts[type_id]))
+                            for type_id in numpy.flatnonzero(type_counts).tolist()]
+
+            if any(requirement is None for requirement, count in requirements):
+                is_affordable = False
+            else:
+                total = sum(requirement * count for requirement, count in requirements)
+                if change == Inventory.CHANGE_DEBIT and self.inventory.has_resources(total) is False:
+                    is_affordable = False
+                else:
+                    self.inventory.use_resources(total, change)
+
+        added_count = 0
+        if is_affordable is True and len(type_ids) > 0:
+            self.put_creations(type_ids, xs, ys, 0)
+            added_count = len(type_ids)
+
+            if self.autosave is not None:
+                for type_id, x, y in zip(type_ids.tolist(), xs.tolist(), ys.tolist()):
+                    self.autosave.creation_added(x, y, self.creations.templates[type_id])
+
+        summary = "Added {0} of {1} creations".format(added_count, len(new_creations))
+        skipped = [(unknown_count, "unknown"), (off_map_count, "off the map"), (unbuildable_count, "on tiles that can't be built on"),
+                   (occupied_count, "on occupied tiles")]
+        details = ["{0} {1}".format(count, reason) for count, reason in skipped if count > 0]
+        if is_affordable is False:
+            details.append("insufficient resources for {0}".format(len(type_ids)))
+        if len(details) > 0:
+            summary += " - skipped " + ", ".join(details)
+
+        print(summary)
+        logging.info("%s.add_creations_bulk(): %s", __class__, summary)
+
+        EventQueue.add_event(Event(Game.EVENT_CREATIONS_ADDED,
+                                   summary,
+                                   Game.EVENT_CREATIONS_ADDED if added_count > 0 else Game.EVENT_ACTION_FAIL))
+
+        return added_count
+
     def delete_creation(self, x: int = 0, y: int = 0):
         creation = self.get_creation(x, y)
         if creation is not None:
             self.inventory.assign_resources(creation, change=Inventory.CHANGE_CREDIT)
-            del self.creations[(x, y)]
+            self.remove_creation(x, y)
+
+            if self.autosave is not None:
+                self.autosave.creation_deleted(x, y)
+
+    # Put a creation in the world without any checks or changes to the inventory.
+    # A new creation that is already complete completes on the next tick but a restored one e.g. from a snapshot
+    # has already completed so it just starts producing.
+    def put_creation(self, new_creation: Creatable, x: int, y: int, ticks_done: int = None,
+                     is_restored: bool = False):
+
+        if ticks_done is None:
+            ticks_done = new_creation.ticks_done
+
+        # Stop any creation that is being replaced from producing or completing
+        old_slot = self.creations.get_slot(x, y)
+        if old_slot is not None:
+            self.production.remove_producer(old_slot)
+            self._completed_on_placement.discard(old_slot)
+
+        slot = self.creations.add(self.creations.add_template(new_creation), x, y, ticks_done)
+        self.creation_index.add(x, y, slot, new_creation.name)
+
+        if bool(self.creations.scheduled[slot]) is False:
+            if is_restored is True:
+                self.production.add_producers([slot], self.tick_count)
+            else:
+                self._completed_on_placement.add(slot)
+
+        if self._pathfinder is not None:
+            self._pathfinder.set_occupied(x, y, True)
+
+    # Remove a creation from the world without any changes to the inventory
+    def remove_creation(self, x: int, y: int):
+        self.creation_index.remove(x, y)
+        slot = self.creations.remove(x, y)
+        if slot is not None:
+            self.production.remove_producer(slot)
+            self._completed_on_placement.discard(slot)
+            if self._pathfinder is not None:
+                self._pathfinder.set_occupied(x, y, False)
+
+    # Put arrays of creations in the world without any checks or changes to the inventory
+    # treating creations that are already complete in the same way as put_creation()
+    def put_creations(self, type_ids, xs, ys, ticks_done, is_restored: bool = False):
+
+        # Stop any creations that are being replaced from producing or completing
+        for x, y in zip(numpy.asarray(xs).tolist(), numpy.asarray(ys).tolist()):
+            old_slot = self.creations.get_slot(x, y)
+            if old_slot is not None:
+                self.production.remove_producer(old_slot)
+                self._completed_on_placement.discard(old_slot)
+
+        slots = self.creations.add_many(type_ids, xs, ys, ticks_done)
+
+        for slot, x, y, type_id in zip(slots.tolist(), self.creations.xs[slots].tolist(),
+                                       self.creations.ys[slots].tolist(), self.creations.type_ids[slots].tolist()):
+            self.creation_index.add(x, y, slot, self.creations.templates[type_id].name)
+
+        complete_slots = slots[~self.creations.scheduled[slots]]
+        if is_restored is True:
+            self.production.add_producers(complete_slots, self.tick_count)
+        else:
+            self._completed_on_placement.update(complete_slots.tolist())
+
+        if self._pathfinder is not None:
+            self._pathfinder.set_occupied_many(xs, ys, True)
+
+    def clear_creations(self):
+        self.creations.clear()
+        self.creation_index.clear()
+        self.production.clear()
+        self._completed_on_placement.clear()
+        if self._pathfinder is not None:
+            self._pathfinder.clear_occupied()
+
+    # Get a list of ((x,y), creation) for the creations in a rectangle of the map e.g. the view port
+    def get_creations_in_rect(self, x: int, y: int, width: int, height: int):
+        return [(position, self.creations.get_creation(slot))
+                for position, slot in self.creation_index.in_rect(x, y, width, height)]
+
+    # Get a list of ((x,y), creation) for the creations within a number of hexagon steps of (x,y)
+    def get_creations_in_range(self, x: int, y: int, radius: int):
+        return [(position, self.creations.get_creation(slot))
+                for position, slot in self.creation_index.in_range(x, y, radius)]
+
+    # Get a list of the positions of all of the creations with a name
+    def get_creation_positions(self, creation_name: str):
+        return self.creation_index.by_type(creation_name)
+
+    # Get the path finder for the current map building it when it is first used
+    # or None if the map is a chunked map that is too big to find paths across
+    @property
+    def pathfinder(self):
+        if isinstance(self.map, ChunkedWorldMap) is True:
+            logging.warning("%s.pathfinder: Can't find paths across chunked map %s", __class__, self.map.name)
+            return None
+
+        if self._pathfinder is None or self._pathfinder.world is not self.map:
+            self._pathfinder = PathFinder(self.map, occupied=self.creations.keys())
+        return self._pathfinder
+
+    # Find the cheapest route between two hexagons or None if there isn't one
+    def find_path(self, start_x: int, start_y: int, end_x: int, end_y: int):
+
+        pathfinder = self.pathfinder
+        if pathfinder is None:
+            return None
+
+        return pathfinder.find_path(start_x, start_y, end_x, end_y)
 
     def add_creation_by_name(self, new_creation_name: str, x: int = 0, y: int = 0, change=Inventory.CHANGE_DEBIT):
-        new_creation = self.creatables.get_creatable_copy(new_creation_name)
+        new_creation = self.creatables.get_creatable(new_creation_name)
         return self.add_creation(new_creation, x, y, change)
 
     def get_creation(self, x: int, y: int):
-        if (x, y) in self.creations.keys():
-            return self.creations[(x, y)]
+        slot = self.creations.get_slot(x, y)
+        if slot is not None:
+            return self.creations.get_creation(slot)
         else:
             return None
 
     def new_map(self):
-        self.creations = {}
+        self.clear_creations()
         self.map.initialise()
         self.add_initial_creations()
 
@@ -225,6 +519,10 @@ class Game:
         self.tick_count += 1
 
         self.stats.update_stat(KingdomStats.INPUT_TICK_COUNT, self.tick_count)
+        self.stats.tick()
+
+        if self.prefetch_themes is True:
+            self.prefetch_next_season_theme()
 
         # See if any of the event stats fires as a result if the tick...
         for event_stat_name in KingdomStats.EVENTS:
@@ -239,10 +537,45 @@ class Game:
         #                            "Game ticked to {0}".format(self.tick_count),
         #                            Game.TICK))
 
-        for creation in self.creations.values():
-            creation.tick()
-            if self.inventory.is_creatable(creation):
-                creation.tick()
+        # Creations get an extra tick if there are enough resources to create another one of the same type.
+        # Every type is checked in one go as extra ticks make no difference to types that are all complete.
+        is_type_creatable = self.inventory.are_creatable(self.creations.templates)
+
+        # The scheduler tells us which creations have completed plus new creations that were already complete
+        completed_slots = self.creations.tick(is_type_creatable)
+        if len(self._completed_on_placement) > 0:
+            completed_slots = numpy.concatenate((sorted(self._completed_on_placement), completed_slots))
+            completed_slots = completed_slots.astype(numpy.int64)
+            self._completed_on_placement.clear()
+
+        for slot in completed_slots.tolist():
+            self.creations.get_creation(slot).do_complete()
+
+        # Credit everything that was produced this tick to the inventory in one go...
+        ledger, replacements = self.production.tick(self.tick_count, completed_slots)
+        self.inventory.apply_changes(ledger)
+
+        # ...and turn completed creations into what they are replaced by
+        for slot, creatable_name in replacements:
+            x, y = self.creations.get_creation(slot).position
+            self.put_creation(self.creatables.get_creatable(creatable_name), x, y)
+            if self.autosave is not None:
+                self.autosave.creation_added(x, y, self.get_creation(x, y))
+
+        # Autosave last so that the changes from this tick are included
+        if self.autosave is not None:
+            self.autosave.tick()
+
+    # If the season is about to change then start building the tile map for the next season's theme
+    def prefetch_next_season_theme(self):
+
+        ticks_per_season = CurrentYear.TICKS_PER_YEAR // CurrentSeason.SEASONS
+        ticks_to_change = ticks_per_season - (self.tick_count % ticks_per_season)
+
+        if ticks_to_change <= Game.THEME_PREFETCH_TICKS:
+            season = int(self.stats.get_stat(CurrentSeason.NAME).value)
+            next_season = (season + 1) % CurrentSeason.SEASONS
+            self.map.prefetch_theme(CurrentSeason.season_number_to_name[next_season])
 
     def get_next_event(self):
 
@@ -277,20 +610,31 @@ class Game:
 
         self.state = Game.EVENT_END
 
+        if self.autosave is not None:
+            self.autosave.stop()
+            self.autosave = None
+
     def save(self,file_name : str = None):
 
         self.pause(is_paused = True)
 
         if file_name is None:
-            file_name = self.name + ".world"
+            file_name = self.name + WORLD_FILE_EXTENSION
 
         full_file_name = os.path.join(Game.SAVE_GAME_DIR, file_name)
 
-        print("Game saved to {0}".format(full_file_name))
+        try:
+            save_world(self.map, full_file_name)
+            self.save_snapshot(os.path.splitext(file_name)[0] + SNAPSHOT_FILE_EXTENSION)
+
+        except Exception as err:
 
-        game_file = open(full_file_name, "wb")
-        pickle.dump(self.map, game_file)
-        game_file.close()
+            logging.warning("Failed to save %s: %s", file_name, str(err))
+
+            EventQueue.add_event(Event(Game.EVENT_ACTION_FAIL,
+                                       "Failed to save game to {0}!".format(file_name),
+                                       Game.EVENT_ACTION_FAIL))
+            return
 
         logging.info("%s saved." % file_name)
         print("Game saved to {0}".format(full_file_name))
@@ -303,16 +647,28 @@ class Game:
     def load(self, file_name : str = None):
 
         if file_name is None:
-            file_name = self.name + ".world"
+            file_name = self.name + WORLD_FILE_EXTENSION
 
         full_file_name = os.path.join(Game.SAVE_GAME_DIR, file_name)
 
         try:
-            game_file = open(full_file_name, "rb")
-            new_game = pickle.load(game_file)
-            game_file.close()
+            # If there is only an old pickled world file then convert it to a world file first
+            pickle_file_name = os.path.splitext(full_file_name)[0] + ".world"
+            if os.path.exists(full_file_name) is False and os.path.exists(pickle_file_name) is True:
+                convert_world_pickle(pickle_file_name, full_file_name)
+
+            world = load_world(full_file_name)
+
+            # Restore the rest of the game if it was saved with the world.
+            # Both files are read before anything is changed so the game is kept if either can't be loaded.
+            snapshot = None
+            snapshot_file_name = os.path.splitext(full_file_name)[0] + SNAPSHOT_FILE_EXTENSION
+            if os.path.exists(snapshot_file_name) is True:
+                snapshot = read_snapshot(snapshot_file_name)
 
-            self.map = new_game
+            self.map = world
+            if snapshot is not None:
+                restore_snapshot(self, snapshot)
 
             logging.info("\n%s loaded.\n" % file_name)
 
@@ -325,7 +681,41 @@ class Game:
 
             logging.warning("Kingdom World file %s not found." % file_name)
 
+        # Keep the current map if the file can't be loaded
+        except (WorldFileError, SnapshotError) as err:
 
+            logging.warning("Kingdom World file %s can't be loaded: %s", file_name, str(err))
+
+    # Save the state of the game that is not part of the map e.g. creations, inventory and stats
+    def save_snapshot(self, file_name : str = None):
+
+        if file_name is None:
+            file_name = self.name + SNAPSHOT_FILE_EXTENSION
+
+        write_snapshot(take_snapshot(self), os.path.join(Game.SAVE_GAME_DIR, file_name))
+
+    def load_snapshot(self, file_name : str = None):
+
+        if file_name is None:
+            file_name = self.name + SNAPSHOT_FILE_EXTENSION
+
+        restore_snapshot(self, read_snapshot(os.path.join(Game.SAVE_GAME_DIR, file_name)))
+
+    # Recover the game from its autosave files
+    def load_autosave(self):
+
+        try:
+            recover(self, self.autosave_file_base_name)
+
+            EventQueue.add_event(Event(Game.EVENT_LOAD,
+                                       "Game recovered from autosave",
+                                       "GAME"))
+            print("Game recovered from autosave")
+
+        except IOError:
 
+            logging.warning("No autosave found for %s", self.name)
 
+        except (WorldFileError, SnapshotError) as err:
 
+            logging.warning("Autosave of %s can't be loaded: %s", self.name, str(err))
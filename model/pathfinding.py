@@ -0,0 +1,349 @@
+'''
+    This module contains route finding across a WorldMap:
+    - PathFinder - A* paths between two hexagons and cached flow fields to a destination
+
+    Water tiles and border tiles can't be crossed. Every step costs 1 plus ALTITUDE_COST for each unit of altitude
+    climbed or descended, and stepping onto a hexagon with a creation on it costs an extra CREATION_COST.
+'''
+
+import collections
+import heapq
+import logging
+
+import numpy
+
+from .building_blocks import HexagonMaths
+from .building_blocks import HexagonNeighbours
+from .building_blocks import WorldMap
+
+
+class FlowField:
+    """
+    The cost of the cheapest route from every hexagon to a destination and the next hexagon to step to.
+    Flow fields are indexed by flat index x * height + y and hexagons that can't reach the destination have an
+    infinite cost and a next hexagon of NO_NEIGHBOUR.
+    """
+
+    def __init__(self, destination: int, costs, next_steps):
+        self.destination = destination
+        self.costs = costs
+        self.next_steps = next_steps
+
+
+class PathFinder:
+    """
+    Find routes across a WorldMap with a binary heap A* search over the map's HexagonNeighbours table.
+
+    Step costs are worked out for the whole map up front so PathFinder is for maps that fit in memory rather than
+    ChunkedWorldMaps. Call set_occupied() or set_occupied_many() when creations are added or removed. The map
+    calls invalidate_at() when the altitude of a hexagon changes so that costs and cached flow fields are kept up
+    to date.
+    """
+
+    ALTITUDE_COST = 1.0
+    CREATION_COST = 2.0
+
+    # How many destinations to keep flow fields for
+    MAX_CACHED_FLOW_FIELDS = 16
+
+    IMPASSABLE = WorldMap.WATER + (WorldMap.TILE_BORDER,)
+
+    def __init__(self, world: WorldMap, theme: str = WorldMap.THEME_DEFAULT, occupied=()):
+
+        # Building the costs for a chunked map would generate every chunk
+        if world.topo_model_pass2 is None:
+            raise Exception("Can't find paths on world map {0} as it doesn't have a whole altitude model!".format(
+                world.name))
+
+        self.world = world
+        self.theme = theme
+        self.width = world.width
+        self.height = world.height
+        self.table = HexagonNeighbours.for_map(self.width, self.height)
+
+        self._occupied = numpy.zeros(self.width * self.height, dtype=bool)
+        for x, y in occupied:
+            self._occupied[self.table.index(x, y)] = True
+
+        self._flow_fields = collections.OrderedDict()
+        self._topology_version = None
+
+        self.build_costs()
+
+        world.add_change_listener(self)
+
+    def build_costs(self):
+        """Work out the cost of every step on the map"""
+
+        codes = self.world.get_tile_codes(0, 0, self.width, self.height, self.theme)
+        impassable_codes = [WorldMap.TILE_CODES[tile] for tile in PathFinder.IMPASSABLE]
+
+        self._passable = ~numpy.isin(codes, impassable_codes).ravel()
+        self._altitudes = numpy.array(self.world.get_altitudes(0, 0, self.width, self.height), dtype=float).ravel()
+
+        # The cost of a step between two neighbours is the same in both directions...
+        step_costs = 1.0 + PathFinder.ALTITUDE_COST * numpy.abs(self.table.gather(self._altitudes) -
+                                                                 self._altitudes[:, None])
+        step_costs[~self.table.mask] = numpy.inf
+        step_costs[~self.table.gather(self._passable, fill=False)] = numpy.inf
+        step_costs[~self._passable] = numpy.inf
+        self._step_costs = step_costs
+
+        # ...plus the cost of stepping onto the hexagon
+        self._enter_costs = numpy.where(self._occupied, PathFinder.CREATION_COST, 0.0)
+
+        # Lists are much faster than arrays for looking up one value at a time in the search loop
+        self._neighbour_list = self.table.neighbours.tolist()
+        self._step_cost_list = step_costs.tolist()
+        self._enter_cost_list = self._enter_costs.tolist()
+
+        q, r, s = HexagonMaths.to_cube(*self.table.xy(numpy.arange(self.table.size)))
+        self._q = q.tolist()
+        self._r = r.tolist()
+
+        self._flow_fields.clear()
+        self._topology_version = self.world.topology_version
+
+    # Rebuild all of the costs if the world has a new topology
+    def _check_topology(self):
+        if self.world.topology_version != self._topology_version:
+            logging.info("%s._check_topology(): Topology of %s changed so rebuilding costs", __class__,
+                         self.world.name)
+            self.build_costs()
+
+    # Are the specified coordinates within the area of the map?
+    def is_valid_xy(self, x: int, y: int):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_passable(self, x: int, y: int):
+        if self.is_valid_xy(x, y) is False:
+            return False
+
+        self._check_topology()
+        return bool(self._passable[self.table.index(x, y)])
+
+    def set_occupied(self, x: int, y: int, is_occupied: bool = True):
+        """Record that a creation has been added to or removed from (x,y)"""
+
+        index = self.table.index(x, y)
+        if self._occupied[index] == is_occupied:
+            return
+
+        self._occupied[index] = is_occupied
+        self._enter_costs[index] = PathFinder.CREATION_COST if is_occupied is True else 0.0
+        self._enter_cost_list[index] = float(self._enter_costs[index])
+
+        self._flow_fields.clear()
+
+    def set_occupied_many(self, xs, ys, is_occupied: bool = True):
+        """Record that creations have been added to or removed from arrays of positions in one go"""
+
+        indexes = numpy.asarray(self.table.index(numpy.asarray(xs), numpy.asarray(ys)), dtype=numpy.int64)
+        self._set_occupied_indexes(indexes, is_occupied)
+
+    def clear_occupied(self):
+        """Record that all of the creations have been removed"""
+        self._set_occupied_indexes(numpy.flatnonzero(self._occupied), False)
+
+    def _set_occupied_indexes(self, indexes, is_occupied: bool):
+
+        indexes = indexes[self._occupied[indexes] != is_occupied]
+        if len(indexes) == 0:
+            return
+
+        cost = PathFinder.CREATION_COST if is_occupied is True else 0.0
+
+        self._occupied[indexes] = is_occupied
+        self._enter_costs[indexes] = cost
+        for index in indexes.tolist():
+            self._enter_cost_list[index] = cost
+
+        self._flow_fields.clear()
+
+    def invalidate_at(self, x: int, y: int):
+        """Recalculate the step costs around (x,y) after its tile or altitude has changed"""
+
+        self._check_topology()
+
+        index = self.table.index(x, y)
+        code = self.world.get_tile_codes(x, y, 1, 1, self.theme)[0, 0]
+
+        self._passable[index] = WorldMap.TILES[code] not in PathFinder.IMPASSABLE
+        self._altitudes[index] = self.world.get_altitude(x, y)
+
+        for direction, neighbour in enumerate(self._neighbour_list[index]):
+            if neighbour == HexagonNeighbours.NO_NEIGHBOUR:
+                continue
+
+            if self._passable[index] and self._passable[neighbour]:
+                cost = 1.0 + PathFinder.ALTITUDE_COST * abs(self._altitudes[neighbour] - self._altitudes[index])
+            else:
+                cost = numpy.inf
+
+            # Set the cost in both directions
+            self._step_costs[index, direction] = cost
+            self._step_costs[neighbour, (direction + 3) % 6] = cost
+            self._step_cost_list[index][direction] = float(cost)
+            self._step_cost_list[neighbour][(direction + 3) % 6] = float(cost)
+
+        self._flow_fields.clear()
+
+    def find_path(self, start_x: int, start_y: int, end_x: int, end_y: int):
+        """Return a list of the (x,y) steps from start to end including both ends or None if there is no route"""
+
+        if self.is_valid_xy(start_x, start_y) is False or self.is_valid_xy(end_x, end_y) is False:
+            logging.info("%s.find_path(): Route from (%i,%i) to (%i,%i) is off the map", __class__,
+                         start_x, start_y, end_x, end_y)
+            return None
+
+        self._check_topology()
+
+        start = self.table.index(start_x, start_y)
+        end = self.table.index(end_x, end_y)
+
+        if bool(self._passable[start]) is False or bool(self._passable[end]) is False:
+            return None
+
+        # Follow a cached flow field if we have one for the destination
+        flow_field = self._flow_fields.get(end)
+        if flow_field is not None:
+            self._flow_fields.move_to_end(end)
+            return self._follow(flow_field, start)
+
+        steps = self._search(start, end)
+        if steps is None:
+            return None
+
+        return [divmod(step, self.height) for step in steps]
+
+    def get_path_cost(self, path: list):
+        """Return the cost of following a path"""
+
+        cost = 0.0
+        for (ax, ay), (bx, by) in zip(path, path[1:]):
+            a = self.table.index(ax, ay)
+            b = self.table.index(bx, by)
+            direction = self._neighbour_list[a].index(b)
+            cost += self._step_cost_list[a][direction] + self._enter_cost_list[b]
+
+        return cost
+
+    # A* search from start to end returning a list of flat indexes
+    def _search(self, start: int, end: int):
+
+        neighbour_list = self._neighbour_list
+        step_cost_list = self._step_cost_list
+        enter_cost_list = self._enter_cost_list
+        q = self._q
+        r = self._r
+
+        end_q = q[end]
+        end_r = r[end]
+
+        # Every step costs at least 1 so the hexagon distance never over estimates the remaining cost
+        def estimate(index):
+            dq = q[index] - end_q
+            dr = r[index] - end_r
+            return max(abs(dq), abs(dr), abs(dq + dr))
+
+        costs = {start: 0.0}
+        came_from = {start: None}
+        heap = [(estimate(start), 0.0, start)]
+
+        while len(heap) > 0:
+            estimated_cost, cost, index = heapq.heappop(heap)
+
+            if index == end:
+                break
+
+            # Skip entries for hexagons that have since been reached more cheaply
+            if cost > costs[index]:
+                continue
+
+            for neighbour, step_cost in zip(neighbour_list[index], step_cost_list[index]):
+                new_cost = cost + step_cost + enter_cost_list[neighbour]
+                if new_cost < costs.get(neighbour, numpy.inf):
+                    costs[neighbour] = new_cost
+                    came_from[neighbour] = index
+                    heapq.heappush(heap, (new_cost + estimate(neighbour), new_cost, neighbour))
+        else:
+            return None
+
+        steps = []
+        index = end
+        while index is not None:
+            steps.append(index)
+            index = came_from[index]
+        steps.reverse()
+
+        return steps
+
+    def get_flow_field(self, end_x: int, end_y: int):
+        """
+        Get the flow field for a destination building it with a Dijkstra search from the destination if needed
+        or None if the destination is off the map
+        """
+
+        if self.is_valid_xy(end_x, end_y) is False:
+            return None
+
+        self._check_topology()
+
+        end = self.table.index(end_x, end_y)
+
+        flow_field = self._flow_fields.get(end)
+        if flow_field is not None:
+            self._flow_fields.move_to_end(end)
+            return flow_field
+
+        neighbour_list = self._neighbour_list
+        step_cost_list = self._step_cost_list
+        enter_cost_list = self._enter_cost_list
+
+        costs = [numpy.inf] * self.table.size
+        next_steps = [HexagonNeighbours.NO_NEIGHBOUR] * self.table.size
+
+        if self._passable[end]:
+            costs[end] = 0.0
+            heap = [(0.0, end)]
+
+            # Search outwards from the destination - stepping from a neighbour onto this hexagon costs
+            # the same step cost as the other way plus the cost of entering this hexagon
+            while len(heap) > 0:
+                cost, index = heapq.heappop(heap)
+                if cost > costs[index]:
+                    continue
+
+                enter_cost = enter_cost_list[index]
+                for neighbour, step_cost in zip(neighbour_list[index], step_cost_list[index]):
+                    new_cost = cost + step_cost + enter_cost
+                    if new_cost < costs[neighbour]:
+                        costs[neighbour] = new_cost
+                        next_steps[neighbour] = index
+                        heapq.heappush(heap, (new_cost, neighbour))
+
+        flow_field = FlowField(end,
+                               numpy.array(costs).reshape(self.width, self.height),
+                               numpy.array(next_steps, dtype=numpy.int32).reshape(self.width, self.height))
+
+        self._flow_fields[end] = flow_field
+        while len(self._flow_fields) > PathFinder.MAX_CACHED_FLOW_FIELDS:
+            self._flow_fields.popitem(last=False)
+
+        return flow_field
+
+    # Follow a flow field from start to its destination
+    def _follow(self, flow_field: FlowField, start: int):
+
+        next_steps = flow_field.next_steps.ravel()
+
+        if start != flow_field.destination and next_steps[start] == HexagonNeighbours.NO_NEIGHBOUR:
+            return None
+
+        path = [divmod(start, self.height)]
+        index = start
+        while index != flow_field.destination:
+            index = int(next_steps[index])
+            path.append(divmod(index, self.height))
+
+        return path
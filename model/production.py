@@ -0,0 +1,156 @@
+'''
+    This module contains the production pipeline that turns completed creations into resources:
+    - ProductionEngine - works out what completed and producing creations output each tick as one ledger
+'''
+
+import logging
+
+import numpy
+
+from .building_blocks import Creatable
+from .creation_store import CreationStore
+
+
+class ProductionEngine:
+    """
+    Work out the outputs of the creations in a CreationStore each tick.
+
+    When a creation completes its inventory outputs are credited and its replace outputs say what creatable
+    it turns into. Creatables with production_ticks go on producing their inventory outputs every
+    production_ticks ticks after they complete. Producers are counted by type and by the tick in their
+    production cycle that they produce on, so a tick only looks at one count per producing type. All of the
+    outputs for a tick are added up into one ledger of resource name to count with a single matrix product.
+    """
+
+    def __init__(self, creations: CreationStore):
+
+        self.creations = creations
+
+        # Producer slots to their (type id, phase) and counts of producers by type id and phase
+        self._producers = {}
+        self._producer_counts = {}
+
+        self._compiled_types = 0
+        self.compile()
+
+    def compile(self):
+        """Build the output matrix, replacements and production cycles for the creation types"""
+
+        templates = self.creations.templates
+
+        self.resource_names = sorted({resource_name
+                                      for template in templates
+                                      for resource_name, action in template.output_actions.items()
+                                      if action == Creatable.OUTPUT_INVENTORY})
+        resource_ids = {resource_name: resource_id for resource_id, resource_name in enumerate(self.resource_names)}
+
+        # Inventory outputs by type id and resource id
+        self._outputs = numpy.zeros((len(templates), len(self.resource_names)), dtype=numpy.int64)
+
+        # What each type turns into when it completes and how often each type produces
+        self._replacements = {}
+        self._production_ticks = {}
+
+        for type_id, template in enumerate(templates):
+            for resource_name, item_count in template.output.items():
+                if template.output_actions.get(resource_name) == Creatable.OUTPUT_REPLACE:
+                    self._replacements[type_id] = resource_name
+                else:
+                    self._outputs[type_id, resource_ids[resource_name]] = item_count
+
+            if template.production_ticks is not None and template.production_ticks > 0:
+                self._production_ticks[type_id] = int(template.production_ticks)
+
+        self._compiled_types = len(templates)
+
+    # Recompile if types have been added to the store since the last compile
+    def _check_compiled(self):
+        if len(self.creations.templates) != self._compiled_types:
+            self.compile()
+
+    @property
+    def producer_count(self):
+        return len(self._producers)
+
+    def is_producer_type(self, type_id: int):
+        self._check_compiled()
+        return type_id in self._production_ticks and type_id not in self._replacements
+
+    def add_producers(self, slots, tick_count: int):
+        """Start completed creations producing with their first production after a full cycle"""
+
+        self._check_compiled()
+
+        slots = numpy.asarray(slots, dtype=numpy.int64)
+        type_ids = self.creations.type_ids[slots]
+
+        for type_id, production_ticks in self._production_ticks.items():
+            if type_id in self._replacements:
+                continue
+
+            type_slots = slots[type_ids == type_id]
+            if len(type_slots) == 0:
+                continue
+
+            phase = tick_count % production_ticks
+            counts = self._producer_counts.get(type_id)
+            if counts is None:
+                counts = numpy.zeros(production_ticks, dtype=numpy.int64)
+                self._producer_counts[type_id] = counts
+            counts[phase] += len(type_slots)
+
+            for slot in type_slots.tolist():
+                old = self._producers.get(slot)
+                if old is not None:
+                    self._remove(slot, old)
+                self._producers[slot] = (type_id, phase)
+
+    def remove_producer(self, slot: int):
+        """Stop the creation in a slot producing e.g. when it is removed from the world"""
+
+        old = self._producers.pop(slot, None)
+        if old is not None:
+            self._remove(slot, old)
+
+    def _remove(self, slot: int, producer: tuple):
+        type_id, phase = producer
+        self._producer_counts[type_id][phase] -= 1
+
+    def clear(self):
+        self._producers.clear()
+        self._producer_counts.clear()
+
+    def tick(self, tick_count: int, completed_slots):
+        """
+        Return a ledger dictionary of resource name to count for everything produced this tick and a list of
+        (slot, creatable name) for the completed creations that turn into another creatable
+        """
+
+        self._check_compiled()
+
+        completed_slots = numpy.asarray(completed_slots, dtype=numpy.int64)
+        completed_type_ids = self.creations.type_ids[completed_slots]
+
+        # Creations that completed this tick...
+        type_counts = numpy.bincount(completed_type_ids, minlength=len(self._outputs)).astype(numpy.int64)
+
+        # ...plus the producers whose cycle comes round this tick
+        for type_id, counts in self._producer_counts.items():
+            type_counts[type_id] += counts[tick_count % len(counts)]
+
+        totals = type_counts @ self._outputs
+        ledger = {self.resource_names[resource_id]: int(totals[resource_id])
+                  for resource_id in numpy.flatnonzero(totals).tolist()}
+
+        replacements = []
+        if len(self._replacements) > 0:
+            for slot, type_id in zip(completed_slots.tolist(), completed_type_ids.tolist()):
+                if type_id in self._replacements:
+                    replacements.append((slot, self._replacements[type_id]))
+
+        self.add_producers(completed_slots, tick_count)
+
+        if len(ledger) > 0:
+            logging.debug("%s.tick(): Produced %s", __class__, ledger)
+
+        return ledger, replacements
@@ -0,0 +1,127 @@
+'''
+    This module contains the snapshot format for the state of a Game that is not part of its WorldMap:
+    the tick count, the kingdom's input stats, the inventory and all of the creations.
+
+    Snapshots are columnar - creations are stored as the parallel arrays of type id, x, y and ticks done from
+    the game's CreationStore - and are written as uncompressed numpy .npz files so that taking and writing a snapshot
+    is cheap enough to do periodically.
+'''
+
+import logging
+import os
+import zipfile
+
+import numpy
+
+from .building_blocks import IndexedInventory
+from .building_blocks import ResourceFactory
+from .game_stats import KingdomStats
+
+SNAPSHOT_VERSION = 1
+FILE_EXTENSION = ".ksave"
+
+# The arrays that every snapshot has
+SNAPSHOT_KEYS = ("version", "tick_count", "creation_type_names", "creation_type_ids", "creation_x", "creation_y",
+                 "creation_ticks_done", "resource_names", "resource_counts", "stat_names", "stat_values")
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a snapshot that can be loaded"""
+    pass
+
+
+def take_snapshot(game):
+    """Copy the state of a game into a dictionary of arrays"""
+
+    # Creation types are stored as ids into a table of creatable names
+    creations = game.creations
+    slots = creations.get_live_slots()
+
+    resources = list(game.inventory.resources.items())
+
+    # Only the input stats are stored as the derived stats are recalculated from them
+    stat_names = list(KingdomStats.INPUTS)
+    stat_values = [game.stats.get_stat(stat_name).value for stat_name in stat_names]
+
+    snapshot = {
+        "version": numpy.array(SNAPSHOT_VERSION),
+        "tick_count": numpy.array(game.tick_count),
+        "creation_type_names": numpy.array(creations.type_names, dtype=str),
+        "creation_type_ids": creations.type_ids[slots],
+        "creation_x": creations.xs[slots],
+        "creation_y": creations.ys[slots],
+        "creation_ticks_done": creations.get_ticks_done(slots),
+        "resource_names": numpy.array([resource.name for resource, item_count in resources], dtype=str),
+        "resource_counts": numpy.array([item_count for resource, item_count in resources], dtype=numpy.int64),
+        "stat_names": numpy.array(stat_names, dtype=str),
+        "stat_values": numpy.array(stat_values, dtype=numpy.float64),
+    }
+
+    return snapshot
+
+
+def write_snapshot(snapshot: dict, file_name: str):
+    """Write a snapshot to a file"""
+
+    # Write to a temporary file and then swap it in so a failed write doesn't lose the last snapshot
+    temp_file_name = file_name + ".tmp"
+
+    with open(temp_file_name, "wb") as snapshot_file:
+        numpy.savez(snapshot_file, **snapshot)
+
+    os.replace(temp_file_name, file_name)
+
+    logging.info("write_snapshot(): Saved snapshot to %s", file_name)
+
+
+def read_snapshot(file_name: str):
+    """Read a snapshot from a file"""
+
+    try:
+        with numpy.load(file_name, allow_pickle=False) as arrays:
+            snapshot = {key: arrays[key] for key in arrays.files}
+    except (ValueError, zipfile.BadZipFile) as err:
+        raise SnapshotError("{0} is not a snapshot: {1}".format(file_name, str(err))) from err
+
+    missing_keys = [key for key in SNAPSHOT_KEYS if key not in snapshot.keys()]
+    if len(missing_keys) > 0:
+        raise SnapshotError("{0} is missing {1}!".format(file_name, ", ".join(missing_keys)))
+
+    version = int(snapshot["version"])
+    if version > SNAPSHOT_VERSION:
+        raise SnapshotError("{0} is snapshot version {1} but only up to version {2} can be loaded!".format(
+            file_name, version, SNAPSHOT_VERSION))
+
+    return snapshot
+
+
+def restore_snapshot(game, snapshot: dict):
+    """Replace the state of a game with the state in a snapshot"""
+
+    game.tick_count = int(snapshot["tick_count"])
+
+    stat_values = {}
+    for stat_name, value in zip(snapshot["stat_names"].tolist(), snapshot["stat_values"].tolist()):
+        if value.is_integer():
+            value = int(value)
+        stat_values[stat_name] = value
+    game.stats.update_stats(stat_values)
+
+    game.inventory = IndexedInventory()
+    for resource_name, item_count in zip(snapshot["resource_names"].tolist(), snapshot["resource_counts"].tolist()):
+        resource = ResourceFactory.get_resource(resource_name)
+        if resource is None:
+            logging.warning("restore_snapshot(): Resource %s is not recognised.", resource_name)
+            continue
+        game.inventory.add_resource(resource, item_count)
+
+    # Translate the saved type ids to the type ids of the game's creation store
+    type_ids = numpy.array([game.creations.add_template(game.creatables.get_creatable(type_name))
+                            for type_name in snapshot["creation_type_names"].tolist()], dtype=numpy.uint16)
+
+    game.clear_creations()
+    game.put_creations(type_ids[snapshot["creation_type_ids"]],
+                       snapshot["creation_x"],
+                       snapshot["creation_y"],
+                       snapshot["creation_ticks_done"],
+                       is_restored=True)
@@ -0,0 +1,124 @@
+'''
+    This module contains a spatial index of things placed on a WorldMap:
+    - SpatialIndex - grid buckets of (x,y) positions with rectangle, radius and by-type queries
+'''
+
+import collections
+
+import numpy
+
+from .building_blocks import HexagonMaths
+
+
+class SpatialIndex:
+    """
+    Index things on a map by position in square buckets of BUCKET_SIZE x BUCKET_SIZE hexagons and by type name.
+
+    Queries only look at the buckets that overlap the area asked about so their cost depends on the size of the
+    area and not on how many things there are on the whole map.
+    """
+
+    BUCKET_SIZE = 16
+
+    def __init__(self, bucket_size: int = BUCKET_SIZE):
+
+        self.bucket_size = bucket_size
+        self._buckets = collections.defaultdict(dict)
+        self._by_type = collections.defaultdict(set)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _bucket_key(self, x: int, y: int):
+        return x // self.bucket_size, y // self.bucket_size
+
+    def add(self, x: int, y: int, item, type_name: str):
+        """Add an item at (x,y) replacing anything that is already there"""
+
+        self.remove(x, y)
+
+        self._buckets[self._bucket_key(x, y)][(x, y)] = (item, type_name)
+        self._by_type[type_name].add((x, y))
+        self._count += 1
+
+    def remove(self, x: int, y: int):
+        """Remove the item at (x,y) and return it or None if there isn't one"""
+
+        key = self._bucket_key(x, y)
+        bucket = self._buckets.get(key)
+        if bucket is None or (x, y) not in bucket:
+            return None
+
+        item, type_name = bucket.pop((x, y))
+        if len(bucket) == 0:
+            del self._buckets[key]
+
+        positions = self._by_type[type_name]
+        positions.discard((x, y))
+        if len(positions) == 0:
+            del self._by_type[type_name]
+
+        self._count -= 1
+
+        return item
+
+    def clear(self):
+        self._buckets.clear()
+        self._by_type.clear()
+        self._count = 0
+
+    def get(self, x: int, y: int):
+        """Return the item at (x,y) or None"""
+
+        bucket = self._buckets.get(self._bucket_key(x, y))
+        if bucket is None:
+            return None
+
+        entry = bucket.get((x, y))
+        return entry[0] if entry is not None else None
+
+    def in_rect(self, x: int, y: int, width: int, height: int):
+        """Return a list of ((x,y), item) for the items in the rectangle with its top left at (x,y)"""
+
+        x1 = x + width
+        y1 = y + height
+
+        found = []
+        for bx in range(x // self.bucket_size, (x1 - 1) // self.bucket_size + 1):
+            for by in range(y // self.bucket_size, (y1 - 1) // self.bucket_size + 1):
+                bucket = self._buckets.get((bx, by))
+                if bucket is None:
+                    continue
+
+                # Buckets that are completely inside the rectangle don't need each position checking
+                if x <= bx * self.bucket_size and (bx + 1) * self.bucket_size <= x1 and \
+                        y <= by * self.bucket_size and (by + 1) * self.bucket_size <= y1:
+                    found.extend((position, item) for position, (item, type_name) in bucket.items())
+                else:
+                    found.extend(((ix, iy), item) for (ix, iy), (item, type_name) in bucket.items()
+                                 if x <= ix < x1 and y <= iy < y1)
+
+        return found
+
+    def in_range(self, x: int, y: int, radius: int):
+        """Return a list of ((x,y), item) for the items that are radius hexagon steps or less from (x,y)"""
+
+        # A hexagon step changes x and y by at most 1 so everything in range is inside this square
+        candidates = self.in_rect(x - radius, y - radius, radius * 2 + 1, radius * 2 + 1)
+
+        if len(candidates) == 0:
+            return candidates
+
+        positions = numpy.array([position for position, item in candidates])
+        is_in_range = HexagonMaths.distance(x, y, positions[:, 0], positions[:, 1]) <= radius
+
+        return [candidate for candidate, in_range in zip(candidates, is_in_range.tolist()) if in_range is True]
+
+    def by_type(self, type_name: str):
+        """Return a list of the positions of the items of a type"""
+        return list(self._by_type.get(type_name, ()))
+
+    def type_counts(self):
+        """Return a dictionary of how many items there are of each type"""
+        return {type_name: len(positions) for type_name, positions in self._by_type.items()}
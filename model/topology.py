@@ -0,0 +1,226 @@
+'''
+    This module contains numpy based generators for WorldMap altitude models:
+    - TopologyGenerator - builds slope and altitude fields and smooths them using array operations
+    - NoiseTopologyGenerator - builds seamless altitudes for any rectangle of a map so big maps can be chunked
+'''
+
+import numpy
+
+
+class TopologyGenerator:
+    """
+    Build a random map of altitudes using the same multi-pass algorithm as WorldMap but with numpy arrays.
+
+    Pass 1 builds east and south slopes as clipped random walks and then the altitudes, which depend on the
+    north and west neighbours, a whole anti-diagonal at a time. Pass 2 averages each point with its hexagon
+    neighbours and pass 3 shifts the altitudes to create a floor. Results are repeatable for a given seed.
+    """
+
+    def __init__(self, width: int, height: int, seed: int = None,
+                 min_altitude: float = 0.0, max_altitude: float = 10.0,
+                 max_slope: float = 1.5, max_slope_delta: float = 3.0,
+                 min_altitude_clip_factor: float = -1.0):
+
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.min_altitude = min_altitude
+        self.max_altitude = max_altitude
+        self.max_slope = max_slope
+        self.min_slope = max_slope * -1.0
+        self.max_slope_delta = max_slope_delta
+        self.min_altitude_clip_factor = min_altitude_clip_factor
+
+    def generate(self):
+        """Return a (width, height) array of altitudes indexed [x][y]"""
+
+        rng = numpy.random.default_rng(self.seed)
+
+        altitudes = self.generate_altitudes(rng)
+        altitudes = TopologyGenerator.smooth(altitudes)
+
+        # Pass 3: shift altitudes to create floors in the topology at level 0
+        threshold = altitudes.mean() + (altitudes.std() * self.min_altitude_clip_factor)
+        altitudes[altitudes != 0] -= threshold
+
+        return altitudes
+
+    def generate_altitudes(self, rng):
+        """Pass 1: generate slopes and altitudes"""
+
+        width = self.width
+        height = self.height
+
+        # Random north and west edges used for the first row and column
+        north_altitude = rng.uniform(self.min_altitude, self.max_altitude, width)
+        north_slope = rng.uniform(self.min_slope, self.max_slope, width)
+        west_altitude = rng.uniform(self.min_altitude, self.max_altitude, height)
+        west_slope = rng.uniform(self.min_slope, self.max_slope, height)
+
+        # Random slope changes for every point
+        east_delta = (rng.random((width, height)) * self.max_slope_delta) - self.max_slope_delta / 2
+        south_delta = (rng.random((width, height)) * self.max_slope_delta) - self.max_slope_delta / 2
+
+        # East slopes are a clipped random walk along each row...
+        east_slopes = numpy.empty((width, height))
+        previous = west_slope
+        for x in range(0, width):
+            previous = numpy.clip(previous + east_delta[x], self.min_slope, self.max_slope)
+            east_slopes[x] = previous
+
+        # ...and south slopes are a clipped random walk down each column
+        south_slopes = numpy.empty((width, height))
+        previous = north_slope
+        for y in range(0, height):
+            previous = numpy.clip(previous + south_delta[:, y], self.min_slope, self.max_slope)
+            south_slopes[:, y] = previous
+
+        # Altitude plus slope arriving from the north (column 0 is the north edge)...
+        from_north = numpy.empty((width, height + 1))
+        from_north[:, 0] = north_altitude + north_slope
+
+        # ...and from the west (row 0 is the west edge)
+        from_west = numpy.empty((width + 1, height))
+        from_west[0, :] = west_altitude + west_slope
+
+        # Every point on an anti-diagonal only depends on points on the previous anti-diagonal
+        altitudes = numpy.empty((width, height))
+        for k in range(0, width + height - 1):
+            xs = numpy.arange(max(0, k - height + 1), min(k, width - 1) + 1)
+            ys = k - xs
+
+            a = (from_north[xs, ys] + from_west[xs, ys]) / 2
+            a = numpy.clip(a, self.min_altitude, self.max_altitude)
+
+            altitudes[xs, ys] = a
+            from_north[xs, ys + 1] = a + south_slopes[xs, ys]
+            from_west[xs + 1, ys] = a + east_slopes[xs, ys]
+
+        return altitudes
+
+    @staticmethod
+    def smooth(altitudes):
+        """Pass 2: average each point with its hexagon neighbours that are on the map"""
+
+        width, height = altitudes.shape
+
+        # Pad the altitudes and a mask of valid points with a border of zeros
+        padded = numpy.zeros((width + 2, height + 2))
+        padded[1:-1, 1:-1] = altitudes
+        mask = numpy.zeros((width + 2, height + 2))
+        mask[1:-1, 1:-1] = 1
+
+        def shifted(a, dx, dy):
+            return a[1 + dx:width + 1 + dx, 1 + dy:height + 1 + dy]
+
+        total = altitudes.copy()
+        points = numpy.ones((width, height))
+
+        # N, S, E and W neighbours are the same for all columns
+        for dx, dy in ((0, -1), (0, 1), (1, 0), (-1, 0)):
+            total += shifted(padded, dx, dy)
+            points += shifted(mask, dx, dy)
+
+        # Even columns have neighbours to the north east and north west...
+        for dx, dy in ((1, -1), (-1, -1)):
+            total[0::2] += shifted(padded, dx, dy)[0::2]
+            points[0::2] += shifted(mask, dx, dy)[0::2]
+
+        # ...and odd columns to the south east and south west
+        for dx, dy in ((1, 1), (-1, 1)):
+            total[1::2] += shifted(padded, dx, dy)[1::2]
+            points[1::2] += shifted(mask, dx, dy)[1::2]
+
+        return total / points
+
+
+class NoiseTopologyGenerator:
+    """
+    Build altitudes for any rectangle of an unbounded map from seeded lattice (value) noise.
+
+    Every lattice point gets its value from a hash of its coordinates and the seed so any rectangle can be built
+    on its own and neighbouring rectangles join up without seams. The hexagon smoothing pass is run over a one
+    point halo so that points on the edge of a rectangle are smoothed with their real neighbours.
+    """
+
+    def __init__(self, seed: int = None, min_altitude: float = 0.0, max_altitude: float = 10.0,
+                 scale: float = 24.0, octaves: int = 4, persistence: float = 0.5):
+
+        if seed is None:
+            seed = int(numpy.random.default_rng().integers(0, 2 ** 32))
+
+        self.seed = seed
+        self.min_altitude = min_altitude
+        self.max_altitude = max_altitude
+        self.scale = scale
+        self.octaves = octaves
+        self.persistence = persistence
+
+    def generate(self, x: int, y: int, width: int, height: int):
+        """Return a (width, height) array of altitudes for the rectangle with its top left at (x,y)"""
+
+        xs = numpy.arange(x - 1, x + width + 1)
+        ys = numpy.arange(y - 1, y + height + 1)
+
+        altitudes = self.noise(xs, ys) * (self.max_altitude - self.min_altitude) + self.min_altitude
+        altitudes = TopologyGenerator.smooth(altitudes)
+
+        return altitudes[1:-1, 1:-1]
+
+    def noise(self, xs, ys):
+        """Return a (len(xs), len(ys)) array of noise values in the range 0 to 1"""
+
+        # Odd columns are offset by half a point so the noise follows the hexagon layout
+        fx = xs[:, None] / self.scale
+        fy = (ys[None, :] + (xs[:, None] % 2) * 0.5) / self.scale
+
+        total = numpy.zeros((len(xs), len(ys)))
+        amplitude = 1.0
+        amplitudes = 0.0
+
+        for octave in range(0, self.octaves):
+            frequency = 2 ** octave
+            total += self._octave(fx * frequency, fy * frequency, octave) * amplitude
+            amplitudes += amplitude
+            amplitude *= self.persistence
+
+        return total / amplitudes
+
+    def _octave(self, fx, fy, octave: int):
+
+        ix = numpy.floor(fx).astype(numpy.int64)
+        iy = numpy.floor(fy).astype(numpy.int64)
+
+        # Smooth step between the lattice points
+        tx = fx - ix
+        ty = fy - iy
+        tx = tx * tx * (3 - 2 * tx)
+        ty = ty * ty * (3 - 2 * ty)
+
+        v00 = self._lattice(ix, iy, octave)
+        v10 = self._lattice(ix + 1, iy, octave)
+        v01 = self._lattice(ix, iy + 1, octave)
+        v11 = self._lattice(ix + 1, iy + 1, octave)
+
+        top = v00 + (v10 - v00) * tx
+        bottom = v01 + (v11 - v01) * tx
+
+        return top + (bottom - top) * ty
+
+    def _lattice(self, ix, iy, octave: int):
+        """Hash lattice coordinates to repeatable random values in the range 0 to 1"""
+
+        ix, iy = numpy.broadcast_arrays(ix, iy)
+
+        h = ix.astype(numpy.uint64) * numpy.uint64(0x9E3779B97F4A7C15)
+        h ^= iy.astype(numpy.uint64) * numpy.uint64(0xC2B2AE3D27D4EB4F)
+        h ^= numpy.uint64((self.seed * 31 + octave) & 0xFFFFFFFFFFFFFFFF)
+
+        # splitmix64 finaliser
+        h ^= h >> numpy.uint64(30)
+        h *= numpy.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> numpy.uint64(27)
+        h *= numpy.uint64(0x94D049BB133111EB)
+        h ^= h >> numpy.uint64(31)
+
+        return (h >> numpy.uint64(11)).astype(numpy.float64) / float(2 ** 53)
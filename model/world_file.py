@@ -0,0 +1,247 @@
+'''
+    This module contains the binary save format for WorldMaps.
+
+    A world file is a small fixed header, a JSON description of the world and then raw blocks of array data:
+    - the altitude model
+    - a tile code map for each theme
+
+    Each block starts on an ALIGNMENT byte boundary so that it can be opened with numpy.memmap. Loading a
+    world only reads the header and only the parts of the blocks that are used get paged in from disk.
+'''
+
+import json
+import logging
+import os
+import pickle
+import struct
+import sys
+
+import numpy
+
+from .building_blocks import AltitudeStatistics
+from .building_blocks import WorldMap
+
+MAGIC = b"KWMAP\x00"
+VERSION = 1
+HEADER_FORMAT = "<6sHI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ALIGNMENT = 64
+FILE_EXTENSION = ".kmap"
+
+BLOCK_ALTITUDES = "altitudes"
+BLOCK_THEME_PREFIX = "theme:"
+
+
+class WorldFileError(ValueError):
+    """Raised when a file is not a world file that can be loaded"""
+    pass
+
+
+def _align(offset: int):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_world(world: WorldMap, file_name: str):
+    """Save a WorldMap to a world file"""
+    write_world(take_world_data(world), file_name)
+
+
+def take_world_data(world: WorldMap, copy_arrays: bool = False):
+    """
+    Return a dictionary of the header and the array blocks of a world file for a WorldMap.
+    If copy_arrays then the arrays are copies so that they can be written while the map is being changed.
+    """
+
+    if world.topo_model_pass2 is None:
+        raise Exception("World map {0} does not have an altitude model that can be saved!".format(world.name))
+
+    get_array = numpy.array if copy_arrays is True else numpy.asarray
+
+    blocks = [(BLOCK_ALTITUDES, get_array(world.topo_model_pass2, dtype="<f8"))]
+    with world._themes_lock:
+        theme_maps = dict(world.maps_by_theme)
+
+    # Every theme is saved - the ones that are not in the theme cache are built without adding them to it
+    for theme in WorldMap.topo_zone_themes.keys():
+        map = theme_maps.get(theme)
+        if map is None:
+            map, tile_counts = world.classify_altitudes(theme)
+        blocks.append((BLOCK_THEME_PREFIX + theme, get_array(map, dtype=WorldMap.TILE_CODE_TYPE)))
+
+    stats = world.altitude_stats
+
+    header = {
+        "name": world.name,
+        "width": world.width,
+        "height": world.height,
+        "seed": world.seed,
+        "summit": list(world.summit),
+        "abyss": list(world.abyss),
+        "tiles": list(WorldMap.TILES),
+        "stats": {"mean": stats.mean, "variance": stats.variance, "min": stats.min, "max": stats.max},
+        "zone_stats": list(world.zone_stats),
+        "blocks": []
+    }
+
+    return {"header": header, "blocks": blocks}
+
+
+def write_world(world_data: dict, file_name: str):
+    """Write the header and array blocks from take_world_data() to a world file"""
+
+    header = dict(world_data["header"])
+    blocks = world_data["blocks"]
+
+    # Block offsets are relative to the start of the data which is aligned after the header
+    header["blocks"] = []
+    offset = 0
+    for name, array in blocks:
+        array = numpy.ascontiguousarray(array)
+        header["blocks"].append({"name": name,
+                                 "dtype": array.dtype.str,
+                                 "shape": list(array.shape),
+                                 "offset": offset})
+        offset = _align(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(HEADER_SIZE + len(header_bytes))
+
+    # Write to a temporary file and then swap it in so a failed save doesn't lose the last one
+    temp_file_name = file_name + ".tmp"
+
+    with open(temp_file_name, "wb") as world_file:
+        world_file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(header_bytes)))
+        world_file.write(header_bytes)
+
+        for (name, array), block in zip(blocks, header["blocks"]):
+            world_file.seek(data_start + block["offset"])
+            world_file.write(numpy.ascontiguousarray(array).tobytes())
+
+    os.replace(temp_file_name, file_name)
+
+    logging.info("write_world(): Saved %s to %s", header["name"], file_name)
+
+
+def read_header(file_name: str):
+    """Read the header of a world file and return it with the file offset of the start of the data"""
+
+    with open(file_name, "rb") as world_file:
+        fixed = world_file.read(HEADER_SIZE)
+
+        if len(fixed) < HEADER_SIZE:
+            raise WorldFileError("{0} is not a world file!".format(file_name))
+
+        magic, version, header_length = struct.unpack(HEADER_FORMAT, fixed)
+
+        if magic != MAGIC:
+            raise WorldFileError("{0} is not a world file!".format(file_name))
+
+        if version > VERSION:
+            raise WorldFileError("{0} is world file version {1} but only up to version {2} can be loaded!".format(
+                file_name, version, VERSION))
+
+        try:
+            header = json.loads(world_file.read(header_length).decode("utf-8"))
+        except ValueError as err:
+            raise WorldFileError("{0} has a damaged header: {1}".format(file_name, str(err))) from err
+
+    return header, _align(HEADER_SIZE + header_length)
+
+
+def load_world(file_name: str, writeable: bool = True):
+    """
+    Load a WorldMap from a world file with its arrays memory mapped from the file.
+    If writeable then changes to the map are kept in memory and never written back to the file.
+    """
+
+    header, data_start = read_header(file_name)
+
+    mode = "c" if writeable is True else "r"
+    file_size = os.path.getsize(file_name)
+
+    # A missing key or a bad value in the header means the file is damaged
+    try:
+        arrays = {}
+        for block in header["blocks"]:
+            dtype = numpy.dtype(block["dtype"])
+            shape = tuple(block["shape"])
+            offset = data_start + block["offset"]
+
+            # A truncated file doesn't have all of the blocks
+            if offset < data_start or offset + dtype.itemsize * int(numpy.prod(shape)) > file_size:
+                raise WorldFileError("{0} is too short for block {1}!".format(file_name, block["name"]))
+
+            arrays[block["name"]] = numpy.memmap(file_name,
+                                                 dtype=dtype,
+                                                 mode=mode,
+                                                 offset=offset,
+                                                 shape=shape)
+
+        if arrays[BLOCK_ALTITUDES].shape != (header["width"], header["height"]):
+            raise WorldFileError("{0} has altitudes that are not the size of the world!".format(file_name))
+
+        world = WorldMap(header["name"], header["width"], header["height"], header["seed"])
+        world.set_topology(arrays[BLOCK_ALTITUDES])
+        world.summit = tuple(header["summit"])
+        world.abyss = tuple(header["abyss"])
+
+        # Use the saved statistics so we don't have to read all of the altitudes
+        stats = header["stats"]
+        world._altitude_stats = AltitudeStatistics.from_values(world.topo_model_pass2,
+                                                               stats["mean"],
+                                                               stats["variance"],
+                                                               stats["min"],
+                                                               stats["max"])
+
+        # Files saved before the zone statistics were pinned use the saved statistics
+        if "zone_stats" in header.keys():
+            world._zone_stats = tuple(header["zone_stats"])
+
+        # If the tiles have changed since the file was saved then translate the saved tile codes
+        lookup = None
+        if header["tiles"] != list(WorldMap.TILES):
+            lookup = numpy.array([WorldMap.TILE_CODES[tile] for tile in header["tiles"]],
+                                 dtype=WorldMap.TILE_CODE_TYPE)
+
+    except WorldFileError:
+        raise
+    except (KeyError, TypeError, ValueError) as err:
+        raise WorldFileError("{0} has a damaged header: {1}".format(file_name, str(err))) from err
+
+    for name, array in arrays.items():
+        if name.startswith(BLOCK_THEME_PREFIX):
+            if lookup is not None:
+                array = lookup[array]
+            world._cache_theme_map(name[len(BLOCK_THEME_PREFIX):], array, world._topology_version)
+
+    logging.info("load_world(): Loaded %s from %s", world.name, file_name)
+
+    return world
+
+
+def convert_world_pickle(pickle_file_name: str, file_name: str = None):
+    """Convert a pickled WorldMap .world file to a world file and return the new file name"""
+
+    if file_name is None:
+        file_name = os.path.splitext(pickle_file_name)[0] + FILE_EXTENSION
+
+    try:
+        with open(pickle_file_name, "rb") as pickle_file:
+            world = pickle.load(pickle_file)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError) as err:
+        raise WorldFileError("{0} is not a pickled world: {1}".format(pickle_file_name, str(err))) from err
+
+    if isinstance(world, WorldMap) is False:
+        raise WorldFileError("{0} is not a pickled world!".format(pickle_file_name))
+
+    save_world(world, file_name)
+
+    print("Converted {0} to {1}".format(pickle_file_name, file_name))
+
+    return file_name
+
+
+# Convert the pickled world files named on the command line e.g. python -m model.world_file "Kingdom 2.world"
+if __name__ == "__main__":
+    for pickle_file_name in sys.argv[1:]:
+        convert_world_pickle(pickle_file_name)
@@ -710,6 +710,12 @@ class GameView(BaseView):
 
         highlight2_image.set_alpha(150)
 
+        # Get all of the creations in the view port in one go
+        creations_in_view = dict(self.game.get_creations_in_rect(self.view_origin_x,
+                                                                 self.view_origin_y,
+                                                                 self.view_tiles_width + 2,
+                                                                 self.view_tiles_height))
+
         # Loop through the number of row that the view is oging to display
         for tile_y in range(0, self.view_tiles_height):
 
@@ -786,7 +792,7 @@ class GameView(BaseView):
                                   centre=True)
 
                     # See if a creation has been placed at this location...
-                    creation = self.game.get_creation(map_x, map_y)
+                    creation = creations_in_view.get((map_x, map_y))
                     if creation is not None:
 
                         # Get the image for the creation based on its name
@@ -906,10 +912,9 @@ class InventoryView(BaseView):
 
         inv = self.game.inventory
 
-        for i in inv.resources.keys():
+        for i, item_count in inv.resources.items():
 
             if i.category == "Material":
-                item_count = inv.resources[i]
                 y += 16
                 msg = "{0} : {1}".format(i.name, item_count)
                 draw_text(self.surface,